@@ -0,0 +1,416 @@
+"""
+    Websocket subscriptions to the accounts of the wallets.
+
+    Every wallet that has an owner is subscribed with accountSubscribe (SOL balance) and with programSubscribe
+    to the token program filtered by the owner field (all token accounts of the wallet, including new ones).
+    Only Token-2022 accounts are subscribed: the balance snapshots and the token keyboards show Token-2022 tokens
+    only (bot/portfolio.py), so changes of classic SPL Token accounts are not pushed and would not be shown.
+    The subscriptions are sharded over at most ACCOUNT_SUBSCRIPTIONS_MAX_CONNECTIONS websocket connections,
+    ACCOUNT_SUBSCRIPTIONS_PER_CONNECTION subscriptions each, and are sent again after a reconnect.
+    A SOL balance change is written to the balance snapshot, token account changes are collected for
+    ACCOUNT_CHANGE_DEBOUNCE seconds and the snapshots of the changed wallets are refreshed with one batch.
+    With NOTIFY_INCOMING_TRANSFERS the owners are notified when a balance of their wallet grows.
+"""
+import asyncio
+import traceback
+from decimal import Decimal
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+
+from aiogram import Bot
+from solana.rpc.core import _COMMITMENT_TO_SOLDERS
+from solana.rpc.websocket_api import SolanaWsClientProtocol, SubscriptionError, connect
+from solders.account_decoder import UiAccountEncoding, UiDataSliceConfig
+from solders.errors import SerdeJSONError
+from solders.pubkey import Pubkey
+from solders.rpc.config import RpcAccountInfoConfig, RpcProgramAccountsConfig
+from solders.rpc.filter import Memcmp
+from solders.rpc.requests import AccountSubscribe, AccountUnsubscribe, ProgramSubscribe, ProgramUnsubscribe
+from solders.rpc.responses import AccountNotification, ProgramNotification, SubscriptionResult
+from spl.token.constants import TOKEN_2022_PROGRAM_ID
+
+from bot.config import (ACCOUNT_CHANGE_DEBOUNCE, ACCOUNT_SUBSCRIPTIONS_ENABLED,
+                        ACCOUNT_SUBSCRIPTIONS_MAX_CONNECTIONS,
+                        ACCOUNT_SUBSCRIPTIONS_PER_CONNECTION,
+                        ACCOUNT_SUBSCRIPTIONS_SYNC_INTERVAL, CONFIRMATION_COMMITMENT,
+                        LAMPORT_TO_SOL_RATIO, NOTIFY_INCOMING_TRANSFERS, SOLANA_WS_URL)
+from bot.portfolio import refresh_portfolios
+from bot.token_account_cache import invalidate_token_accounts
+from bot.utils import (get_owned_wallet_addresses, get_translation, get_wallet_balances,
+                       get_wallet_owners, update_wallet_lamports)
+from logger_config import logger
+from web.applications.wallet.models import WalletBalance
+
+# Программы токенов, на аккаунты которых подписываются кошельки (те же, что в снимках балансов).
+# TOKEN_PROGRAM_ID добавляется сюда вместе с токенами классической программы в снимках балансов.
+SUBSCRIBED_TOKEN_PROGRAMS = (TOKEN_2022_PROGRAM_ID,)
+# Смещение адреса владельца в данных токен-аккаунта
+TOKEN_ACCOUNT_OWNER_OFFSET = 32
+# Сколько подписок отправлять одним пакетом после подключения
+SUBSCRIBE_BATCH_SIZE = 100
+# Задержка перед повторным подключением websocket в секундах
+RECONNECT_DELAY = 5
+
+
+class Subscription(NamedTuple):
+    """
+        Subscription of a wallet.
+
+        Attributes:
+            wallet_address (str): Wallet address.
+            program_id (str | None): Token program of the programSubscribe, None - accountSubscribe of the wallet.
+    """
+    wallet_address: str
+    program_id: Optional[str] = None
+
+
+class SubscriptionConnection:
+    """
+        One websocket connection with its share of the subscriptions.
+
+        Attributes:
+            ws_url (str): Websocket url of the RPC node.
+            number (int): Connection number for the logs.
+            subscriptions (Set[Subscription]): Subscriptions held by the connection.
+    """
+
+    def __init__(self, ws_url: str, number: int, manager: 'AccountSubscriptionManager') -> None:
+        self.ws_url = ws_url
+        self.number = number
+        self.subscriptions: Set[Subscription] = set()
+        self._manager = manager
+        # id запроса -> подписка, id подписки -> подписка
+        self._requests: Dict[int, Subscription] = {}
+        self._subscription_ids: Dict[int, Subscription] = {}
+        self._websocket: Optional[SolanaWsClientProtocol] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _request(self, websocket: SolanaWsClientProtocol, subscription: Subscription):
+        request_id = websocket.increment_counter_and_get_id()
+        self._requests[request_id] = subscription
+        commitment = _COMMITMENT_TO_SOLDERS[CONFIRMATION_COMMITMENT]
+        if subscription.program_id is None:
+            config = RpcAccountInfoConfig(encoding=UiAccountEncoding.Base64, commitment=commitment)
+            return AccountSubscribe(Pubkey.from_string(subscription.wallet_address), config, request_id)
+        # данные аккаунта не нужны, только факт изменения токен-аккаунта кошелька
+        config = RpcProgramAccountsConfig(
+            RpcAccountInfoConfig(
+                encoding=UiAccountEncoding.Base64,
+                commitment=commitment,
+                data_slice=UiDataSliceConfig(offset=0, length=0),
+            ),
+            # адрес передается строкой: filter bytes кодируются в base58
+            [Memcmp(TOKEN_ACCOUNT_OWNER_OFFSET, subscription.wallet_address)],
+        )
+        return ProgramSubscribe(Pubkey.from_string(subscription.program_id), config, request_id)
+
+    async def _send_subscriptions(self, subscriptions: List[Subscription]) -> None:
+        websocket = self._websocket
+        if websocket is None:
+            # подписки будут отправлены после подключения
+            return
+        for i in range(0, len(subscriptions), SUBSCRIBE_BATCH_SIZE):
+            requests = [self._request(websocket, subscription) for subscription in subscriptions[i:i + SUBSCRIBE_BATCH_SIZE]]
+            try:
+                await websocket.send_data(requests)
+            except Exception as error:
+                logger.warning(f"Failed to send {len(requests)} account subscriptions: {error!r}")
+                return
+
+    async def subscribe(self, subscriptions: List[Subscription]) -> None:
+        self.subscriptions.update(subscriptions)
+        await self._send_subscriptions(subscriptions)
+
+    async def unsubscribe(self, subscriptions: List[Subscription]) -> None:
+        self.subscriptions.difference_update(subscriptions)
+        websocket = self._websocket
+        subscription_ids = [
+            subscription_id for subscription_id, subscription in self._subscription_ids.items()
+            if subscription in subscriptions
+        ]
+        for subscription_id in subscription_ids:
+            subscription = self._subscription_ids.pop(subscription_id)
+            if websocket is None:
+                continue
+            request_id = websocket.increment_counter_and_get_id()
+            request = AccountUnsubscribe(subscription_id, request_id) if subscription.program_id is None \
+                else ProgramUnsubscribe(subscription_id, request_id)
+            try:
+                await websocket.send_data(request)
+            except Exception as error:
+                logger.debug(f"Failed to unsubscribe from {subscription}: {error!r}")
+
+    def _handle_message(self, message: Any) -> None:
+        if isinstance(message, SubscriptionResult):
+            subscription = self._requests.pop(message.id, None)
+            if subscription is not None:
+                self._subscription_ids[message.result] = subscription
+                if subscription not in self.subscriptions:
+                    # кошелек удалили, пока подписка создавалась
+                    self._manager._create_task(self.unsubscribe([subscription]))
+        elif isinstance(message, AccountNotification):
+            subscription = self._subscription_ids.get(message.subscription)
+            if subscription is not None:
+                self._manager.on_lamports_change(
+                    subscription.wallet_address, message.result.value.lamports, message.result.context.slot
+                )
+        elif isinstance(message, ProgramNotification):
+            subscription = self._subscription_ids.get(message.subscription)
+            if subscription is not None:
+                self._manager.on_token_accounts_change(subscription.wallet_address, message.result.context.slot)
+
+    async def _run(self) -> None:
+        connected_before = False
+        while True:
+            try:
+                async with connect(self.ws_url) as websocket:
+                    self._websocket = websocket
+                    logger.info(f"Account subscriptions websocket {self.number} connected, "
+                                f"{len(self.subscriptions)} subscriptions")
+                    if connected_before:
+                        # изменения, пропущенные без соединения, получаем обновлением снимков
+                        for subscription in self.subscriptions:
+                            self._manager.on_token_accounts_change(subscription.wallet_address)
+                    connected_before = True
+                    await self._send_subscriptions(list(self.subscriptions))
+
+                    while True:
+                        try:
+                            messages = await websocket.recv()
+                        except SubscriptionError as error:
+                            logger.warning(f"Account subscription failed: {error}")
+                            continue
+                        except SerdeJSONError:
+                            # solders не разбирает ответ на отписку ({"result": true}), сообщение пропускается
+                            continue
+                        for message in messages:
+                            self._handle_message(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                logger.warning(f"Account subscriptions websocket {self.number} disconnected: {error!r}. "
+                               f"Reconnect in {RECONNECT_DELAY}s.")
+            finally:
+                self._websocket = None
+                self._requests.clear()
+                self._subscription_ids.clear()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+class AccountSubscriptionManager:
+    """
+        Holds the account subscriptions of all wallets over a pool of websocket connections.
+
+        Attributes:
+            ws_url (str): Websocket url of the RPC node.
+            per_connection (int): Maximum number of subscriptions of one connection.
+            max_connections (int): Maximum number of connections.
+            bot (Bot | None): Bot that notifies the owners about incoming transfers.
+    """
+
+    def __init__(self, ws_url: str, per_connection: int, max_connections: int) -> None:
+        self.ws_url = ws_url
+        self.per_connection = per_connection
+        self.max_connections = max_connections
+        self.bot: Optional[Bot] = None
+        self._connections: List[SubscriptionConnection] = []
+        # все подписки кошелька держит одно соединение
+        self._wallet_connections: Dict[str, SubscriptionConnection] = {}
+        self._changed_wallets: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._sync_task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def subscription_count(self) -> int:
+        return sum(len(connection.subscriptions) for connection in self._connections)
+
+    def _get_connection(self, number_subscriptions: int) -> Optional[SubscriptionConnection]:
+        for connection in self._connections:
+            if len(connection.subscriptions) + number_subscriptions <= self.per_connection:
+                return connection
+        if len(self._connections) >= self.max_connections:
+            return None
+        connection = SubscriptionConnection(self.ws_url, len(self._connections) + 1, self)
+        self._connections.append(connection)
+        connection.start()
+        return connection
+
+    async def track(self, wallet_address: str) -> bool:
+        """
+            Subscribes to the SOL balance and the token accounts of the wallet.
+
+            Args:
+                wallet_address (str): Wallet address.
+
+            Returns:
+                bool: False if all connections are full and the wallet is not subscribed.
+        """
+        if wallet_address in self._wallet_connections:
+            return True
+        subscriptions = [Subscription(wallet_address)] + [
+            Subscription(wallet_address, str(program_id)) for program_id in SUBSCRIBED_TOKEN_PROGRAMS
+        ]
+        connection = self._get_connection(len(subscriptions))
+        if connection is None:
+            logger.warning(f"Account subscriptions limit reached ({self.max_connections} connections "
+                           f"x {self.per_connection}), wallet {wallet_address} is not subscribed")
+            return False
+        self._wallet_connections[wallet_address] = connection
+        await connection.subscribe(subscriptions)
+        return True
+
+    async def untrack(self, wallet_address: str) -> None:
+        connection = self._wallet_connections.pop(wallet_address, None)
+        if connection is not None:
+            await connection.unsubscribe([
+                subscription for subscription in connection.subscriptions if subscription.wallet_address == wallet_address
+            ])
+
+    async def sync(self) -> None:
+        """
+            Subscribes the new wallets that have an owner and unsubscribes the deleted ones.
+
+            Returns:
+                None
+        """
+        wallet_addresses = await get_owned_wallet_addresses()
+        for wallet_address in set(self._wallet_connections) - set(wallet_addresses):
+            await self.untrack(wallet_address)
+        for wallet_address in wallet_addresses:
+            if not await self.track(wallet_address):
+                break
+
+    def _create_task(self, coroutine) -> None:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def on_lamports_change(self, wallet_address: str, lamports: int, slot: int) -> None:
+        self._create_task(self._update_lamports(wallet_address, lamports, slot))
+
+    def on_token_accounts_change(self, wallet_address: str, slot: Optional[int] = None) -> None:
+        # кэшированные токен-аккаунты кошелька устарели, обновление снимка запросит их заново
+        invalidate_token_accounts(wallet_address, slot)
+        self._changed_wallets.add(wallet_address)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_changes())
+
+    async def _update_lamports(self, wallet_address: str, lamports: int, slot: int) -> None:
+        try:
+            wallet_balance = (await get_wallet_balances([wallet_address])).get(wallet_address)
+            if wallet_balance is None:
+                # снимка еще нет, он создается обновлением
+                self.on_token_accounts_change(wallet_address)
+                return
+            if await update_wallet_lamports(wallet_balance, lamports, slot) and lamports > wallet_balance.lamports:
+                amount = Decimal(lamports - wallet_balance.lamports) / LAMPORT_TO_SOL_RATIO
+                await self._notify(wallet_balance, f'{amount:f}', 'SOL')
+        except Exception as error:
+            detailed_error_traceback = traceback.format_exc()
+            logger.error(f"Failed to update balance of wallet {wallet_address}: {error}\n{detailed_error_traceback}")
+
+    async def _flush_changes(self) -> None:
+        # изменения нескольких токен-аккаунтов одной транзакции обновляют снимок один раз
+        await asyncio.sleep(ACCOUNT_CHANGE_DEBOUNCE)
+        wallet_addresses = list(self._changed_wallets)
+        self._changed_wallets.clear()
+        # изменения во время обновления собираются следующей задачей
+        self._flush_task = None
+        try:
+            previous = await get_wallet_balances(wallet_addresses)
+            snapshots = await refresh_portfolios(wallet_addresses)
+            for wallet_address, wallet_balance in snapshots.items():
+                if wallet_address in previous:
+                    await self._notify_token_changes(previous[wallet_address], wallet_balance)
+        except Exception as error:
+            detailed_error_traceback = traceback.format_exc()
+            logger.error(f"Failed to refresh changed wallets: {error}\n{detailed_error_traceback}")
+
+    async def _notify_token_changes(self, previous: WalletBalance, wallet_balance: WalletBalance) -> None:
+        if previous.tokens_updated is None or wallet_balance.tokens_updated is None:
+            return
+        previous_amounts = {token['mint']: Decimal(str(token['amount'] or 0)) for token in previous.tokens}
+        for token in wallet_balance.tokens:
+            amount = Decimal(str(token['amount'] or 0)) - previous_amounts.get(token['mint'], Decimal(0))
+            if amount > 0:
+                await self._notify(wallet_balance, f'{amount:f}', token['symbol'] or token['mint'])
+
+    async def _notify(self, wallet_balance: WalletBalance, amount: str, token: str) -> None:
+        if not NOTIFY_INCOMING_TRANSFERS or self.bot is None:
+            return
+        wallet = wallet_balance.wallet
+        for user in await get_wallet_owners(wallet.wallet_address):
+            TRANSLATION = await get_translation(lang=user.telegram_language)
+            try:
+                await self.bot.send_message(
+                    chat_id=user.telegram_id,
+                    text=TRANSLATION["incoming_transfer"].format(
+                        amount=amount, token=token, name=wallet.name, address=wallet.wallet_address
+                    ),
+                )
+            except Exception as error:
+                # пользователь мог заблокировать бота
+                logger.warning(f"Failed to notify user {user.telegram_id} about incoming transfer: {error!r}")
+
+    async def _run_sync(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except Exception as error:
+                detailed_error_traceback = traceback.format_exc()
+                logger.error(f"Failed to sync account subscriptions: {error}\n{detailed_error_traceback}")
+            await asyncio.sleep(ACCOUNT_SUBSCRIPTIONS_SYNC_INTERVAL)
+
+    def start(self, bot: Optional[Bot] = None) -> None:
+        self.bot = bot
+        if self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._run_sync())
+
+    async def close(self) -> None:
+        tasks = [task for task in (self._sync_task, self._flush_task) if task is not None] + list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*[connection.close() for connection in self._connections])
+        self._sync_task = self._flush_task = None
+        self._connections = []
+        self._wallet_connections = {}
+
+
+account_subscription_manager = AccountSubscriptionManager(
+    SOLANA_WS_URL, ACCOUNT_SUBSCRIPTIONS_PER_CONNECTION, ACCOUNT_SUBSCRIPTIONS_MAX_CONNECTIONS
+)
+
+
+async def start_account_subscriptions(bot: Bot) -> None:
+    """
+        Subscribes to the accounts of the wallets. Registered as Dispatcher startup handler.
+
+        Args:
+            bot (Bot): The bot, passed by aiogram. Notifies the owners about incoming transfers.
+
+        Returns:
+            None
+    """
+    if ACCOUNT_SUBSCRIPTIONS_ENABLED:
+        account_subscription_manager.start(bot)
+
+
+async def close_account_subscriptions() -> None:
+    """
+        Closes the account subscription websockets. Registered as Dispatcher shutdown handler.
+
+        Returns:
+            None
+    """
+    await account_subscription_manager.close()
@@ -0,0 +1,126 @@
+"""
+    Background blockhash prefetcher.
+
+    A transaction must reference a recent blockhash, which stays valid until lastValidBlockHeight (~150 blocks).
+    The service refreshes the blockhash every BLOCKHASH_REFRESH_INTERVAL seconds, so transaction builders
+    get it without a round trip, and never hands out a blockhash older than BLOCKHASH_MAX_AGE.
+"""
+import asyncio
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Optional
+
+from solders.hash import Hash
+
+from bot.config import BLOCKHASH_MAX_AGE, BLOCKHASH_REFRESH_INTERVAL
+from bot.retry import call_rpc
+from logger_config import logger
+
+
+@dataclass(frozen=True)
+class RecentBlockhash:
+    """
+        Recent blockhash with its expiry.
+
+        Attributes:
+            blockhash (Hash): Recent blockhash.
+            last_valid_block_height (int): Last block height at which a transaction with the blockhash is accepted.
+            fetched_at (float): time.monotonic() when the blockhash was fetched.
+    """
+    blockhash: Hash
+    last_valid_block_height: int
+    fetched_at: float
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+
+_recent_blockhash: Optional[RecentBlockhash] = None
+# запрос blockhash, который уже выполняется - параллельные вызовы ждут его, а не отправляют свой
+_fetch_task: Optional[asyncio.Task] = None
+_refresh_task: Optional[asyncio.Task] = None
+
+
+async def _fetch_blockhash() -> RecentBlockhash:
+    global _recent_blockhash
+    response = await call_rpc(lambda client: client.get_latest_blockhash(), "get_latest_blockhash")
+    _recent_blockhash = RecentBlockhash(
+        blockhash=response.value.blockhash,
+        last_valid_block_height=response.value.last_valid_block_height,
+        fetched_at=time.monotonic(),
+    )
+    return _recent_blockhash
+
+
+async def refresh_blockhash() -> RecentBlockhash:
+    """
+        Fetches a new blockhash. Concurrent calls share one request.
+
+        Returns:
+            RecentBlockhash: The new blockhash.
+    """
+    global _fetch_task
+    if _fetch_task is None or _fetch_task.done():
+        _fetch_task = asyncio.create_task(_fetch_blockhash())
+    # shield: отмена одного ожидающего не отменяет общий запрос
+    return await asyncio.shield(_fetch_task)
+
+
+async def get_recent_blockhash() -> RecentBlockhash:
+    """
+        Returns a recent blockhash, from the cache if it is fresh.
+
+        Returns:
+            RecentBlockhash: Recent blockhash.
+    """
+    if _recent_blockhash is not None and _recent_blockhash.age < BLOCKHASH_MAX_AGE:
+        return _recent_blockhash
+    return await refresh_blockhash()
+
+
+def invalidate_blockhash() -> None:
+    """
+        Drops the cached blockhash, ex. after the node rejected it. The next call fetches a new one.
+
+        Returns:
+            None
+    """
+    global _recent_blockhash
+    _recent_blockhash = None
+
+
+async def _refresh_loop() -> None:
+    while True:
+        try:
+            await refresh_blockhash()
+        except Exception as error:
+            detailed_error_traceback = traceback.format_exc()
+            logger.error(f"Failed to refresh blockhash: {error}\n{detailed_error_traceback}")
+        await asyncio.sleep(BLOCKHASH_REFRESH_INTERVAL)
+
+
+async def start_blockhash_service() -> None:
+    """
+        Starts the background blockhash refresh. Registered as Dispatcher startup handler.
+
+        Returns:
+            None
+    """
+    global _refresh_task
+    if _refresh_task is None:
+        _refresh_task = asyncio.create_task(_refresh_loop())
+
+
+async def close_blockhash_service() -> None:
+    """
+        Stops the background blockhash refresh. Registered as Dispatcher shutdown handler.
+
+        Returns:
+            None
+    """
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        _refresh_task = None
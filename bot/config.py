@@ -1,5 +1,210 @@
+import os
+
 # SOLANA_NODE_URL = "https://api.testnet.solana.com"
-SOLANA_NODE_URL = "https://api.devnet.solana.com"
+# Список RPC узлов через запятую (bot/rpc_router.py), первый узел - основной.
+SOLANA_NODE_URLS = [
+    url.strip() for url in os.getenv('SOLANA_NODE_URLS', "https://api.devnet.solana.com").split(',') if url.strip()
+]
+SOLANA_NODE_URL = SOLANA_NODE_URLS[0]
 
 # Константа для определения соотношения между лампортами и SOL. 1 SOL = 10^9 лампортов.
 LAMPORT_TO_SOL_RATIO = 10 ** 9
+
+# Настройки пула соединений общего RPC клиента (bot/rpc_client.py).
+# Максимальное количество одновременных соединений с одним RPC узлом.
+RPC_MAX_CONNECTIONS = int(os.getenv('RPC_MAX_CONNECTIONS', 20))
+# Сколько соединений держать открытыми (keep-alive) между запросами.
+RPC_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('RPC_MAX_KEEPALIVE_CONNECTIONS', 10))
+# Через сколько секунд простоя закрывать keep-alive соединение.
+RPC_KEEPALIVE_EXPIRY = float(os.getenv('RPC_KEEPALIVE_EXPIRY', 60))
+# Использовать HTTP/2 (требуется пакет h2, иначе будет HTTP/1.1).
+RPC_HTTP2 = bool(int(os.getenv('RPC_HTTP2', 1)))
+
+# Кэш метаданных токенов (bot/token_metadata_cache.py).
+# Количество mint адресов, которые хранятся в памяти процесса.
+TOKEN_METADATA_CACHE_SIZE = int(os.getenv('TOKEN_METADATA_CACHE_SIZE', 1000))
+# Через сколько секунд запись в памяти перечитывается из таблицы Token.
+TOKEN_METADATA_CACHE_TTL = float(os.getenv('TOKEN_METADATA_CACHE_TTL', 60 * 60))
+# Через сколько секунд метаданные в таблице Token считаются устаревшими и запрашиваются заново.
+# 0 - метаданные никогда не устаревают (для большинства токенов они неизменны).
+TOKEN_METADATA_MAX_AGE = float(os.getenv('TOKEN_METADATA_MAX_AGE', 0))
+# Через сколько секунд повторно запрашивать метаданные токена, для которого они не были найдены.
+TOKEN_METADATA_EMPTY_MAX_AGE = float(os.getenv('TOKEN_METADATA_EMPTY_MAX_AGE', 60 * 60))
+
+# Загрузка off-chain метаданных токенов по uri (bot/metadata_fetcher.py).
+# Сколько запросов одновременно отправлять на один хост.
+METADATA_FETCH_HOST_CONCURRENCY = int(os.getenv('METADATA_FETCH_HOST_CONCURRENCY', 4))
+# Максимальный размер ответа в байтах, ответы большего размера отбрасываются.
+METADATA_FETCH_MAX_BYTES = int(os.getenv('METADATA_FETCH_MAX_BYTES', 256 * 1024))
+# Таймаут одного запроса в секундах.
+METADATA_FETCH_TIMEOUT = float(os.getenv('METADATA_FETCH_TIMEOUT', 5))
+# Общее время в секундах на загрузку метаданных, включая ожидание очереди хоста и повторные попытки.
+METADATA_FETCH_TIME_BUDGET = float(os.getenv('METADATA_FETCH_TIME_BUDGET', 10))
+# Количество попыток загрузки.
+METADATA_FETCH_ATTEMPTS = int(os.getenv('METADATA_FETCH_ATTEMPTS', 3))
+
+# Снимки балансов кошельков (bot/portfolio.py), из них строятся экран баланса и клавиатуры.
+# Как часто в секундах обновлять балансы всех кошельков в фоне, 0 - только по запросу пользователя.
+# При нескольких процессах бота фоновое обновление достаточно включить в одном.
+PORTFOLIO_REFRESH_INTERVAL = float(os.getenv('PORTFOLIO_REFRESH_INTERVAL', 60))
+# Сколько кошельков обновлять одним пакетом.
+PORTFOLIO_REFRESH_BATCH_SIZE = int(os.getenv('PORTFOLIO_REFRESH_BATCH_SIZE', 100))
+# Сколько запросов балансов токенов выполнять одновременно.
+PORTFOLIO_REFRESH_CONCURRENCY = int(os.getenv('PORTFOLIO_REFRESH_CONCURRENCY', 5))
+
+# Политика повторных RPC запросов (bot/retry.py).
+# Максимальное количество попыток одного RPC вызова.
+RPC_RETRY_ATTEMPTS = int(os.getenv('RPC_RETRY_ATTEMPTS', 5))
+# Начальная и максимальная задержка между попытками в секундах (экспоненциальный рост со случайным разбросом).
+RPC_RETRY_BASE_DELAY = float(os.getenv('RPC_RETRY_BASE_DELAY', 0.5))
+RPC_RETRY_MAX_DELAY = float(os.getenv('RPC_RETRY_MAX_DELAY', 8))
+# Общее время в секундах на один RPC вызов, включая все повторные попытки.
+RPC_CALL_DEADLINE = float(os.getenv('RPC_CALL_DEADLINE', 30))
+# Сколько ошибок подряд открывает circuit breaker узла.
+RPC_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('RPC_CIRCUIT_FAILURE_THRESHOLD', 5))
+# Через сколько секунд после открытия circuit breaker пропускает пробный запрос.
+RPC_CIRCUIT_RESET_TIMEOUT = float(os.getenv('RPC_CIRCUIT_RESET_TIMEOUT', 30))
+
+# Выбор RPC узла (bot/rpc_router.py).
+# Количество последних запросов к узлу, по которым считаются задержка (p50/p99) и доля ошибок.
+RPC_ROUTER_WINDOW_SIZE = int(os.getenv('RPC_ROUTER_WINDOW_SIZE', 100))
+# Доля ошибок, при которой узел считается нездоровым и не используется, пока есть здоровые узлы.
+RPC_ROUTER_MAX_ERROR_RATE = float(os.getenv('RPC_ROUTER_MAX_ERROR_RATE', 0.2))
+# За сколько последних секунд учитываются ошибки узла. Старые ошибки забываются, и нездоровый узел
+# снова получает запросы: если он восстановился, он остается в работе, если нет - снова исключается.
+RPC_ROUTER_ERROR_WINDOW = float(os.getenv('RPC_ROUTER_ERROR_WINDOW', 60))
+
+# История транзакций (bot/services.py).
+# Сколько запросов getTransaction выполнять одновременно.
+TRANSACTION_FETCH_CONCURRENCY = int(os.getenv('TRANSACTION_FETCH_CONCURRENCY', 10))
+# Максимальная версия транзакций, которую возвращает узел (0 - legacy и v0 транзакции).
+MAX_SUPPORTED_TRANSACTION_VERSION = int(os.getenv('MAX_SUPPORTED_TRANSACTION_VERSION', 0))
+# Сколько новых транзакций загружать за одну синхронизацию кошелька (bot/transaction_sync.py),
+# более старые транзакции догружаются при просмотре истории.
+TRANSACTION_SYNC_MAX_NEW = int(os.getenv('TRANSACTION_SYNC_MAX_NEW', 100))
+# Сколько последних транзакций показывать в истории кошелька.
+TRANSACTION_HISTORY_LIMIT = int(os.getenv('TRANSACTION_HISTORY_LIMIT', 100))
+
+# Вычисление ключей из seed фразы в отдельных процессах (bot/key_derivation.py).
+# Количество процессов.
+KEY_DERIVATION_WORKERS = int(os.getenv('KEY_DERIVATION_WORKERS', 2))
+# Сколько задач может одновременно ожидать или выполняться, остальные ждут освобождения очереди.
+KEY_DERIVATION_MAX_PENDING = int(os.getenv('KEY_DERIVATION_MAX_PENDING', 16))
+# Сколько путей деривации вычислять за одну задачу при поиске свободного адреса.
+KEY_DERIVATION_BATCH_SIZE = int(os.getenv('KEY_DERIVATION_BATCH_SIZE', 20))
+# Поиск путей деривации кошельков по seed фразе: сколько индексов подряд без совпадений проверять (gap limit)
+# и сколько при повторном поиске, если кошелек не найден.
+KEY_DISCOVERY_GAP_LIMIT = int(os.getenv('KEY_DISCOVERY_GAP_LIMIT', 20))
+KEY_DISCOVERY_EXTENDED_GAP_LIMIT = int(os.getenv('KEY_DISCOVERY_EXTENDED_GAP_LIMIT', 100))
+# Максимальный индекс аккаунта при поиске.
+KEY_DISCOVERY_MAX_INDEX = int(os.getenv('KEY_DISCOVERY_MAX_INDEX', 1000))
+
+# Кэш параметров сети: минимальные балансы для освобождения от аренды, комиссия (bot/network_params.py).
+# Как часто в секундах проверять номер эпохи, при смене эпохи параметры обновляются.
+NETWORK_PARAMS_CHECK_INTERVAL = float(os.getenv('NETWORK_PARAMS_CHECK_INTERVAL', 60))
+# Через сколько секунд параметры обновляются, даже если эпоха не сменилась.
+NETWORK_PARAMS_MAX_AGE = float(os.getenv('NETWORK_PARAMS_MAX_AGE', 60 * 60))
+
+# Фоновое обновление recent blockhash для транзакций (bot/blockhash_service.py).
+# Как часто в секундах запрашивать новый blockhash. Blockhash действителен ~150 блоков (около минуты).
+BLOCKHASH_REFRESH_INTERVAL = float(os.getenv('BLOCKHASH_REFRESH_INTERVAL', 15))
+# Blockhash старше этого возраста в секундах не выдается, вместо него запрашивается новый.
+BLOCKHASH_MAX_AGE = float(os.getenv('BLOCKHASH_MAX_AGE', 30))
+
+# Подтверждение транзакций через websocket (bot/confirmation.py).
+# Websocket адрес RPC узла, по умолчанию получается из SOLANA_NODE_URL (https -> wss).
+SOLANA_WS_URL = os.getenv('SOLANA_WS_URL', SOLANA_NODE_URL.replace('https://', 'wss://', 1).replace('http://', 'ws://', 1))
+# Уровень подтверждения, после которого перевод считается выполненным: processed, confirmed или finalized.
+CONFIRMATION_COMMITMENT = os.getenv('CONFIRMATION_COMMITMENT', 'confirmed')
+# Как часто в секундах опрашивать статусы подписей (getSignatureStatuses), если websocket недоступен.
+CONFIRMATION_POLL_INTERVAL = float(os.getenv('CONFIRMATION_POLL_INTERVAL', 2))
+# Через сколько секунд без уведомления по websocket статус подписи запрашивается опросом.
+CONFIRMATION_POLL_AFTER = float(os.getenv('CONFIRMATION_POLL_AFTER', 10))
+# Максимальное время ожидания подтверждения в секундах.
+CONFIRMATION_TIMEOUT = float(os.getenv('CONFIRMATION_TIMEOUT', 90))
+
+# Фоновая отправка и отслеживание переводов (bot/transfer_tracker.py).
+# Сколько транзакций переводов отправлять одновременно, остальные ждут очереди.
+TRANSFER_TRACKER_MAX_SENDING = int(os.getenv('TRANSFER_TRACKER_MAX_SENDING', 10))
+# Сколько секунд при остановке бота ждать завершения начатых отправок, переводы в очереди не отправляются.
+TRANSFER_TRACKER_SHUTDOWN_TIMEOUT = float(os.getenv('TRANSFER_TRACKER_SHUTDOWN_TIMEOUT', 30))
+
+# Лимит вычислительных единиц и комиссия за приоритет транзакций (bot/transaction_builder.py).
+# Перцентиль недавних комиссий для каждого уровня комиссии.
+PRIORITY_FEE_TIERS = {
+    'economy': 25,
+    'normal': 50,
+    'fast': 75,
+}
+# Уровень комиссии: economy, normal или fast.
+PRIORITY_FEE_TIER = os.getenv('PRIORITY_FEE_TIER', 'normal')
+if PRIORITY_FEE_TIER not in PRIORITY_FEE_TIERS:
+    raise ValueError(f"Unknown PRIORITY_FEE_TIER: {PRIORITY_FEE_TIER}, expected one of {', '.join(PRIORITY_FEE_TIERS)}")
+# Минимальная и максимальная цена вычислительной единицы в микролампортах.
+PRIORITY_FEE_MIN = int(os.getenv('PRIORITY_FEE_MIN', 1_000))
+PRIORITY_FEE_MAX = int(os.getenv('PRIORITY_FEE_MAX', 1_000_000))
+# Сколько секунд использовать полученные недавние комиссии (getRecentPrioritizationFees).
+PRIORITY_FEE_CACHE_TTL = float(os.getenv('PRIORITY_FEE_CACHE_TTL', 10))
+# Запас к вычислительным единицам, потраченным при симуляции транзакции.
+COMPUTE_UNIT_LIMIT_MARGIN = float(os.getenv('COMPUTE_UNIT_LIMIT_MARGIN', 1.1))
+
+# Массовые выплаты (bot/payouts.py): сколько транзакций с выплатами отправлять одновременно.
+PAYOUT_CONCURRENCY = int(os.getenv('PAYOUT_CONCURRENCY', 4))
+
+# Хранилище состояний FSM (bot/fsm_storage.py): memory, redis или django.
+# memory и django - для одного процесса бота (django сохраняет состояние при перезапуске),
+# redis - для нескольких процессов: обновления одного чата обрабатываются по очереди во всех процессах.
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'memory')
+# Адрес Redis для FSM_STORAGE=redis.
+FSM_REDIS_URL = os.getenv('FSM_REDIS_URL', 'redis://localhost:6379/0')
+# Через сколько секунд без изменений состояние и данные FSM удаляются.
+FSM_STATE_TTL = float(os.getenv('FSM_STATE_TTL', 60 * 60))
+# Ключи данных FSM с отдельным коротким сроком хранения и сам срок в секундах.
+FSM_SENSITIVE_DATA_KEYS = [key.strip() for key in os.getenv('FSM_SENSITIVE_DATA_KEYS', 'sender_private_key').split(',') if key.strip()]
+FSM_SENSITIVE_DATA_TTL = float(os.getenv('FSM_SENSITIVE_DATA_TTL', 10 * 60))
+# Как часто в секундах удалять истекшие записи FSM_STORAGE=django и чувствительные данные FSM_STORAGE=memory.
+FSM_CLEANUP_INTERVAL = float(os.getenv('FSM_CLEANUP_INTERVAL', 10 * 60))
+
+# Режим получения обновлений: polling или webhook (bot/webhook.py).
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+# Публичный адрес, по которому Telegram отправляет обновления, и путь вебхука. Ex.: https://web3net.top
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram/webhook')
+# Секретный токен, который Telegram передает в заголовке X-Telegram-Bot-Api-Secret-Token (A-Z, a-z, 0-9, _ и -).
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+# Адрес и порт, на которых слушает сервер вебхука.
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8081))
+# Сколько обновлений обрабатывать одновременно и сколько может ждать в очереди.
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 32))
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000))
+# Сколько секунд при остановке ждать обработки принятых обновлений.
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv('WEBHOOK_DRAIN_TIMEOUT', 30))
+# Максимальное количество одновременных соединений Telegram к вебхуку (1-100).
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+
+# Сколько обновлений разных пользователей обрабатывать одновременно (bot/middlewares.py).
+UPDATE_MAX_CONCURRENT = int(os.getenv('UPDATE_MAX_CONCURRENT', 100))
+# Сколько обновлений одного пользователя может ждать обработки, следующие отбрасываются.
+UPDATE_MAX_PENDING_PER_USER = int(os.getenv('UPDATE_MAX_PENDING_PER_USER', 5))
+# Как часто в секундах писать в лог глубину очередей и число отброшенных обновлений, 0 - только при остановке.
+UPDATE_METRICS_LOG_INTERVAL = float(os.getenv('UPDATE_METRICS_LOG_INTERVAL', 60))
+
+# Подписки на изменения аккаунтов кошельков через websocket (bot/account_subscriptions.py).
+# Изменения балансов сразу попадают в снимки балансов (bot/portfolio.py).
+ACCOUNT_SUBSCRIPTIONS_ENABLED = bool(int(os.getenv('ACCOUNT_SUBSCRIPTIONS_ENABLED', 1)))
+# Сколько подписок держать на одном websocket соединении и сколько соединений открывать.
+# На каждый кошелек приходится одна подписка на аккаунт и одна на его токен-аккаунты.
+ACCOUNT_SUBSCRIPTIONS_PER_CONNECTION = int(os.getenv('ACCOUNT_SUBSCRIPTIONS_PER_CONNECTION', 500))
+ACCOUNT_SUBSCRIPTIONS_MAX_CONNECTIONS = int(os.getenv('ACCOUNT_SUBSCRIPTIONS_MAX_CONNECTIONS', 8))
+# Как часто в секундах сверять подписки со списком кошельков в бд.
+ACCOUNT_SUBSCRIPTIONS_SYNC_INTERVAL = float(os.getenv('ACCOUNT_SUBSCRIPTIONS_SYNC_INTERVAL', 60))
+# Сколько секунд собирать изменения токен-аккаунтов перед обновлением снимков.
+ACCOUNT_CHANGE_DEBOUNCE = float(os.getenv('ACCOUNT_CHANGE_DEBOUNCE', 1))
+# Сообщать владельцам кошелька о входящих переводах.
+NOTIFY_INCOMING_TRANSFERS = bool(int(os.getenv('NOTIFY_INCOMING_TRANSFERS', 0)))
+
+# Кэш токен-аккаунтов кошельков (bot/token_account_cache.py).
+# Сколько секунд ответ getTokenAccountsByOwner используется повторно и сколько кошельков хранить.
+TOKEN_ACCOUNTS_CACHE_TTL = float(os.getenv('TOKEN_ACCOUNTS_CACHE_TTL', 10))
+TOKEN_ACCOUNTS_CACHE_SIZE = int(os.getenv('TOKEN_ACCOUNTS_CACHE_SIZE', 1000))
@@ -0,0 +1,388 @@
+"""
+    Transaction confirmation over a single shared websocket connection.
+
+    Every pending signature is subscribed with signatureSubscribe on one websocket, notifications resolve
+    per-signature futures. Signatures are also checked with batched getSignatureStatuses requests
+    while the websocket is disconnected and when no notification came within CONFIRMATION_POLL_AFTER seconds.
+    A signature whose blockhash expired (block height passed last_valid_block_height) without a status
+    can no longer be confirmed and fails with TransactionExpiredError.
+"""
+import asyncio
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from solana.rpc.commitment import Commitment
+from solana.rpc.core import _COMMITMENT_TO_SOLDERS
+from solana.rpc.websocket_api import SolanaWsClientProtocol, SubscriptionError, connect
+from solders.errors import SerdeJSONError
+from solders.rpc.config import RpcSignatureSubscribeConfig
+from solders.rpc.requests import SignatureSubscribe
+from solders.rpc.responses import SignatureNotification, SubscriptionResult
+from solders.signature import Signature
+from solders.transaction_status import TransactionConfirmationStatus
+
+from bot.cache import TTLCache
+from bot.config import (CONFIRMATION_COMMITMENT, CONFIRMATION_POLL_AFTER,
+                        CONFIRMATION_POLL_INTERVAL, CONFIRMATION_TIMEOUT,
+                        SOLANA_WS_URL)
+from bot.retry import call_rpc
+from logger_config import logger
+
+# Максимальное количество подписей в одном запросе getSignatureStatuses
+SIGNATURE_STATUSES_LIMIT = 256
+# Задержка перед повторным подключением websocket в секундах
+RECONNECT_DELAY = 5
+# Сколько подтвержденных подписей помнить вместе со слотом подтверждения
+CONFIRMED_SLOTS_CACHE_SIZE = 1000
+
+# Уровни подтверждения по возрастанию
+CONFIRMATION_STATUSES = [
+    TransactionConfirmationStatus.Processed,
+    TransactionConfirmationStatus.Confirmed,
+    TransactionConfirmationStatus.Finalized,
+]
+COMMITMENT_LEVELS = {'processed': 0, 'confirmed': 1, 'finalized': 2}
+
+
+class TransactionExpiredError(Exception):
+    """
+        Raised when the blockhash of the transaction expired before the transaction was confirmed.
+    """
+
+
+class TransactionStatusUnknownError(Exception):
+    """
+        Raised when sending failed after the transaction may have been broadcast (timeout, connection lost).
+        The transaction can still land, its status is checked by the signature.
+
+        Attributes:
+            signature (Signature): Transaction signature.
+            last_valid_block_height (int): Last valid block height of the transaction blockhash.
+    """
+
+    def __init__(self, signature: Signature, last_valid_block_height: int) -> None:
+        super().__init__(f"Status of transaction {signature} is unknown")
+        self.signature = signature
+        self.last_valid_block_height = last_valid_block_height
+
+
+@dataclass
+class PendingSignature:
+    """
+        Signature waiting for confirmation.
+
+        Attributes:
+            signature (Signature): Transaction signature.
+            commitment (Commitment): Required commitment level.
+            future (asyncio.Future): Resolved with True if the transaction succeeded, False if it failed.
+            last_valid_block_height (int | None): Block height after which the transaction can not be confirmed.
+            created (float): time.monotonic() when the signature was added.
+            subscription_id (int | None): Websocket subscription id.
+            waiters (int): Number of callers waiting for the future.
+    """
+    signature: Signature
+    commitment: Commitment
+    future: asyncio.Future
+    last_valid_block_height: Optional[int]
+    created: float
+    subscription_id: Optional[int] = None
+    waiters: int = 0
+
+
+class SignatureConfirmationManager:
+    """
+        Confirms transactions of all pending transfers with one websocket connection and batched polling.
+    """
+
+    def __init__(self, ws_url: str) -> None:
+        self.ws_url = ws_url
+        self._pending: Dict[Tuple[str, Commitment], PendingSignature] = {}
+        # id запроса signatureSubscribe -> подпись, id подписки -> подпись
+        self._requests: Dict[int, Tuple[str, Commitment]] = {}
+        self._subscriptions: Dict[int, Tuple[str, Commitment]] = {}
+        self._websocket: Optional[SolanaWsClientProtocol] = None
+        self._tasks: List[asyncio.Task] = []
+        self._unsubscribe_tasks: Set[asyncio.Task] = set()
+        # подпись -> слот, в котором транзакция подтверждена
+        self._confirmed_slots = TTLCache(max_size=CONFIRMED_SLOTS_CACHE_SIZE, ttl=CONFIRMATION_TIMEOUT)
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    async def wait(
+            self,
+            signature: Signature,
+            commitment: Commitment = CONFIRMATION_COMMITMENT,
+            last_valid_block_height: Optional[int] = None,
+            timeout: float = CONFIRMATION_TIMEOUT,
+        ) -> bool:
+        """
+            Waits until the transaction reaches the commitment level.
+
+            Args:
+                signature (Signature): Transaction signature.
+                commitment (Commitment): Required commitment level.
+                last_valid_block_height (int | None): Last valid block height of the transaction blockhash.
+                timeout (float): Maximum waiting time in seconds.
+
+            Returns:
+                bool: True if the transaction succeeded, False if it was processed with an error.
+
+            Raises:
+                TransactionExpiredError: If the blockhash expired before the transaction was confirmed.
+                TimeoutError: If the transaction was not confirmed within the timeout.
+        """
+        key = (str(signature), commitment)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = PendingSignature(
+                signature=signature,
+                commitment=commitment,
+                future=asyncio.get_running_loop().create_future(),
+                last_valid_block_height=last_valid_block_height,
+                created=time.monotonic(),
+            )
+            self._pending[key] = pending
+            pending.future.add_done_callback(lambda _: self._pending.pop(key, None))
+            await self._subscribe(key, pending)
+
+        pending.waiters += 1
+        try:
+            async with asyncio.timeout(timeout):
+                # shield: отмена одного ожидающего не отменяет ожидание остальных
+                return await asyncio.shield(pending.future)
+        finally:
+            pending.waiters -= 1
+            if not pending.waiters and not pending.future.done():
+                # подпись больше никто не ждет
+                pending.future.cancel()
+                await self._unsubscribe(pending)
+
+    async def _subscribe(self, key: Tuple[str, Commitment], pending: PendingSignature) -> None:
+        websocket = self._websocket
+        if websocket is None:
+            # подпись будет проверена опросом и подписана после подключения
+            return
+        try:
+            request_id = websocket.increment_counter_and_get_id()
+            self._requests[request_id] = key
+            config = RpcSignatureSubscribeConfig(commitment=_COMMITMENT_TO_SOLDERS[pending.commitment])
+            await websocket.send_data(SignatureSubscribe(pending.signature, config, request_id))
+        except Exception as error:
+            logger.warning(f"Failed to subscribe to signature {pending.signature}: {error!r}")
+
+    async def _unsubscribe(self, pending: PendingSignature) -> None:
+        subscription_id = pending.subscription_id
+        if subscription_id is None:
+            return
+        pending.subscription_id = None
+        await self._unsubscribe_id(subscription_id)
+
+    async def _unsubscribe_id(self, subscription_id: int) -> None:
+        websocket = self._websocket
+        self._subscriptions.pop(subscription_id, None)
+        if websocket is None:
+            return
+        try:
+            await websocket.signature_unsubscribe(subscription_id)
+        except Exception as error:
+            logger.debug(f"Failed to unsubscribe from signature subscription {subscription_id}: {error!r}")
+
+    def confirmed_slot(self, signature: Signature) -> Optional[int]:
+        """
+            Returns the slot in which the recently confirmed transaction reached the commitment level.
+
+            Args:
+                signature (Signature): Transaction signature.
+
+            Returns:
+                int | None: Slot, None if the signature was not confirmed by this manager recently.
+        """
+        return self._confirmed_slots.get(str(signature))
+
+    def _resolve(self, pending: PendingSignature, err: Any, slot: Optional[int] = None) -> None:
+        if pending.future.done():
+            return
+        if slot is not None:
+            self._confirmed_slots.set(str(pending.signature), slot)
+        if err is not None:
+            logger.warning(f"Transaction {pending.signature} failed: {err}")
+        pending.future.set_result(err is None)
+
+    def _handle_message(self, message: Any) -> None:
+        if isinstance(message, SubscriptionResult):
+            key = self._requests.pop(message.id, None)
+            pending = self._pending.get(key) if key else None
+            if pending is not None and not pending.future.done() and pending.subscription_id is None:
+                pending.subscription_id = message.result
+                self._subscriptions[message.result] = key
+            elif key is not None:
+                # подпись подтверждена опросом или ее перестали ждать до ответа на подписку (или у нее уже есть
+                # подписка), без отписки подписка осталась бы на узле до закрытия соединения
+                task = asyncio.create_task(self._unsubscribe_id(message.result))
+                self._unsubscribe_tasks.add(task)
+                task.add_done_callback(self._unsubscribe_tasks.discard)
+        elif isinstance(message, SignatureNotification):
+            # после уведомления узел сам удаляет подписку
+            key = self._subscriptions.pop(message.subscription, None)
+            pending = self._pending.get(key) if key else None
+            if pending is not None:
+                pending.subscription_id = None
+                self._resolve(pending, message.result.value.err, message.result.context.slot)
+
+    async def _run_websocket(self) -> None:
+        while True:
+            try:
+                async with connect(self.ws_url) as websocket:
+                    self._websocket = websocket
+                    logger.info(f"Confirmation websocket connected: {self.ws_url}")
+                    for key, pending in list(self._pending.items()):
+                        await self._subscribe(key, pending)
+
+                    while True:
+                        try:
+                            messages = await websocket.recv()
+                        except SubscriptionError as error:
+                            logger.warning(f"Signature subscription failed: {error}")
+                            continue
+                        except SerdeJSONError:
+                            # solders не разбирает ответ на отписку ({"result": true}), сообщение пропускается
+                            continue
+                        for message in messages:
+                            self._handle_message(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                logger.warning(f"Confirmation websocket disconnected: {error!r}. Reconnect in {RECONNECT_DELAY}s.")
+            finally:
+                self._websocket = None
+                self._requests.clear()
+                self._subscriptions.clear()
+                for pending in self._pending.values():
+                    pending.subscription_id = None
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def poll(self, pendings: List[PendingSignature]) -> None:
+        """
+            Checks the signatures with batched getSignatureStatuses requests.
+
+            Args:
+                pendings (List[PendingSignature]): Signatures to check.
+
+            Returns:
+                None
+        """
+        block_height = None
+        if any(pending.last_valid_block_height is not None for pending in pendings):
+            # высоту блока запрашиваем до статусов: если статуса нет и высота уже больше допустимой,
+            # транзакция гарантированно не попадет в блок
+            block_height = (await call_rpc(lambda client: client.get_block_height(), "get_block_height")).value
+
+        for i in range(0, len(pendings), SIGNATURE_STATUSES_LIMIT):
+            chunk = pendings[i:i + SIGNATURE_STATUSES_LIMIT]
+            statuses = (await call_rpc(
+                lambda client: client.get_signature_statuses([pending.signature for pending in chunk]),
+                f"get_signature_statuses of {len(chunk)} signatures",
+            )).value
+
+            for pending, status in zip(chunk, statuses):
+                if status is not None and status.confirmation_status is not None and \
+                        CONFIRMATION_STATUSES.index(status.confirmation_status) >= COMMITMENT_LEVELS[pending.commitment]:
+                    await self._unsubscribe(pending)
+                    self._resolve(pending, status.err, status.slot)
+                elif status is None and block_height is not None and pending.last_valid_block_height is not None \
+                        and block_height > pending.last_valid_block_height and not pending.future.done():
+                    await self._unsubscribe(pending)
+                    pending.future.set_exception(
+                        TransactionExpiredError(f"Transaction {pending.signature} expired, block height {block_height}")
+                    )
+
+    async def _run_polling(self) -> None:
+        while True:
+            await asyncio.sleep(CONFIRMATION_POLL_INTERVAL)
+            now = time.monotonic()
+            pendings = [
+                pending for pending in self._pending.values()
+                if not pending.future.done() and (
+                    self._websocket is None or pending.subscription_id is None
+                    or now - pending.created > CONFIRMATION_POLL_AFTER
+                )
+            ]
+            if not pendings:
+                continue
+            try:
+                await self.poll(pendings)
+            except Exception as error:
+                detailed_error_traceback = traceback.format_exc()
+                logger.error(f"Failed to poll signature statuses: {error}\n{detailed_error_traceback}")
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run_websocket()), asyncio.create_task(self._run_polling())]
+
+    async def close(self) -> None:
+        tasks = self._tasks + list(self._unsubscribe_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+
+
+confirmation_manager = SignatureConfirmationManager(SOLANA_WS_URL)
+
+
+async def wait_for_confirmation(
+        signature: Signature,
+        commitment: Commitment = CONFIRMATION_COMMITMENT,
+        last_valid_block_height: Optional[int] = None,
+        timeout: float = CONFIRMATION_TIMEOUT,
+    ) -> bool:
+    """
+        Waits until the transaction reaches the commitment level. See SignatureConfirmationManager.wait.
+
+        Args:
+            signature (Signature): Transaction signature.
+            commitment (Commitment): Required commitment level.
+            last_valid_block_height (int | None): Last valid block height of the transaction blockhash.
+            timeout (float): Maximum waiting time in seconds.
+
+        Returns:
+            bool: True if the transaction succeeded, False if it was processed with an error.
+    """
+    return await confirmation_manager.wait(signature, commitment, last_valid_block_height, timeout)
+
+
+def get_confirmation_slot(signature: Signature) -> Optional[int]:
+    """
+        Returns the slot of the recently confirmed transaction. See SignatureConfirmationManager.confirmed_slot.
+
+        Args:
+            signature (Signature): Transaction signature.
+
+        Returns:
+            int | None: Slot, None if unknown.
+    """
+    return confirmation_manager.confirmed_slot(signature)
+
+
+async def start_confirmation_manager() -> None:
+    """
+        Connects the confirmation websocket and starts polling. Registered as Dispatcher startup handler.
+
+        Returns:
+            None
+    """
+    confirmation_manager.start()
+
+
+async def close_confirmation_manager() -> None:
+    """
+        Closes the confirmation websocket. Registered as Dispatcher shutdown handler.
+
+        Returns:
+            None
+    """
+    await confirmation_manager.close()
@@ -0,0 +1,279 @@
+"""
+    FSM storage backends.
+
+    FSM_STORAGE selects where the FSM state and data are kept:
+        memory - in the bot process (aiogram MemoryStorage), for a single bot process and local runs;
+        redis - in Redis (aiogram RedisStorage, requires requirements/redis.txt), shared by all bot processes,
+                updates of one chat are processed one by one in all processes (RedisEventIsolation);
+        django - in the FSMState model of the project database. The data survives restarts, but updates of one chat
+                 are not isolated between processes and concurrent writes can be lost, so deployments with
+                 several bot processes need FSM_STORAGE=redis.
+    Records expire after FSM_STATE_TTL seconds of inactivity. Sensitive data keys (FSM_SENSITIVE_DATA_KEYS,
+    ex. sender_private_key) are kept in a separate record of the backend that expires FSM_SENSITIVE_DATA_TTL
+    seconds after the values were last changed: Redis removes it by key TTL, the django and memory records
+    are no longer returned after the TTL and are deleted every FSM_CLEANUP_INTERVAL seconds.
+"""
+import asyncio
+import time
+import traceback
+from datetime import timedelta
+from typing import Any, Dict, Optional, Sequence
+
+from aiogram import Dispatcher
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage, DefaultKeyBuilder, KeyBuilder, StorageKey
+from aiogram.fsm.storage.memory import DisabledEventIsolation, MemoryStorage
+from django.utils import timezone
+
+from bot.config import (FSM_CLEANUP_INTERVAL, FSM_REDIS_URL, FSM_SENSITIVE_DATA_KEYS,
+                        FSM_SENSITIVE_DATA_TTL, FSM_STATE_TTL, FSM_STORAGE)
+from logger_config import logger
+from web.applications.account.models import FSMState
+
+_cleanup_task: Optional[asyncio.Task] = None
+
+
+class DjangoStorage(BaseStorage):
+    """
+        FSM storage in the FSMState model.
+
+        Attributes:
+            state_ttl (float): Seconds after the last write after which the record expires.
+            key_builder (KeyBuilder): Builds the record key from the storage key.
+    """
+
+    def __init__(self, state_ttl: float = FSM_STATE_TTL, key_builder: Optional[KeyBuilder] = None) -> None:
+        self.state_ttl = state_ttl
+        self.key_builder = key_builder or DefaultKeyBuilder()
+
+    def _expires(self):
+        return timezone.now() + timedelta(seconds=self.state_ttl)
+
+    async def _get_record(self, key: StorageKey) -> Optional[FSMState]:
+        return await FSMState.objects.filter(key=self.key_builder.build(key), expires__gt=timezone.now()).afirst()
+
+    async def _write(self, key: StorageKey, **fields: Any) -> None:
+        record_key = self.key_builder.build(key)
+        # истекшая запись не должна вернуться с новым состоянием, поэтому удаляется перед записью
+        await FSMState.objects.filter(key=record_key, expires__lte=timezone.now()).adelete()
+        await FSMState.objects.aupdate_or_create(key=record_key, defaults={**fields, 'expires': self._expires()})
+
+    async def set_state(self, key: StorageKey, state: State | str | None = None) -> None:
+        await self._write(key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._get_record(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        if not data:
+            # состояние очищено (state.clear()) - запись без состояния и данных не нужна
+            record_key = self.key_builder.build(key)
+            await FSMState.objects.filter(key=record_key, state__isnull=True).adelete()
+            await FSMState.objects.filter(key=record_key).aupdate(data={}, expires=self._expires())
+            return
+        await self._write(key, data=data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self._get_record(key)
+        return dict(record.data) if record else {}
+
+    async def delete_expired(self) -> int:
+        """
+            Deletes the expired records.
+
+            Returns:
+                int: Number of deleted records.
+        """
+        number_deleted, _ = await FSMState.objects.filter(expires__lte=timezone.now()).adelete()
+        return number_deleted
+
+    async def close(self) -> None:
+        pass
+
+
+class ExpiringMemoryStorage(MemoryStorage):
+    """
+        MemoryStorage whose data expires ttl seconds after it was written.
+
+        Attributes:
+            ttl (float): Seconds after the last write after which the data expires.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        super().__init__()
+        self.ttl = ttl
+        self._written: Dict[StorageKey, float] = {}
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await super().set_data(key, data)
+        if data:
+            self._written[key] = time.monotonic()
+        else:
+            self._written.pop(key, None)
+            self.storage.pop(key, None)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        written = self._written.get(key)
+        if written is not None and time.monotonic() - written >= self.ttl:
+            await self.set_data(key, {})
+        return await super().get_data(key)
+
+    async def delete_expired(self) -> int:
+        """
+            Deletes the expired data.
+
+            Returns:
+                int: Number of deleted records.
+        """
+        expired_keys = [key for key, written in self._written.items() if time.monotonic() - written >= self.ttl]
+        for key in expired_keys:
+            await self.set_data(key, {})
+        return len(expired_keys)
+
+
+class SensitiveDataStorage(BaseStorage):
+    """
+        Wraps an FSM storage and keeps the sensitive data keys in a separate storage with a short TTL.
+
+        Sensitive values are never written to the wrapped storage. The sensitive storage expires them ttl seconds
+        after they were last changed (Redis key TTL, FSMState.expires, ExpiringMemoryStorage), so the value
+        of an abandoned dialog is removed even if the user never comes back.
+
+        Attributes:
+            storage (BaseStorage): Wrapped storage with the state and the other data.
+            sensitive_storage (BaseStorage): Storage of the sensitive data keys with TTL.
+            sensitive_keys (Sequence[str]): Data keys kept in sensitive_storage.
+    """
+
+    def __init__(self, storage: BaseStorage, sensitive_storage: BaseStorage, sensitive_keys: Sequence[str]) -> None:
+        self.storage = storage
+        self.sensitive_storage = sensitive_storage
+        self.sensitive_keys = set(sensitive_keys)
+
+    async def set_state(self, key: StorageKey, state: State | str | None = None) -> None:
+        await self.storage.set_state(key, state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self.storage.get_state(key)
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        data = dict(data)
+        sensitive_data = {data_key: data.pop(data_key) for data_key in self.sensitive_keys.intersection(data)}
+        # срок хранения отсчитывается от изменения значений, update_data других ключей его не продлевает
+        if sensitive_data != await self.sensitive_storage.get_data(key):
+            await self.sensitive_storage.set_data(key, sensitive_data)
+        await self.storage.set_data(key, data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        data = await self.storage.get_data(key)
+        data.update(await self.sensitive_storage.get_data(key))
+        return data
+
+    async def close(self) -> None:
+        # хранилище чувствительных данных использует соединение (Redis) или таблицу основного хранилища
+        await self.storage.close()
+
+
+def create_fsm_storage(backend: str = FSM_STORAGE) -> BaseStorage:
+    """
+        Creates the FSM storage of the backend with TTL of the sensitive data.
+
+        Args:
+            backend (str): memory, redis or django.
+
+        Raises:
+            ValueError: If the backend is unknown.
+            RuntimeError: If the redis backend is selected and the redis package is not installed.
+
+        Returns:
+            BaseStorage: FSM storage for the Dispatcher.
+    """
+    sensitive_key_builder = DefaultKeyBuilder(prefix='fsm_sensitive')
+    if backend == 'memory':
+        storage = MemoryStorage()
+        sensitive_storage = ExpiringMemoryStorage(FSM_SENSITIVE_DATA_TTL)
+    elif backend == 'redis':
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as error:
+            raise RuntimeError("FSM_STORAGE=redis requires the redis package: pip install -r requirements/redis.txt") from error
+        storage = RedisStorage.from_url(FSM_REDIS_URL, state_ttl=int(FSM_STATE_TTL), data_ttl=int(FSM_STATE_TTL))
+        sensitive_storage = RedisStorage(storage.redis, key_builder=sensitive_key_builder,
+                                         data_ttl=int(FSM_SENSITIVE_DATA_TTL))
+    elif backend == 'django':
+        storage = DjangoStorage(FSM_STATE_TTL)
+        sensitive_storage = DjangoStorage(FSM_SENSITIVE_DATA_TTL, key_builder=sensitive_key_builder)
+    else:
+        raise ValueError(f"Unknown FSM storage: {backend}")
+
+    logger.info(f"FSM storage: {backend}")
+    return SensitiveDataStorage(storage, sensitive_storage, FSM_SENSITIVE_DATA_KEYS)
+
+
+def create_fsm_events_isolation(storage: BaseStorage) -> BaseEventIsolation:
+    """
+        Creates the events isolation for the storage. With Redis updates of one chat are processed one by one
+        in all bot processes (RedisEventIsolation), the other storages keep aiogram's default (no isolation),
+        which is safe only for a single bot process.
+
+        Args:
+            storage (BaseStorage): Storage created by create_fsm_storage.
+
+        Returns:
+            BaseEventIsolation: Events isolation for the Dispatcher.
+    """
+    inner_storage = storage.storage if isinstance(storage, SensitiveDataStorage) else storage
+    if hasattr(inner_storage, 'create_isolation'):
+        return inner_storage.create_isolation()
+    return DisabledEventIsolation()
+
+
+async def _cleanup_loop(storages: Sequence[BaseStorage]) -> None:
+    while True:
+        await asyncio.sleep(FSM_CLEANUP_INTERVAL)
+        try:
+            number_deleted = 0
+            for storage in storages:
+                number_deleted += await storage.delete_expired()
+            if number_deleted:
+                logger.debug(f"Deleted {number_deleted} expired FSM records")
+        except Exception as error:
+            detailed_error_traceback = traceback.format_exc()
+            logger.error(f"Failed to delete expired FSM records: {error}\n{detailed_error_traceback}")
+
+
+async def start_fsm_storage(dispatcher: Dispatcher) -> None:
+    """
+        Starts deleting the expired records of the django storage and of the sensitive data in memory. Registered as Dispatcher startup handler.
+
+        Args:
+            dispatcher (Dispatcher): The dispatcher, passed by aiogram.
+
+        Returns:
+            None
+    """
+    global _cleanup_task
+    storage = dispatcher.storage
+    storages = [storage.storage, storage.sensitive_storage] if isinstance(storage, SensitiveDataStorage) else [storage]
+    # записи Redis удаляются по TTL самим Redis, остальные данные MemoryStorage живут до перезапуска
+    storages = [storage for storage in storages if hasattr(storage, 'delete_expired')]
+    if storages and _cleanup_task is None:
+        _cleanup_task = asyncio.create_task(_cleanup_loop(storages))
+
+
+async def close_fsm_storage(dispatcher: Dispatcher) -> None:
+    """
+        Stops the cleanup and closes the storage. Registered as Dispatcher shutdown handler.
+
+        Args:
+            dispatcher (Dispatcher): The dispatcher, passed by aiogram.
+
+        Returns:
+            None
+    """
+    global _cleanup_task
+    if _cleanup_task is not None:
+        _cleanup_task.cancel()
+        _cleanup_task = None
+    await dispatcher.storage.close()
@@ -1,12 +1,12 @@
 import traceback
 
-import mnemonic
 from aiogram import Router
 from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
-from solders.keypair import Keypair
 
+from bot.config import KEY_DERIVATION_BATCH_SIZE
+from bot.key_derivation import derive_keypairs, get_solana_derivation_path
 from bot.keyboards import get_back_keyboard, get_main_keyboard
 from bot.states import FSMWallet
 from bot.utils import create_wallet_from_seed, get_translation, get_user
@@ -162,21 +162,22 @@ async def process_wallet_description(message: Message, state: FSMContext) -> Non
             derivation_path = user.last_solana_derivation_path
             list_from_derivation_path = derivation_path.split('/')
             last_el = list_from_derivation_path[-1]
-            index = int(last_el[0]) + 1
-
-        while True:
-            derivation_path = f"m/44'/501'/0'/{index}'"
-
-            mnemo = mnemonic.Mnemonic("english")
-            seed = mnemo.to_seed(seed_phrase, passphrase="")
-            keypair = Keypair.from_seed_and_derivation_path(seed, derivation_path)
-            wallet_address = str(keypair.pubkey())
-            private_key = keypair.secret().hex()
-
-            if wallet_address not in user_wallets:
-                break
+            index = int(last_el.rstrip("'")) + 1
+
+        wallet_address = None
+        while not wallet_address:
+            # вычисляем сразу пачку адресов в отдельном процессе, seed вычисляется один раз
+            derivation_paths = [
+                get_solana_derivation_path(i) for i in range(index, index + KEY_DERIVATION_BATCH_SIZE)
+            ]
+            keypairs = await derive_keypairs(seed_phrase, derivation_paths)
+
+            for derivation_path, (address, private_key) in keypairs.items():
+                if address not in user_wallets:
+                    wallet_address = address
+                    break
             else:
-                index += 1
+                index += KEY_DERIVATION_BATCH_SIZE
 
         wallet = await create_wallet_from_seed(
             user=user,
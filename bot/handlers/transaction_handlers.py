@@ -9,14 +9,14 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import default_state
 from aiogram.types import CallbackQuery
 
-from bot.config import LAMPORT_TO_SOL_RATIO, SOLANA_NODE_URL
+from bot.config import (LAMPORT_TO_SOL_RATIO, SOLANA_NODE_URL,
+                        TRANSACTION_HISTORY_LIMIT)
 from bot.keyboards import get_main_keyboard
-from bot.services import get_solana_transaction_history
 from bot.states import FSMWallet
-from bot.utils import (get_transaction_history_from_db, get_translation,
-                       save_transaction)
-from bot.wallet_service import (format_transaction_from_db_message,
-                                format_transaction_message)
+from bot.transaction_sync import (backfill_wallet_transactions,
+                                  sync_wallet_transactions)
+from bot.utils import get_transaction_history_from_db, get_translation
+from bot.wallet_service import format_transaction_from_db_message
 from logger_config import logger
 
 transaction_router: Router = Router()
@@ -36,50 +36,29 @@ async def process_choose_transaction_wallet(callback: CallbackQuery, state: FSMC
             None
     """
     try:
-        transaction_history = []
-        tr_from_db_tasks = []
-        transaction_id_before = None
-        transaction_limit = 5
-        transaction_max_limit = 100
-
         TRANSLATION = await get_translation(lang=callback.from_user.language_code)
 
         # Извлекаем адрес кошелька из callback_data
         wallet_address = callback.data.split(":")[1]
 
         tr_history_from_db = await get_transaction_history_from_db(wallet_address)
-        tr_from_db_time_list = [tr.transaction_time async for tr in tr_history_from_db]
-
-        if not tr_from_db_time_list:
-            # если в бд нет трансакций то запросим из блокчейна 100 последних
-            transaction_limit = transaction_max_limit
-
-        while transaction_max_limit > 0:
-            transaction_max_limit -= transaction_limit
 
-            # api.devnet.solana.com выдает ошибку при попытке получить историю трансакций
-            if "api.devnet.solana.com" not in SOLANA_NODE_URL:
-                # Получаем историю транзакций кошелька по его адресу.
-                transaction_history += await get_solana_transaction_history(wallet_address, transaction_id_before, transaction_limit)
+        # api.devnet.solana.com выдает ошибку при попытке получить историю трансакций
+        if tr_history_from_db is not None and "api.devnet.solana.com" not in SOLANA_NODE_URL:
+            # Загружаем из блокчейна только транзакции, сделанные после предыдущей синхронизации
+            await sync_wallet_transactions(wallet_address)
 
-            if transaction_history:
+            tr_from_db_count = await tr_history_from_db.acount()
+            if tr_from_db_count < TRANSACTION_HISTORY_LIMIT:
+                # в бд меньше транзакций, чем нужно показать - догружаем более старую историю
+                await backfill_wallet_transactions(wallet_address, TRANSACTION_HISTORY_LIMIT - tr_from_db_count)
 
-                if transaction_history[-1].block_time in tr_from_db_time_list:
-                    el_index = tr_from_db_time_list.index(transaction_history[-1].block_time)
-                    if (el_index + 1) < len(tr_history_from_db):
-                        tr_from_db_tasks = [format_transaction_from_db_message(tr) for tr in tr_history_from_db[el_index + 1:]]
-                    break
-
-                else:
-                    transaction_id_before = transaction_history[-1].transaction.transaction.signatures[0]
+        transaction_history = []
+        if tr_history_from_db is not None:
+            transaction_history = [tr async for tr in tr_history_from_db[:TRANSACTION_HISTORY_LIMIT]]
 
         if transaction_history:
-            for tr in transaction_history:
-                await save_transaction(tr)
-
-        if transaction_history or tr_from_db_tasks:
-            transaction_tasks = [format_transaction_message(transaction) for transaction in transaction_history]
-            transaction_tasks += tr_from_db_tasks
+            transaction_tasks = [format_transaction_from_db_message(transaction) for transaction in transaction_history]
             # Используем asyncio.gather для параллельной обработки транзакций
             transaction_messages = await asyncio.gather(*transaction_tasks)
             # Объединяем все сообщения в одну строку с разделителем '\n\n'
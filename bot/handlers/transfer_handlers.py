@@ -2,26 +2,33 @@ import asyncio
 import traceback
 from decimal import Decimal
 
-import solana.rpc.core
 from aiogram import F, Router
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
-from mnemonic import Mnemonic
-from solders.keypair import Keypair
+from solders.pubkey import Pubkey
 
-from bot.config import LAMPORT_TO_SOL_RATIO
+from bot.config import KEY_DISCOVERY_EXTENDED_GAP_LIMIT, LAMPORT_TO_SOL_RATIO
+from bot.key_derivation import derive_keypairs, discover_derivation_paths
 from bot.keyboards import (get_back_keyboard, get_main_keyboard,
                            get_token_keyboard)
-from bot.services import (get_sol_balance, get_spl_token_data,
+from bot.network_params import get_lamports_per_signature
+from bot.portfolio import refresh_portfolios
+from bot.services import (get_sol_balance, get_spl_token_data, get_token_decimals,
                           get_wallet_address_from_private_key,
                           is_valid_amount, is_valid_private_key,
-                          is_valid_wallet_address, transfer_sol_token,
-                          transfer_spl_token, get_min_sol_balance)
+                          is_valid_wallet_address, send_sol_token,
+                          send_spl_token, get_min_sol_balance)
 from bot.states import FSMWallet
-from bot.utils import get_token, get_translation, get_wallet, update_wallet
+from bot.transaction_builder import (SOL_TRANSFER_COMPUTE_UNITS, SPL_TRANSFER_COMPUTE_UNITS,
+                                     estimate_priority_fee)
+from bot.transfer_tracker import submit_transfer
+from bot.utils import (get_token, get_translation, get_wallet,
+                       update_or_create_token, update_wallets_derivation_paths)
 from bot.validators import is_valid_wallet_seed_phrase
 from logger_config import logger
+from web.applications.wallet.models import Wallet
 
 transfer_router: Router = Router()
 
@@ -93,21 +100,31 @@ async def process_transfer_sender_private_key(message: Message, state: FSMContex
 
         if seed_phrase:
             if is_valid_wallet_seed_phrase(seed_phrase):
-                mnemo = Mnemonic("english")
-                seed = mnemo.to_seed(seed_phrase, passphrase="")
+                # ключи вычисляются в отдельном процессе, чтобы не блокировать event loop
                 if derivation_path:
-                    keypair = Keypair.from_seed_and_derivation_path(seed, derivation_path)
-                    private_key = keypair.secret().hex()
+                    keypairs = await derive_keypairs(seed_phrase, [derivation_path])
+                    private_key = keypairs[derivation_path][1]
                 else:
-                    for i in range(100):
-                        derivation_path = f"m/44'/501'/0'/{i}'"
-                        i += 1
-                        keypair = Keypair.from_seed_and_derivation_path(seed, derivation_path)
-                        address = str(keypair.pubkey())
-                        if address == sender_address:
-                            private_key = keypair.secret().hex()
-                            await update_wallet(sender_address, derivation_path)
-                            break
+                    # ищем пути деривации сразу для всех кошельков пользователя без сохраненного пути,
+                    # чтобы при следующих переводах поиск не понадобился
+                    wallet_addresses = [sender_address] + [
+                        wallet.wallet_address async for wallet in Wallet.objects.filter(
+                            user__telegram_id=message.from_user.id, derivation_path=''
+                        ).exclude(wallet_address=sender_address)
+                    ]
+                    # приватный ключ отправителя возвращается тем же заданием, без повторного вычисления seed
+                    derivation_paths, private_key = await discover_derivation_paths(
+                        seed_phrase, wallet_addresses, private_key_address=sender_address
+                    )
+                    if not private_key:
+                        # кошелек мог быть создан с большим индексом - расширяем gap limit
+                        derivation_paths, private_key = await discover_derivation_paths(
+                            seed_phrase, wallet_addresses, gap_limit=KEY_DISCOVERY_EXTENDED_GAP_LIMIT,
+                            private_key_address=sender_address,
+                        )
+
+                    if derivation_paths:
+                        await update_wallets_derivation_paths(derivation_paths)
 
                     if not private_key:
                         logger.error("Could not get the private_key from this seed phrase")
@@ -208,6 +225,37 @@ async def process_transfer_recipient_address(message: Message, state: FSMContext
         logger.error(f"Error in process_transfer_recipient_address: {error}\n{detailed_error_traceback}")
 
 
+@transfer_router.callback_query(F.data == "callback_button_refresh_tokens", StateFilter(FSMWallet.transfer_token))
+async def process_refresh_sender_tokens(callback: CallbackQuery, state: FSMContext) -> None:
+    """
+        Refreshes the balance snapshot of the sender wallet and updates the token keyboard.
+
+        Args:
+            callback (CallbackQuery): The callback query object.
+            state (FSMContext): The state context for working with chat states.
+
+        Returns:
+            None
+    """
+    try:
+        data = await state.get_data()
+        sender_address = data.get("sender_address")
+        await refresh_portfolios([sender_address])
+        try:
+            await callback.message.edit_reply_markup(
+                reply_markup=await get_token_keyboard(sender_address, lang=callback.from_user.language_code)
+            )
+        except TelegramBadRequest as error:
+            # балансы не изменились
+            if "message is not modified" not in str(error):
+                raise
+        await callback.answer()
+
+    except Exception as error:
+        detailed_error_traceback = traceback.format_exc()
+        logger.error(f"Error in process_refresh_sender_tokens: {error}\n{detailed_error_traceback}")
+
+
 @transfer_router.callback_query(F.data, StateFilter(FSMWallet.transfer_token))
 async def process_choose_sender_token(callback: CallbackQuery, state: FSMContext) -> None:
     try:
@@ -269,6 +317,16 @@ async def process_transfer_amount(message: Message, state: FSMContext) -> None:
         token_type = data.get('token_type')
         sol_balance_text = data.get('sol_balance')
 
+        # Приватный ключ хранится ограниченное время (FSM_SENSITIVE_DATA_TTL), после него запрашиваем ключ заново.
+        if not sender_private_key:
+            await message.answer(TRANSLATION["transfer_sender_private_key_expired"])
+            await message.answer(
+                TRANSLATION["transfer_sender_private_key_prompt"],
+                reply_markup=await get_back_keyboard(lang=message.from_user.language_code)
+            )
+            await state.set_state(FSMWallet.transfer_sender_private_key)
+            return
+
         if not sol_balance_text or not is_valid_amount(sol_balance_text):
             raise ValueError
 
@@ -281,46 +339,41 @@ async def process_transfer_amount(message: Message, state: FSMContext) -> None:
 
         mint = data.get('mint')
 
-        try:
-            # Запрашиваем минимальный баланс для освобождения от аренды.
-            # Аргумент функции - размер данных в байтах, для которых требуется выделить место в памяти.
-            min_sol_balance_resp = await get_min_sol_balance()
-            # Извлекаем значение минимального баланса из ответа. Min balance: 897840lamports/1000000000 = 0.00089784 Sol
-            min_sol_balance = min_sol_balance_resp / LAMPORT_TO_SOL_RATIO
-            logger.debug(f"Token type: {token_type}, SOL balance: {sol_balance}, Min balance: {min_sol_balance}, Spl balance: {spl_balance}, Amount: {amount}")
-
-        except Exception as error:
-            detailed_error_traceback = traceback.format_exc()
-            logger.error(f"Error getting balance or minimum balance: {error}\n{detailed_error_traceback}")
-
-            # Отправляем пользователю сообщение о недостаточном балансе и запрос на ввод суммы для перевода.
-            sent_message = await message.answer(TRANSLATION["insufficient_balance"], reply_markup=None)
-            await asyncio.sleep(1)
-            await message.delete()
-            await sent_message.delete()
+        # Запрашиваем минимальный баланс для освобождения от аренды.
+        # Комиссия за подпись и за приоритет тоже списывается с баланса SOL, поэтому резервируется вместе с ним.
+        compute_unit_limit = SPL_TRANSFER_COMPUTE_UNITS if token_type == 'spl' else SOL_TRANSFER_COMPUTE_UNITS
+        fee_accounts = [Pubkey.from_string(address) for address in (sender_address, recipient_address)]
+        min_sol_balance_resp, fee_lamports, priority_fee_lamports = await asyncio.gather(
+            get_min_sol_balance(),
+            get_lamports_per_signature(),
+            estimate_priority_fee(compute_unit_limit, accounts=fee_accounts),
+        )
+
+        if min_sol_balance_resp is None:
+            # узел недоступен, баланс при этом может быть достаточным
+            await message.answer(TRANSLATION["server_unavailable"])
             await message.answer(
                 TRANSLATION["transfer_amount_prompt"],
                 reply_markup=await get_back_keyboard(lang=message.from_user.language_code)
             )
-            # или
-            # await message.answer(TRANSLATION["insufficient_balance"])
-            # await message.answer(TRANSLATION["transfer_amount_prompt"])
-
-            # Возвращаемся из функции, чтобы предотвратить дальнейшее выполнение кода.
             return None
 
+        # Извлекаем значение минимального баланса из ответа. Min balance: 897840lamports/1000000000 = 0.00089784 Sol
+        min_sol_balance = (min_sol_balance_resp + fee_lamports + priority_fee_lamports) / LAMPORT_TO_SOL_RATIO
+        logger.debug(f"Token type: {token_type}, SOL balance: {sol_balance}, Min balance: {min_sol_balance}, Spl balance: {spl_balance}, Amount: {amount}")
+
         print(f'**** balance={sol_balance}, amount={amount}, min_balance={min_sol_balance}')
         if token_type == 'sol':
             if sol_balance >= amount + min_sol_balance:
-                result = await transfer_sol_token(sender_address, sender_private_key, recipient_address, amount)
-
-                if result:
-                    formatted_amount = '{:.6f}'.format(Decimal(str(amount)))
-                    await message.answer(
-                        TRANSLATION["transfer_successful"].format(amount=formatted_amount, recipient=recipient_address))
-                else:
-                    await message.answer(
-                        TRANSLATION["transfer_not_successful"].format(amount=amount, recipient=recipient_address))
+                # Перевод отправляется и отслеживается в фоне, сообщение о статусе обновится после подтверждения.
+                await submit_transfer(
+                    message,
+                    amount='{:.6f}'.format(Decimal(str(amount))),
+                    token='SOL',
+                    recipient=recipient_address,
+                    send=lambda: send_sol_token(sender_address, sender_private_key, recipient_address, amount),
+                    sender=sender_address,
+                )
 
             else:
                 # Отправляем пользователю сообщение о недостаточном балансе и запрос на ввод суммы для перевода.
@@ -341,22 +394,31 @@ async def process_transfer_amount(message: Message, state: FSMContext) -> None:
         elif token_type == 'spl':
             if (sol_balance >= min_sol_balance) and spl_balance and spl_balance >= amount:
                 token = await get_token(mint_account=mint)
-                if token:
-                    result = await transfer_spl_token(
-                        sender_address=sender_address,
-                        sender_private_key=sender_private_key,
-                        recipient_address=recipient_address,
-                        mint=mint,
-                        amount=amount,
-                        decimals=token.decimals,
+                if not token or token.decimals is None:
+                    # строка токена могла еще не быть создана фоновым обновлением снимков
+                    decimals = await get_token_decimals(mint)
+                    if decimals is not None:
+                        token, _ = await update_or_create_token(mint_account=mint, defaults={'decimals': decimals})
+                if token and token.decimals is not None:
+                    await submit_transfer(
+                        message,
+                        amount='{:.6f}'.format(Decimal(str(amount))),
+                        token=TRANSLATION["spl_token_name"],
+                        recipient=recipient_address,
+                        send=lambda: send_spl_token(
+                            sender_address=sender_address,
+                            sender_private_key=sender_private_key,
+                            recipient_address=recipient_address,
+                            mint=mint,
+                            amount=amount,
+                            decimals=token.decimals,
+                            token_program=token.program or None,
+                        ),
+                        sender=sender_address,
                     )
-                    if result:
-                        formatted_amount = '{:.6f}'.format(Decimal(str(amount)))
-                        await message.answer(
-                            TRANSLATION["transfer_successful"].format(amount=formatted_amount, recipient=recipient_address))
-                    else:
-                        await message.answer(
-                            TRANSLATION["transfer_not_successful"].format(amount=amount, recipient=recipient_address))
+                else:
+                    # decimals токена неизвестны и не получены от узла
+                    await message.answer(TRANSLATION["server_unavailable"])
 
             # Если баланс отправителя недостаточен для перевода (включая минимальный баланс).
             else:
@@ -387,17 +449,3 @@ async def process_transfer_amount(message: Message, state: FSMContext) -> None:
         await message.delete()
         await sent_message.delete()
         await message.answer(TRANSLATION["transfer_amount_prompt"])
-    except solana.rpc.core.RPCException as rpc_exception:
-        # Проверяем, является ли ошибка связанной с недостаточным балансом для аренды.
-        if "InsufficientFundsForRent" in str(rpc_exception):
-            # Отправляем сообщение пользователю о нехватке баланса для аренды.
-            sent_message = await message.answer(TRANSLATION["insufficient_balance_recipient"], reply_markup=None)
-            await asyncio.sleep(1)
-            await message.delete()
-            await sent_message.delete()
-            await message.answer(TRANSLATION["transfer_recipient_address_prompt"])
-            # Устанавливаем состояние transfer_recipient_address для возврата к запросу адреса получателя.
-            await state.set_state(FSMWallet.transfer_recipient_address)
-        else:
-            logger.error(f"Error during token transfer: {rpc_exception}")
-            await message.answer("An error occurred during the token transfer. Please try again later.")
@@ -1,16 +1,18 @@
 import traceback
 
 from aiogram import F, Router
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command, CommandStart, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import default_state
 from aiogram.types import CallbackQuery, Message
 
 from bot.config import SOLANA_NODE_URL
-from bot.keyboards import get_main_keyboard
+from bot.keyboards import get_main_keyboard, get_wallet_keyboard
+from bot.portfolio import refresh_portfolios
 from bot.states import FSMWallet
 from bot.utils import get_translation, update_or_create_user
-from bot.wallet_service import process_wallets_command
+from bot.wallet_service import process_wallets_command, retrieve_user_wallets
 from logger_config import logger
 
 user_router: Router = Router()
@@ -229,3 +231,55 @@ async def process_delete_wallet(callback: CallbackQuery, state: FSMContext) -> N
             None
     """
     await process_wallets_command(callback, state, "delete")
+
+
+@user_router.callback_query(F.data == "callback_button_refresh_balance", StateFilter(default_state))
+async def process_refresh_balance_command(callback: CallbackQuery, state: FSMContext) -> None:
+    """
+        Refreshes the balance snapshots of the user wallets and shows the balance screen again.
+
+        Args:
+            callback (CallbackQuery): CallbackQuery object containing information about the call.
+            state (FSMContext): FSMContext object for working with chat states.
+
+        Returns:
+            None
+    """
+    try:
+        _, user_wallets = await retrieve_user_wallets(callback)
+        await refresh_portfolios([wallet.wallet_address for wallet in user_wallets])
+    except Exception as error:
+        # экран строится из прежних снимков
+        logger.warning(f"Failed to refresh balances of user {callback.from_user.id}: {error!r}")
+    await process_wallets_command(callback, state, "balance")
+
+
+@user_router.callback_query(F.data == "callback_button_refresh_wallets",
+                            StateFilter(FSMWallet.transfer_choose_sender_wallet,
+                                        FSMWallet.choose_transaction_wallet,
+                                        FSMWallet.delete_wallet))
+async def process_refresh_wallets_command(callback: CallbackQuery, state: FSMContext) -> None:
+    """
+        Refreshes the balance snapshots of the user wallets and updates the wallet keyboard.
+
+        Args:
+            callback (CallbackQuery): CallbackQuery object containing information about the call.
+            state (FSMContext): FSMContext object for working with chat states.
+
+        Returns:
+            None
+    """
+    try:
+        _, user_wallets = await retrieve_user_wallets(callback)
+        await refresh_portfolios([wallet.wallet_address for wallet in user_wallets])
+        wallet_keyboard = await get_wallet_keyboard(user_wallets, lang=callback.from_user.language_code)
+        try:
+            await callback.message.edit_reply_markup(reply_markup=wallet_keyboard)
+        except TelegramBadRequest as error:
+            # балансы не изменились
+            if "message is not modified" not in str(error):
+                raise
+        await callback.answer()
+    except Exception as error:
+        detailed_error_traceback = traceback.format_exc()
+        logger.error(f"Error in process_refresh_wallets_command: {error}\n{detailed_error_traceback}")
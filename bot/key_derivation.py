@@ -0,0 +1,183 @@
+"""
+    Key derivation worker service.
+
+    Seed computation (PBKDF2-HMAC-SHA512, 2048 rounds) and BIP32 derivation are CPU-bound, so they run
+    in a process pool instead of the event loop. A job computes the seed once and derives all requested paths.
+    At most KEY_DERIVATION_MAX_PENDING jobs are queued at a time, further callers wait for a free slot.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import mnemonic
+from solders.keypair import Keypair
+
+from bot.config import (KEY_DERIVATION_MAX_PENDING, KEY_DERIVATION_WORKERS,
+                        KEY_DISCOVERY_GAP_LIMIT, KEY_DISCOVERY_MAX_INDEX)
+
+# Путь деривации первого кошелька Solana
+SOLANA_DERIVATION_PATH = "m/44'/501'/0'/0'"
+
+_executor: Optional[ProcessPoolExecutor] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def get_solana_derivation_path(index: int) -> str:
+    """
+        Returns the Solana derivation path of the account with the given index.
+
+        Args:
+            index (int): Account index.
+
+        Returns:
+            str: Derivation path. Ex.: "m/44'/501'/0'/3'"
+    """
+    return f"m/44'/501'/0'/{index}'"
+
+
+def _generate_wallet(strength: int, derivation_path: str) -> Tuple[str, str, str]:
+    mnemo = mnemonic.Mnemonic("english")
+    words = mnemo.generate(strength=strength)
+    seed = mnemo.to_seed(words, passphrase="")
+    keypair = Keypair.from_seed_and_derivation_path(seed, derivation_path)
+    return str(keypair.pubkey()), keypair.secret().hex(), words
+
+
+def _derive_keypairs(seed_phrase: str, derivation_paths: Sequence[str]) -> Dict[str, Tuple[str, str]]:
+    # seed вычисляется один раз для всех путей
+    seed = mnemonic.Mnemonic("english").to_seed(seed_phrase, passphrase="")
+    keypairs = {}
+    for derivation_path in derivation_paths:
+        keypair = Keypair.from_seed_and_derivation_path(seed, derivation_path)
+        keypairs[derivation_path] = (str(keypair.pubkey()), keypair.secret().hex())
+    return keypairs
+
+
+def _discover_derivation_paths(
+        seed_phrase: str,
+        addresses: Sequence[str],
+        gap_limit: int,
+        max_index: int,
+        private_key_address: Optional[str],
+    ) -> Tuple[Dict[str, str], Optional[str]]:
+    seed = mnemonic.Mnemonic("english").to_seed(seed_phrase, passphrase="")
+    addresses = set(addresses)
+    derivation_paths = {}
+    private_key = None
+    last_found_index = -1
+    index = 0
+    # идем по индексам, пока не найдены все адреса или не встретилось gap_limit индексов подряд без совпадений
+    while addresses and index < max_index and index - last_found_index <= gap_limit:
+        derivation_path = get_solana_derivation_path(index)
+        keypair = Keypair.from_seed_and_derivation_path(seed, derivation_path)
+        address = str(keypair.pubkey())
+        if address in addresses:
+            addresses.discard(address)
+            derivation_paths[address] = derivation_path
+            if address == private_key_address:
+                private_key = keypair.secret().hex()
+            last_found_index = index
+        index += 1
+    return derivation_paths, private_key
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: процесс бота многопоточный, fork в таком процессе небезопасен
+        _executor = ProcessPoolExecutor(
+            max_workers=KEY_DERIVATION_WORKERS, mp_context=multiprocessing.get_context('spawn')
+        )
+    return _executor
+
+
+async def _run(function, *args):
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(KEY_DERIVATION_MAX_PENDING)
+    async with _semaphore:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), function, *args)
+
+
+async def generate_wallet(strength: int = 128, derivation_path: str = SOLANA_DERIVATION_PATH) -> Tuple[str, str, str]:
+    """
+        Generates a new seed phrase and derives the wallet from it.
+
+        Args:
+            strength (int): Seed phrase strength: 128 for 12 words, 256 for 24 words.
+            derivation_path (str): Derivation path of the wallet.
+
+        Returns:
+            Tuple[str, str, str]: Wallet address, private key and seed phrase.
+    """
+    return await _run(_generate_wallet, strength, derivation_path)
+
+
+async def derive_keypairs(seed_phrase: str, derivation_paths: List[str]) -> Dict[str, Tuple[str, str]]:
+    """
+        Derives the wallets of the seed phrase for all derivation paths in one job.
+
+        Args:
+            seed_phrase (str): Seed phrase.
+            derivation_paths (List[str]): Derivation paths.
+
+        Returns:
+            Dict[str, Tuple[str, str]]: Wallet address and private key keyed by derivation path,
+                in the order of derivation_paths.
+    """
+    return await _run(_derive_keypairs, seed_phrase, list(derivation_paths))
+
+
+async def discover_derivation_paths(
+        seed_phrase: str,
+        addresses: List[str],
+        gap_limit: int = KEY_DISCOVERY_GAP_LIMIT,
+        max_index: int = KEY_DISCOVERY_MAX_INDEX,
+        private_key_address: Optional[str] = None,
+    ) -> Tuple[Dict[str, str], Optional[str]]:
+    """
+        Finds the derivation paths of the given wallets of the seed phrase in one job.
+
+        Accounts m/44'/501'/0'/{i}' are derived from index 0 until all addresses are found
+        or gap_limit indexes in a row have no match (BIP44 gap limit).
+
+        Args:
+            seed_phrase (str): Seed phrase.
+            addresses (List[str]): Wallet addresses to look for.
+            gap_limit (int): Number of indexes in a row without a match after which the search stops.
+                Pass a bigger value to look further if a wallet was not found.
+            max_index (int): Index at which the search stops anyway.
+            private_key_address (str | None): Wallet address whose private key is returned if it is found,
+                so the caller does not derive it again.
+
+        Returns:
+            Tuple[Dict[str, str], str | None]: Derivation path keyed by wallet address, only for the found addresses,
+                and the private key of private_key_address, None if it was not found.
+    """
+    return await _run(
+        _discover_derivation_paths, seed_phrase, list(addresses), gap_limit, max_index, private_key_address
+    )
+
+
+async def start_key_derivation() -> None:
+    """
+        Starts the key derivation process pool. Registered as Dispatcher startup handler.
+
+        Returns:
+            None
+    """
+    _get_executor()
+
+
+async def close_key_derivation() -> None:
+    """
+        Stops the key derivation process pool. Registered as Dispatcher shutdown handler.
+
+        Returns:
+            None
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -4,10 +4,10 @@ import traceback
 from typing import Dict, List
 
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from spl.token.constants import TOKEN_2022_PROGRAM_ID
 
-from bot.services import get_sol_balance, get_spl_token_data, is_valid_wallet_address
-from bot.utils import get_translation, update_or_create_token
+from bot.config import LAMPORT_TO_SOL_RATIO
+from bot.portfolio import get_portfolios
+from bot.utils import get_translation
 from logger_config import logger
 from web.applications.wallet.models import Wallet
 
@@ -45,6 +45,19 @@ async def get_back_keyboard(lang: str) -> InlineKeyboardMarkup:
     return back_keyboard
 
 
+async def get_balance_keyboard(lang: str) -> InlineKeyboardMarkup:
+    """
+        Function for creating the main keyboard with the button that refreshes the balances.
+
+        Returns:
+            InlineKeyboardMarkup: The keyboard shown under the balance screen.
+    """
+    TRANSLATION = await get_translation(lang=lang)
+    main_keyboard = await get_main_keyboard(lang=lang)
+    refresh_button = InlineKeyboardButton(text=TRANSLATION["button_refresh"], callback_data="callback_button_refresh_balance")
+    return InlineKeyboardMarkup(inline_keyboard=[[refresh_button]] + main_keyboard.inline_keyboard)
+
+
 async def get_wallet_keyboard(user_wallets: List[Wallet], lang: str) -> InlineKeyboardMarkup:
     """
         Function for creating a keyboard with user wallets.
@@ -60,8 +73,11 @@ async def get_wallet_keyboard(user_wallets: List[Wallet], lang: str) -> InlineKe
 
     TRANSLATION = await get_translation(lang=lang)
 
+    # Балансы из снимков, без запросов к блокчейну
+    portfolios = await get_portfolios([wallet.wallet_address for wallet in user_wallets])
+
     for i, wallet in enumerate(user_wallets, start=1):
-        balance = await get_sol_balance(wallet.wallet_address)
+        balance = portfolios[wallet.wallet_address].lamports / LAMPORT_TO_SOL_RATIO
 
         wallet_info = TRANSLATION["wallet_info_template"].format(
             number=i,
@@ -79,11 +95,17 @@ async def get_wallet_keyboard(user_wallets: List[Wallet], lang: str) -> InlineKe
 
         wallet_buttons.append([wallet_button])
 
+    refresh_button = InlineKeyboardButton(
+        text=TRANSLATION["button_refresh"],
+        callback_data="callback_button_refresh_wallets",
+    )
+
     return_to_main_menu_button = InlineKeyboardButton(
         text=TRANSLATION["button_back"],
         callback_data="callback_button_back",
     )
 
+    wallet_buttons.append([refresh_button])
     wallet_buttons.append([return_to_main_menu_button])
 
     wallet_keyboard = InlineKeyboardMarkup(inline_keyboard=wallet_buttons)
@@ -105,51 +127,30 @@ async def get_token_keyboard(wallet_address: str, lang: str) -> InlineKeyboardMa
 
         token_buttons = []
         TRANSLATION = await get_translation(lang=lang)
-        sol_balance = await get_sol_balance(wallet_address)
+        # Балансы из снимка кошелька, без запросов к блокчейну
+        portfolio = (await get_portfolios([wallet_address]))[wallet_address]
+        sol_balance = portfolio.lamports / LAMPORT_TO_SOL_RATIO
         sol_token_info = TRANSLATION["token_info_template"].format(name='Solana', symbol='SOL', amount=sol_balance)
         sol_token_button = InlineKeyboardButton(text=sol_token_info, callback_data=f"sol_{sol_balance}")
         token_buttons.append([sol_token_button])
 
-        spl_token_list = await get_spl_token_data(wallet_address, program_id=TOKEN_2022_PROGRAM_ID)
-
-        for spl_token in spl_token_list:
-
-            if spl_token:
-                defaults = {}
-
-                if 'metadata' in spl_token:
-                    if 'name' in spl_token['metadata']:
-                        defaults['name'] = spl_token['metadata']['name']
-                    if 'symbol' in spl_token['metadata']:
-                        defaults['symbol'] = spl_token['metadata']['symbol']
-                    if 'uri' in spl_token['metadata']:
-                        defaults['metadata_uri'] = spl_token['metadata']['uri']
-                    if 'raw' in spl_token['metadata']:
-                        defaults['raw_metadata'] = spl_token['metadata']['raw']
+        for token in portfolio.tokens:
+            spl_balance = token['amount']
+            spl_token_info = TRANSLATION["token_info_template"].format(name=token['name'], symbol=token['symbol'], amount=spl_balance)
 
-                if 'amount' in spl_token:
-                    if 'uiAmount' in spl_token['amount']:
-                        spl_balance = spl_token['amount']['uiAmount']
-                        defaults['decimals'] = spl_token['amount']['decimals']
+            spl_token_button = InlineKeyboardButton(
+                text=spl_token_info,
+                callback_data=f'spl_{sol_balance}_{spl_balance}_{token["mint"]}',
+            )
 
-                if 'state' in spl_token:
-                    defaults['state'] = spl_token['state']
+            token_buttons.append([spl_token_button])
 
-                if 'raw' in spl_token:
-                    defaults['raw_metadata'] = spl_token['raw']
-
-                if 'mint' in spl_token and is_valid_wallet_address(spl_token['mint']):
-                    token, created = await update_or_create_token(mint_account=spl_token['mint'], defaults=defaults)
-
-                if token:
-                    spl_token_info = TRANSLATION["token_info_template"].format(name=defaults['name'], symbol=defaults['symbol'], amount=spl_balance)
-
-                    spl_token_button = InlineKeyboardButton(
-                        text=spl_token_info,
-                        callback_data=f'spl_{sol_balance}_{spl_balance}_{token.mint_account}',
-                    )
+        refresh_button = InlineKeyboardButton(
+            text=TRANSLATION["button_refresh"],
+            callback_data="callback_button_refresh_tokens",
+        )
 
-                    token_buttons.append([spl_token_button])
+        token_buttons.append([refresh_button])
 
         return_to_main_menu_button = InlineKeyboardButton(
             text=TRANSLATION["button_back"],
@@ -0,0 +1,186 @@
+import asyncio
+import json
+from typing import Dict
+
+import httpx
+
+from bot.cache import TTLCache
+from bot.config import (METADATA_FETCH_ATTEMPTS,
+                        METADATA_FETCH_HOST_CONCURRENCY,
+                        METADATA_FETCH_MAX_BYTES, METADATA_FETCH_TIME_BUDGET,
+                        METADATA_FETCH_TIMEOUT)
+from logger_config import logger
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36"
+
+# Коды ответа, при которых есть смысл повторить запрос
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+_client: httpx.AsyncClient | None = None
+_host_semaphores: Dict[str, asyncio.Semaphore] = {}
+# ETag / Last-Modified и тело последнего ответа для условных запросов
+_validators_cache = TTLCache(max_size=1000, ttl=24 * 60 * 60)
+
+
+class MetadataFetchError(Exception):
+    """
+        Raised when the metadata can not be fetched from the uri.
+
+        Attributes:
+            retryable (bool): Whether the request may succeed if it is repeated.
+    """
+
+    def __init__(self, message: str, retryable: bool = False) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def get_metadata_http_client() -> httpx.AsyncClient:
+    """
+        Returns the shared HTTP client for off-chain metadata requests.
+
+        Returns:
+            httpx.AsyncClient: HTTP client.
+    """
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(METADATA_FETCH_TIMEOUT),
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=10),
+            headers={"User-Agent": USER_AGENT},
+            follow_redirects=True,
+        )
+    return _client
+
+
+def _get_host_semaphore(host: str) -> asyncio.Semaphore:
+    semaphore = _host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(METADATA_FETCH_HOST_CONCURRENCY)
+        _host_semaphores[host] = semaphore
+    return semaphore
+
+
+async def _fetch_once(uri: str) -> Dict:
+    """
+        Makes a single conditional GET request and parses the JSON body.
+
+        Args:
+            uri (str): Metadata uri.
+
+        Returns:
+            Dict: Parsed metadata.
+
+        Raises:
+            MetadataFetchError: If the response is invalid, too large or has an error status.
+    """
+    try:
+        url = httpx.URL(uri)
+    except httpx.InvalidURL as error:
+        raise MetadataFetchError(f"Invalid metadata uri: {error}")
+    if url.scheme not in ("http", "https"):
+        raise MetadataFetchError(f"Unsupported metadata uri scheme: {url.scheme}")
+
+    headers = {}
+    cached = _validators_cache.get(uri)
+    if cached:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    async with _get_host_semaphore(url.host):
+        async with get_metadata_http_client().stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and cached:
+                return cached['metadata']
+
+            if response.status_code != 200:
+                raise MetadataFetchError(
+                    f"Metadata uri responded with status {response.status_code}",
+                    retryable=response.status_code in RETRYABLE_STATUS_CODES,
+                )
+
+            content_length = response.headers.get('Content-Length')
+            if content_length and content_length.isdigit() and int(content_length) > METADATA_FETCH_MAX_BYTES:
+                raise MetadataFetchError(f"Metadata is too large: {content_length} bytes")
+
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) > METADATA_FETCH_MAX_BYTES:
+                    raise MetadataFetchError(f"Metadata is larger than {METADATA_FETCH_MAX_BYTES} bytes")
+
+    try:
+        metadata = json.loads(body)
+    except ValueError as error:
+        raise MetadataFetchError(f"Metadata is not valid JSON: {error}")
+
+    if not isinstance(metadata, dict):
+        raise MetadataFetchError("Metadata is not a JSON object")
+
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if etag or last_modified:
+        _validators_cache.set(uri, {'etag': etag, 'last_modified': last_modified, 'metadata': metadata})
+
+    return metadata
+
+
+async def fetch_metadata_json(uri: str) -> Dict:
+    """
+        Fetches the off-chain token metadata JSON without blocking the event loop.
+
+        The whole call, including waiting for a free slot of the host and retries,
+        is limited by METADATA_FETCH_TIME_BUDGET seconds.
+
+        Args:
+            uri (str): Metadata uri.
+
+        Returns:
+            Dict: Parsed metadata or an empty dict if it could not be fetched.
+    """
+    try:
+        async with asyncio.timeout(METADATA_FETCH_TIME_BUDGET):
+            for attempt in range(METADATA_FETCH_ATTEMPTS):
+                try:
+                    return await _fetch_once(uri)
+                except (MetadataFetchError, httpx.HTTPError, httpx.InvalidURL) as error:
+                    # TooManyRedirects, DecodingError, InvalidURL и редирект на неподдерживаемую схему не повторяются
+                    if isinstance(error, MetadataFetchError):
+                        retryable = error.retryable
+                    else:
+                        retryable = isinstance(error, httpx.TransportError) and \
+                            not isinstance(error, httpx.UnsupportedProtocol)
+                    logger.warning(f"Error fetch metadata uri: {uri}. Error msg.: {error}. "
+                                   f"Attempt {attempt + 1} out of {METADATA_FETCH_ATTEMPTS}.")
+                    if not retryable:
+                        break
+                    if attempt + 1 < METADATA_FETCH_ATTEMPTS:
+                        await asyncio.sleep(0.5 * 2 ** attempt)
+    except TimeoutError:
+        logger.warning(f"Fetch metadata uri: {uri} exceeded the time budget of {METADATA_FETCH_TIME_BUDGET}s.")
+
+    return {}
+
+
+async def start_metadata_fetcher() -> None:
+    """
+        Creates the shared metadata HTTP client. Registered as Dispatcher startup handler.
+
+        Returns:
+            None
+    """
+    get_metadata_http_client()
+
+
+async def close_metadata_fetcher() -> None:
+    """
+        Closes the shared metadata HTTP client. Registered as Dispatcher shutdown handler.
+
+        Returns:
+            None
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
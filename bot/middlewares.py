@@ -0,0 +1,185 @@
+"""
+    Update scheduling middleware.
+
+    Updates of one user in one chat are processed one by one in the order they arrived, so rapid clicks
+    do not race on the same FSMContext. Updates of different users are processed in parallel,
+    at most UPDATE_MAX_CONCURRENT at a time. A user with UPDATE_MAX_PENDING_PER_USER updates already
+    waiting gets the next updates dropped, a dropped callback query is answered with a "busy" notice.
+    The queue metrics are logged every UPDATE_METRICS_LOG_INTERVAL seconds.
+"""
+import asyncio
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from bot.config import UPDATE_MAX_CONCURRENT, UPDATE_MAX_PENDING_PER_USER, UPDATE_METRICS_LOG_INTERVAL
+from bot.utils import get_translation
+from logger_config import logger
+
+_metrics_task: Optional[asyncio.Task] = None
+
+
+@dataclass
+class UpdateSchedulerMetrics:
+    """
+        Update scheduler metrics.
+
+        Attributes:
+            pending (int): Updates waiting or being processed.
+            running (int): Updates being processed.
+            processed (int): Processed updates.
+            dropped (int): Updates dropped because the user's queue was full.
+            max_pending (int): Maximum of pending.
+            max_user_queue_depth (int): Maximum number of pending updates of one user.
+    """
+    pending: int = 0
+    running: int = 0
+    processed: int = 0
+    dropped: int = 0
+    max_pending: int = 0
+    max_user_queue_depth: int = 0
+
+
+@dataclass
+class _UserQueue:
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # обновления пользователя, которые ждут или обрабатываются
+    depth: int = 0
+
+
+class UpdateOrderingMiddleware(BaseMiddleware):
+    """
+        Outer update middleware that serializes updates per chat and user and limits concurrency.
+
+        Attributes:
+            max_pending_per_user (int): Maximum number of pending updates of one user.
+            metrics (UpdateSchedulerMetrics): Queue metrics.
+    """
+
+    def __init__(
+            self,
+            max_concurrent: int = UPDATE_MAX_CONCURRENT,
+            max_pending_per_user: int = UPDATE_MAX_PENDING_PER_USER,
+        ) -> None:
+        self.max_pending_per_user = max_pending_per_user
+        self.metrics = UpdateSchedulerMetrics()
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._queues: Dict[Tuple[Optional[int], Optional[int]], _UserQueue] = {}
+
+    def queue_depth(self, chat_id: Optional[int], user_id: Optional[int]) -> int:
+        queue = self._queues.get((chat_id, user_id))
+        return queue.depth if queue else 0
+
+    async def _answer_dropped(self, event: TelegramObject, data: Dict[str, Any]) -> None:
+        # без ответа на callback запрос кнопка у пользователя остается в состоянии загрузки
+        if not isinstance(event, Update) or event.callback_query is None:
+            return
+        user = data.get('event_from_user')
+        TRANSLATION = await get_translation(lang=user.language_code if user else None)
+        try:
+            await data['bot'].answer_callback_query(event.callback_query.id, text=TRANSLATION["update_busy"])
+        except Exception as error:
+            logger.warning(f"Failed to answer dropped callback query: {error!r}")
+
+    async def _run(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+        ) -> Any:
+        async with self._semaphore:
+            self.metrics.running += 1
+            try:
+                return await handler(event, data)
+            finally:
+                self.metrics.running -= 1
+                self.metrics.processed += 1
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+        ) -> Any:
+        # чат и пользователь определяются UserContextMiddleware диспетчера
+        chat = data.get('event_chat')
+        user = data.get('event_from_user')
+        if chat is None and user is None:
+            return await self._run(handler, event, data)
+
+        key = (chat.id if chat else None, user.id if user else None)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = _UserQueue()
+
+        if queue.depth >= self.max_pending_per_user:
+            self.metrics.dropped += 1
+            logger.warning(f"Update dropped: {queue.depth} updates of chat {key[0]}, user {key[1]} are pending")
+            await self._answer_dropped(event, data)
+            return None
+
+        queue.depth += 1
+        self.metrics.pending += 1
+        self.metrics.max_pending = max(self.metrics.max_pending, self.metrics.pending)
+        self.metrics.max_user_queue_depth = max(self.metrics.max_user_queue_depth, queue.depth)
+        try:
+            # блокировка пользователя берется до общего семафора, ожидание своей очереди не занимает общий слот
+            async with queue.lock:
+                return await self._run(handler, event, data)
+        finally:
+            queue.depth -= 1
+            self.metrics.pending -= 1
+            if not queue.depth:
+                self._queues.pop(key, None)
+
+
+update_scheduler = UpdateOrderingMiddleware()
+
+
+def get_update_scheduler_metrics() -> Dict[str, int]:
+    """
+        Returns the update scheduler metrics.
+
+        Returns:
+            Dict[str, int]: Metrics and the number of users with pending updates.
+    """
+    return {**asdict(update_scheduler.metrics), 'users_pending': len(update_scheduler._queues)}
+
+
+async def _metrics_loop() -> None:
+    last_metrics = None
+    while True:
+        await asyncio.sleep(UPDATE_METRICS_LOG_INTERVAL)
+        metrics = get_update_scheduler_metrics()
+        # без новых обновлений метрики не меняются, повторять их в логе не нужно
+        if metrics != last_metrics:
+            logger.info(f"Update scheduler metrics: {metrics}")
+            last_metrics = metrics
+
+
+async def start_update_scheduler() -> None:
+    """
+        Starts the periodic logging of the update scheduler metrics. Registered as Dispatcher startup handler.
+
+        Returns:
+            None
+    """
+    global _metrics_task
+    if _metrics_task is None and UPDATE_METRICS_LOG_INTERVAL:
+        _metrics_task = asyncio.create_task(_metrics_loop())
+
+
+async def close_update_scheduler() -> None:
+    """
+        Stops the metrics logging and logs the update scheduler metrics. Registered as Dispatcher shutdown handler.
+
+        Returns:
+            None
+    """
+    global _metrics_task
+    if _metrics_task is not None:
+        _metrics_task.cancel()
+        _metrics_task = None
+    logger.info(f"Update scheduler metrics: {get_update_scheduler_metrics()}")
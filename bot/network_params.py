@@ -0,0 +1,164 @@
+"""
+    Cache of slow-moving network parameters shared by all handlers.
+
+    Rent-exemption minimums and the signature fee change only with protocol upgrades, which are activated
+    at epoch boundaries. A background task checks the epoch every NETWORK_PARAMS_CHECK_INTERVAL seconds
+    and refreshes the parameters when the epoch changes or NETWORK_PARAMS_MAX_AGE has passed,
+    so handlers get the values without an RPC round trip.
+"""
+import asyncio
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from solders.message import Message
+from solders.pubkey import Pubkey
+from solders.system_program import TransferParams, transfer
+
+from bot.blockhash_service import get_recent_blockhash
+from bot.config import NETWORK_PARAMS_CHECK_INTERVAL, NETWORK_PARAMS_MAX_AGE
+from bot.retry import call_rpc
+from logger_config import logger
+
+# Размеры аккаунтов в байтах
+SYSTEM_ACCOUNT_SIZE = 0
+MINT_ACCOUNT_SIZE = 82
+TOKEN_ACCOUNT_SIZE = 165
+# Размеры, для которых минимальный баланс запрашивается заранее (1 - get_min_sol_balance)
+PREFETCHED_ACCOUNT_SIZES = (SYSTEM_ACCOUNT_SIZE, 1, MINT_ACCOUNT_SIZE, TOKEN_ACCOUNT_SIZE)
+# Базовая комиссия за подпись, если узел ее не вернул
+DEFAULT_LAMPORTS_PER_SIGNATURE = 5_000
+
+
+@dataclass
+class NetworkParams:
+    """
+        Cached network parameters.
+
+        Attributes:
+            rent_exemption (Dict[int, int]): Minimum balance in lamports for rent exemption keyed by account size.
+            lamports_per_signature (int | None): Base transaction fee per signature in lamports.
+            epoch (int | None): Epoch in which the parameters were fetched.
+            updated (float): time.monotonic() of the last refresh, 0 - never refreshed.
+    """
+    rent_exemption: Dict[int, int] = field(default_factory=dict)
+    lamports_per_signature: Optional[int] = None
+    epoch: Optional[int] = None
+    updated: float = 0.0
+
+
+_network_params = NetworkParams()
+_refresh_task: Optional[asyncio.Task] = None
+
+
+async def _fetch_rent_exemption(size: int) -> int:
+    return (await call_rpc(
+        lambda client: client.get_minimum_balance_for_rent_exemption(size),
+        f"get_minimum_balance_for_rent_exemption {size}",
+    )).value
+
+
+async def _fetch_lamports_per_signature() -> Optional[int]:
+    # комиссия считается узлом для сообщения с одной подписью
+    payer = Pubkey.new_unique()
+    blockhash = (await get_recent_blockhash()).blockhash
+    message = Message.new_with_blockhash(
+        [transfer(TransferParams(from_pubkey=payer, to_pubkey=Pubkey.new_unique(), lamports=1))], payer, blockhash
+    )
+    return (await call_rpc(lambda client: client.get_fee_for_message(message), "get_fee_for_message")).value
+
+
+async def _fetch_epoch() -> int:
+    return (await call_rpc(lambda client: client.get_epoch_info(), "get_epoch_info")).value.epoch
+
+
+async def refresh_network_params() -> None:
+    """
+        Fetches all cached parameters from the blockchain.
+
+        Returns:
+            None
+    """
+    epoch, lamports_per_signature, *rent_exemption = await asyncio.gather(
+        _fetch_epoch(),
+        _fetch_lamports_per_signature(),
+        *[_fetch_rent_exemption(size) for size in PREFETCHED_ACCOUNT_SIZES],
+    )
+    _network_params.rent_exemption.update(zip(PREFETCHED_ACCOUNT_SIZES, rent_exemption))
+    if lamports_per_signature:
+        _network_params.lamports_per_signature = lamports_per_signature
+    _network_params.epoch = epoch
+    _network_params.updated = time.monotonic()
+    logger.debug(f"Network params refreshed: {_network_params}")
+
+
+async def _refresh_loop() -> None:
+    while True:
+        try:
+            is_expired = time.monotonic() - _network_params.updated > NETWORK_PARAMS_MAX_AGE
+            if not _network_params.updated or is_expired or await _fetch_epoch() != _network_params.epoch:
+                await refresh_network_params()
+        except Exception as error:
+            # до успешного обновления параметры запрашиваются при первом обращении
+            detailed_error_traceback = traceback.format_exc()
+            logger.error(f"Failed to refresh network params: {error}\n{detailed_error_traceback}")
+        await asyncio.sleep(NETWORK_PARAMS_CHECK_INTERVAL)
+
+
+async def get_rent_exemption(size: int) -> int:
+    """
+        Returns the minimum balance in lamports for rent exemption of an account.
+
+        Args:
+            size (int): Account data size in bytes.
+
+        Returns:
+            int: Minimum balance in lamports.
+    """
+    rent_exemption = _network_params.rent_exemption.get(size)
+    if rent_exemption is None:
+        rent_exemption = await _fetch_rent_exemption(size)
+        _network_params.rent_exemption[size] = rent_exemption
+    return rent_exemption
+
+
+async def get_lamports_per_signature() -> int:
+    """
+        Returns the base transaction fee per signature in lamports.
+        If the fee was never fetched and the node does not return it, DEFAULT_LAMPORTS_PER_SIGNATURE is returned.
+
+        Returns:
+            int: Fee in lamports.
+    """
+    if _network_params.lamports_per_signature is None:
+        try:
+            _network_params.lamports_per_signature = await _fetch_lamports_per_signature()
+        except Exception as error:
+            logger.warning(f"Failed to get lamports per signature: {error!r}")
+    return _network_params.lamports_per_signature or DEFAULT_LAMPORTS_PER_SIGNATURE
+
+
+async def start_network_params() -> None:
+    """
+        Starts the background refresh of the parameters. Registered as Dispatcher startup handler.
+
+        Returns:
+            None
+    """
+    global _refresh_task
+    if _refresh_task is None:
+        _refresh_task = asyncio.create_task(_refresh_loop())
+
+
+async def close_network_params() -> None:
+    """
+        Stops the background refresh. Registered as Dispatcher shutdown handler.
+
+        Returns:
+            None
+    """
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        _refresh_task = None
@@ -0,0 +1,401 @@
+"""
+    Bulk payouts: SOL or SPL token transfers to many recipients.
+
+    Payouts are packed into as few transactions as possible: instructions are added to a transaction
+    while it fits into the packet size (PACKET_DATA_SIZE) and the compute unit limit.
+    The transactions are signed and sent concurrently (PAYOUT_CONCURRENCY at a time),
+    the result of every transaction is reported for each of its recipients.
+"""
+import asyncio
+import csv
+import io
+import traceback
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import spl.token.instructions as spl_token_instructions
+from solana.rpc.types import DataSliceOpts
+from solders.compute_budget import set_compute_unit_limit, set_compute_unit_price
+from solders.instruction import Instruction
+from solders.keypair import Keypair
+from solders.message import Message
+from solders.pubkey import Pubkey
+from solders.system_program import TransferParams, transfer
+from solders.transaction import Transaction
+
+from bot.config import LAMPORT_TO_SOL_RATIO, PAYOUT_CONCURRENCY, PRIORITY_FEE_MAX, PRIORITY_FEE_TIER
+from bot.confirmation import (TransactionExpiredError, TransactionStatusUnknownError,
+                              wait_for_confirmation)
+from bot.retry import call_rpc
+from bot.services import MULTIPLE_ACCOUNTS_LIMIT, broadcast_transaction, get_spl_transfer_accounts
+from bot.transaction_builder import MAX_COMPUTE_UNIT_LIMIT, build_message
+from bot.utils import update_token_program
+from bot.validators import is_valid_amount, is_valid_private_key, is_valid_wallet_address
+from logger_config import logger
+
+# Максимальный размер транзакции в байтах
+PACKET_DATA_SIZE = 1232
+# Оценка вычислительных единиц на одну выплату, точный лимит задается по симуляции
+SOL_TRANSFER_UNITS = 300
+SPL_TRANSFER_UNITS = 10_000
+CREATE_ASSOCIATED_TOKEN_ACCOUNT_UNITS = 40_000
+
+# Статусы выплат
+PAYOUT_CONFIRMED = 'confirmed'
+PAYOUT_FAILED = 'failed'
+PAYOUT_EXPIRED = 'expired'
+PAYOUT_INVALID = 'invalid'
+PAYOUT_UNKNOWN = 'unknown'
+
+
+@dataclass
+class Payout:
+    """
+        Transfer to one recipient.
+
+        Attributes:
+            recipient (str): Recipient's address.
+            amount (Decimal): Amount of tokens.
+    """
+    recipient: str
+    amount: Decimal
+
+
+@dataclass
+class PayoutResult:
+    """
+        Result of the transfer to one recipient.
+
+        Attributes:
+            recipient (str): Recipient's address.
+            amount (str): Amount of tokens as it was given.
+            status (str): confirmed, failed, expired, invalid or unknown (not confirmed within the timeout).
+            signature (str | None): Signature of the transaction with the transfer.
+            error (str | None): Error description.
+    """
+    recipient: str
+    amount: str
+    status: str
+    signature: Optional[str] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class _PayoutInstructions:
+    payout: Payout
+    instructions: List[Instruction]
+    units: int
+
+
+def validate_payouts(rows: Iterable[Tuple[str, str]]) -> Tuple[List[Payout], List[PayoutResult]]:
+    """
+        Validates (recipient, amount) pairs.
+
+        Args:
+            rows (Iterable[Tuple[str, str]]): Recipient's address and amount pairs.
+
+        Returns:
+            Tuple[List[Payout], List[PayoutResult]]: Valid payouts and the results with status invalid
+                for the rest of the rows.
+    """
+    payouts = []
+    invalid = []
+    for recipient, amount in rows:
+        recipient, amount = str(recipient).strip(), str(amount).strip().replace(',', '.')
+        if not is_valid_wallet_address(recipient):
+            invalid.append(PayoutResult(recipient, amount, PAYOUT_INVALID, error="Invalid recipient address"))
+            continue
+        try:
+            if not is_valid_amount(amount) or Decimal(amount) <= 0:
+                raise ValueError
+        except (ValueError, InvalidOperation):
+            invalid.append(PayoutResult(recipient, amount, PAYOUT_INVALID, error="Invalid amount"))
+            continue
+        payouts.append(Payout(recipient, Decimal(amount)))
+    return payouts, invalid
+
+
+def parse_payouts_csv(text: str) -> Tuple[List[Payout], List[PayoutResult]]:
+    """
+        Parses payouts from CSV: recipient,amount per line. Header and empty lines are skipped.
+
+        Args:
+            text (str): CSV text. Ex.: "recipient,amount\\n9xQe...,0.5\\n"
+
+        Returns:
+            Tuple[List[Payout], List[PayoutResult]]: Valid payouts and the results with status invalid
+                for the rest of the rows.
+    """
+    rows = []
+    invalid = []
+    for line_number, row in enumerate(csv.reader(io.StringIO(text.strip())), start=1):
+        row = [cell.strip() for cell in row]
+        if not any(row):
+            continue
+        if line_number == 1 and not is_valid_wallet_address(row[0]):
+            # заголовок
+            continue
+        if len(row) != 2:
+            invalid.append(PayoutResult(row[0], ','.join(row[1:]), PAYOUT_INVALID, error=f"Line {line_number}: expected 2 columns"))
+            continue
+        rows.append((row[0], row[1]))
+
+    payouts, invalid_rows = validate_payouts(rows)
+    return payouts, invalid + invalid_rows
+
+
+def payout_results_to_csv(results: List[PayoutResult]) -> str:
+    """
+        Returns the payout results as CSV.
+
+        Args:
+            results (List[PayoutResult]): Payout results.
+
+        Returns:
+            str: CSV with recipient,amount,status,signature,error columns.
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['recipient', 'amount', 'status', 'signature', 'error'])
+    for result in results:
+        writer.writerow([result.recipient, result.amount, result.status, result.signature or '', result.error or ''])
+    return output.getvalue()
+
+
+def _transaction_size(instructions: List[Instruction], payer: Pubkey) -> int:
+    # размер с инструкциями лимита и цены вычислительных единиц, которые добавит build_message
+    message = Message(
+        [set_compute_unit_limit(MAX_COMPUTE_UNIT_LIMIT), set_compute_unit_price(PRIORITY_FEE_MAX)] + instructions,
+        payer,
+    )
+    return len(bytes(Transaction.new_unsigned(message)))
+
+
+def pack_payouts(items: List[_PayoutInstructions], payer: Pubkey) -> List[List[_PayoutInstructions]]:
+    """
+        Packs the payouts into transactions within the packet size and the compute unit limit.
+
+        Args:
+            items (List[_PayoutInstructions]): Instructions of every payout.
+            payer (Pubkey): Fee payer.
+
+        Returns:
+            List[List[_PayoutInstructions]]: Payouts of every transaction.
+    """
+    batches = []
+    batch = []
+    instructions = []
+    units = 0
+    for item in items:
+        if batch and (
+            units + item.units > MAX_COMPUTE_UNIT_LIMIT
+            or _transaction_size(instructions + item.instructions, payer) > PACKET_DATA_SIZE
+        ):
+            batches.append(batch)
+            batch, instructions, units = [], [], 0
+        batch.append(item)
+        instructions += item.instructions
+        units += item.units
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _get_sol_instructions(sender: Pubkey, payouts: List[Payout]) -> List[_PayoutInstructions]:
+    return [
+        _PayoutInstructions(
+            payout=payout,
+            instructions=[transfer(TransferParams(
+                from_pubkey=sender,
+                to_pubkey=Pubkey.from_string(payout.recipient),
+                lamports=int(payout.amount * LAMPORT_TO_SOL_RATIO),
+            ))],
+            units=SOL_TRANSFER_UNITS,
+        )
+        for payout in payouts
+    ]
+
+
+def _create_associated_token_account_idempotent(
+        payer: Pubkey, owner: Pubkey, mint: Pubkey, token_program: Pubkey) -> Instruction:
+    # create_idempotent_associated_token_account из spl.token не принимает программу токена (Token-2022),
+    # поэтому берутся аккаунты обычной инструкции создания (без устаревшего sysvar rent)
+    # и код инструкции CreateIdempotent (1)
+    instruction = spl_token_instructions.create_associated_token_account(
+        payer=payer, owner=owner, mint=mint, token_program_id=token_program
+    )
+    return Instruction(instruction.program_id, bytes([1]), instruction.accounts[:6])
+
+
+async def _get_spl_instructions(
+        sender: Pubkey,
+        payouts: List[Payout],
+        mint: Pubkey,
+        decimals: int,
+        token_program: Optional[Pubkey],
+    ) -> List[_PayoutInstructions]:
+    # программа токена и аккаунт отправителя, получатель здесь не нужен
+    cached_token_program = token_program
+    token_program, sender_token_account, _, _ = await get_spl_transfer_accounts(sender, sender, mint, token_program)
+    if token_program != cached_token_program:
+        # как и при обычном переводе, программа сохраняется, чтобы следующие выплаты не повторяли ошибку
+        await update_token_program(str(mint), str(token_program))
+
+    recipient_token_accounts = {
+        payout.recipient: spl_token_instructions.get_associated_token_address(
+            Pubkey.from_string(payout.recipient), mint, token_program
+        )
+        for payout in payouts
+    }
+    # существование связанных аккаунтов получателей проверяется запросами getMultipleAccounts по 100 аккаунтов
+    pubkeys = list(set(recipient_token_accounts.values()))
+    chunks = [pubkeys[i:i + MULTIPLE_ACCOUNTS_LIMIT] for i in range(0, len(pubkeys), MULTIPLE_ACCOUNTS_LIMIT)]
+    responses = await asyncio.gather(*[
+        call_rpc(
+            lambda client, chunk=chunk: client.get_multiple_accounts(chunk, data_slice=DataSliceOpts(offset=0, length=0)),
+            f"get_multiple_accounts of {len(chunk)} recipient token accounts",
+        )
+        for chunk in chunks
+    ])
+    existing_accounts = {
+        pubkey for chunk, response in zip(chunks, responses) for pubkey, account in zip(chunk, response.value) if account
+    }
+
+    items = []
+    for payout in payouts:
+        recipient_token_account = recipient_token_accounts[payout.recipient]
+        instructions = []
+        units = SPL_TRANSFER_UNITS
+        if recipient_token_account not in existing_accounts:
+            # выплаты одному получателю могут попасть в разные пакеты, которые отправляются параллельно,
+            # поэтому аккаунт создается идемпотентно в каждой выплате: первая создает, остальные пропускают
+            instructions.append(_create_associated_token_account_idempotent(
+                payer=sender,
+                owner=Pubkey.from_string(payout.recipient),
+                mint=mint,
+                token_program=token_program,
+            ))
+            units += CREATE_ASSOCIATED_TOKEN_ACCOUNT_UNITS
+        instructions.append(spl_token_instructions.transfer_checked(
+            spl_token_instructions.TransferCheckedParams(
+                program_id=token_program,
+                source=sender_token_account,
+                mint=mint,
+                dest=recipient_token_account,
+                owner=sender,
+                amount=int(payout.amount * 10 ** decimals),
+                decimals=decimals,
+            )
+        ))
+        items.append(_PayoutInstructions(payout=payout, instructions=instructions, units=units))
+    return items
+
+
+async def _send_batch(
+        sender_keypair: Keypair,
+        batch: List[_PayoutInstructions],
+        fee_tier: str,
+        semaphore: asyncio.Semaphore,
+    ) -> List[PayoutResult]:
+    signature = None
+    try:
+        async with semaphore:
+            instructions = [instruction for item in batch for instruction in item.instructions]
+            message = await build_message(instructions, [sender_keypair], tier=fee_tier)
+            try:
+                response, last_valid_block_height = await broadcast_transaction(
+                    [sender_keypair], message, f"send_payouts batch of {len(batch)} transfers"
+                )
+                signature = response.value
+            except TransactionStatusUnknownError as unknown_error:
+                # транзакция могла попасть в сеть, ее статус проверяется по подписи
+                signature, last_valid_block_height = unknown_error.signature, unknown_error.last_valid_block_height
+
+        if await wait_for_confirmation(signature, last_valid_block_height=last_valid_block_height):
+            status, error = PAYOUT_CONFIRMED, None
+        else:
+            status, error = PAYOUT_FAILED, "Transaction failed"
+    except TransactionExpiredError as expired_error:
+        status, error = PAYOUT_EXPIRED, str(expired_error)
+    except TimeoutError:
+        status, error = PAYOUT_UNKNOWN, "Transaction was not confirmed within the timeout"
+    except Exception as send_error:
+        detailed_error_traceback = traceback.format_exc()
+        logger.error(f"Failed to send payouts batch: {send_error}\n{detailed_error_traceback}")
+        status, error = PAYOUT_FAILED, str(send_error)
+
+    return [
+        PayoutResult(
+            recipient=item.payout.recipient,
+            amount=str(item.payout.amount),
+            status=status,
+            signature=str(signature) if signature else None,
+            error=error,
+        )
+        for item in batch
+    ]
+
+
+async def send_payouts(
+        sender_private_key: str,
+        payouts: List[Payout],
+        mint: Optional[str] = None,
+        decimals: Optional[int] = None,
+        token_program: Optional[str] = None,
+        fee_tier: str = PRIORITY_FEE_TIER,
+    ) -> List[PayoutResult]:
+    """
+        Sends SOL or SPL token payouts packed into as few transactions as possible.
+
+        Args:
+            sender_private_key (str): Sender's private key.
+            payouts (List[Payout]): Validated payouts, see validate_payouts and parse_payouts_csv.
+            mint (str | None): Token mint address, None for SOL payouts.
+            decimals (int | None): Token decimals, required for SPL payouts.
+            token_program (str | None): Cached token program id (Token.program).
+            fee_tier (str): Priority fee tier: economy, normal or fast.
+
+        Raises:
+            ValueError: If the private key, the mint or the decimals are invalid.
+
+        Returns:
+            List[PayoutResult]: Result for every payout in the order of payouts.
+    """
+    if not is_valid_private_key(sender_private_key):
+        raise ValueError("Invalid sender private key")
+
+    if mint is not None and (not is_valid_wallet_address(mint) or decimals is None):
+        raise ValueError("Invalid mint or decimals")
+
+    if not payouts:
+        return []
+
+    sender_keypair = Keypair.from_seed(bytes.fromhex(sender_private_key))
+    sender = sender_keypair.pubkey()
+
+    if mint is None:
+        items = _get_sol_instructions(sender, payouts)
+    else:
+        items = await _get_spl_instructions(
+            sender,
+            payouts,
+            Pubkey.from_string(mint),
+            int(decimals),
+            Pubkey.from_string(token_program) if token_program else None,
+        )
+
+    batches = pack_payouts(items, sender)
+    logger.info(f"Send {len(payouts)} payouts in {len(batches)} transactions")
+
+    semaphore = asyncio.Semaphore(PAYOUT_CONCURRENCY)
+    batch_results = await asyncio.gather(*[
+        _send_batch(sender_keypair, batch, fee_tier, semaphore) for batch in batches
+    ])
+
+    # результаты в порядке выплат
+    results: Dict[int, PayoutResult] = {}
+    for batch, results_of_batch in zip(batches, batch_results):
+        for item, result in zip(batch, results_of_batch):
+            results[id(item.payout)] = result
+    return [results[id(payout)] for payout in payouts]
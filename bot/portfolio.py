@@ -0,0 +1,223 @@
+"""
+    Portfolio snapshots: SOL and token balances of the wallets stored in the WalletBalance model.
+
+    A background task refreshes the snapshots of all wallets that have an owner every PORTFOLIO_REFRESH_INTERVAL
+    seconds in batches of PORTFOLIO_REFRESH_BATCH_SIZE wallets: SOL balances of a batch are read with
+    getMultipleAccounts, token balances with at most PORTFOLIO_REFRESH_CONCURRENCY concurrent requests.
+    The balance screen and the keyboards are built from the snapshots without RPC requests, so the RPC load
+    depends on the number of wallets, not on the number of clicks. The user refreshes the snapshots with the
+    "refresh" button, the transfer tracker refreshes them after a transfer is finalized.
+"""
+import asyncio
+import traceback
+from typing import Dict, List, Optional, Set
+
+from django.utils import timezone
+from spl.token.constants import TOKEN_2022_PROGRAM_ID
+
+from bot.config import (PORTFOLIO_REFRESH_BATCH_SIZE, PORTFOLIO_REFRESH_CONCURRENCY,
+                        PORTFOLIO_REFRESH_INTERVAL)
+from bot.services import get_sol_balances_with_slot, get_spl_token_data, is_valid_wallet_address
+from bot.utils import (get_owned_wallet_addresses, get_wallet_balances,
+                       save_wallet_balances, update_or_create_token)
+from logger_config import logger
+from web.applications.wallet.models import WalletBalance
+
+_refresh_task: Optional[asyncio.Task] = None
+_token_semaphore: Optional[asyncio.Semaphore] = None
+# Обновления снимков, которые выполняются сейчас, по адресу кошелька
+_in_flight: Dict[str, asyncio.Task] = {}
+# Токены, уже сохраненные в таблицу Token этим процессом
+_saved_mints: Set[str] = set()
+
+
+async def _save_token(spl_token: Dict, defaults: Dict) -> None:
+    defaults = dict(defaults)
+    metadata = spl_token.get('metadata', {})
+    if 'uri' in metadata:
+        defaults['metadata_uri'] = metadata['uri']
+    if 'raw' in metadata:
+        defaults['raw_metadata'] = metadata['raw']
+    if 'state' in spl_token:
+        defaults['state'] = spl_token['state']
+    # Токены запрашиваются по программе Token-2022, она и есть программа токена
+    defaults['program'] = str(TOKEN_2022_PROGRAM_ID)
+    await update_or_create_token(mint_account=spl_token['mint'], defaults=defaults)
+    _saved_mints.add(spl_token['mint'])
+
+
+async def _fetch_tokens(wallet_address: str) -> Optional[List[Dict]]:
+    global _token_semaphore
+    if _token_semaphore is None:
+        _token_semaphore = asyncio.Semaphore(PORTFOLIO_REFRESH_CONCURRENCY)
+
+    async with _token_semaphore:
+        try:
+            spl_tokens = await get_spl_token_data(wallet_address, program_id=TOKEN_2022_PROGRAM_ID)
+        except Exception as error:
+            logger.warning(f"Failed to get token balances of wallet {wallet_address}: {error!r}")
+            return None
+
+    tokens = []
+    for spl_token in spl_tokens:
+        if not spl_token or not spl_token.get('mint') or not is_valid_wallet_address(spl_token['mint']):
+            continue
+        metadata = spl_token.get('metadata', {})
+        amount = spl_token.get('amount', {})
+        token = {
+            'mint': spl_token['mint'],
+            'name': metadata.get('name', ''),
+            'symbol': metadata.get('symbol', ''),
+            'amount': amount.get('uiAmount'),
+            'decimals': amount.get('decimals'),
+        }
+        if token['mint'] not in _saved_mints:
+            # decimals и метаданные нужны обработчику перевода
+            defaults = {'name': token['name'], 'symbol': token['symbol']}
+            if token['decimals'] is not None:
+                defaults['decimals'] = token['decimals']
+            try:
+                await _save_token(spl_token, defaults)
+            except Exception as error:
+                # ошибка сохранения одного токена не должна оставлять без снимка весь пакет кошельков
+                logger.warning(f"Failed to save token {token['mint']}: {error!r}")
+        tokens.append(token)
+    return tokens
+
+
+async def _refresh_batch(wallet_addresses: List[str]) -> Dict[str, WalletBalance]:
+    # снимки хранятся только для кошельков из бд, балансы других адресов не запрашиваются
+    wallet_addresses = await get_owned_wallet_addresses(wallet_addresses)
+    if not wallet_addresses:
+        return {}
+
+    (balances, slot), tokens = await asyncio.gather(
+        get_sol_balances_with_slot(wallet_addresses),
+        asyncio.gather(*[_fetch_tokens(address) for address in wallet_addresses]),
+    )
+    updated = timezone.now()
+    snapshots = await save_wallet_balances({
+        address: {
+            'lamports': balances[address],
+            'slot': slot,
+            'updated': updated,
+            'tokens': wallet_tokens or [],
+            'tokens_updated': updated if wallet_tokens is not None else None,
+        }
+        for address, wallet_tokens in zip(wallet_addresses, tokens)
+    })
+    logger.debug(f"Portfolio snapshots of {len(snapshots)} wallets refreshed at slot {slot}")
+    return snapshots
+
+
+async def refresh_portfolios(wallet_addresses: List[str]) -> Dict[str, WalletBalance]:
+    """
+        Reads the balances of the wallets from the blockchain and saves their snapshots.
+        A wallet that is already being refreshed is not requested again, its refresh is awaited.
+
+        Args:
+            wallet_addresses (List[str]): Wallet addresses, addresses missing in the database are ignored.
+
+        Raises:
+            Exception: If the SOL balances could not be fetched.
+
+        Returns:
+            Dict[str, WalletBalance]: Fresh snapshots keyed by wallet address.
+    """
+    wallet_addresses = list(dict.fromkeys(wallet_addresses))
+    new_addresses = [address for address in wallet_addresses if address not in _in_flight]
+    if new_addresses:
+        task = asyncio.create_task(_refresh_batch(new_addresses))
+        for address in new_addresses:
+            _in_flight[address] = task
+
+        def forget(task: asyncio.Task) -> None:
+            for address in new_addresses:
+                if _in_flight.get(address) is task:
+                    del _in_flight[address]
+        task.add_done_callback(forget)
+
+    snapshots = {}
+    # shield: отмена одного ожидающего не отменяет общее обновление
+    for batch_snapshots in await asyncio.gather(
+            *[asyncio.shield(task) for task in {_in_flight[address] for address in wallet_addresses}]):
+        snapshots.update(batch_snapshots)
+    return {address: snapshots[address] for address in wallet_addresses if address in snapshots}
+
+
+async def get_portfolios(wallet_addresses: List[str]) -> Dict[str, WalletBalance]:
+    """
+        Returns the stored snapshots of the wallets. Wallets without a snapshot are refreshed first.
+
+        Args:
+            wallet_addresses (List[str]): Wallet addresses.
+
+        Raises:
+            Exception: If a missing snapshot could not be fetched.
+
+        Returns:
+            Dict[str, WalletBalance]: Snapshots keyed by wallet address.
+    """
+    snapshots = await get_wallet_balances(wallet_addresses)
+    missing_addresses = [address for address in wallet_addresses if address not in snapshots]
+    if missing_addresses:
+        snapshots.update(await refresh_portfolios(missing_addresses))
+    return snapshots
+
+
+async def refresh_all_portfolios() -> int:
+    """
+        Refreshes the snapshots of all wallets that have an owner, batch by batch.
+
+        Returns:
+            int: Number of refreshed wallets.
+    """
+    wallet_addresses = await get_owned_wallet_addresses()
+    number_refreshed = 0
+    for i in range(0, len(wallet_addresses), PORTFOLIO_REFRESH_BATCH_SIZE):
+        batch = wallet_addresses[i:i + PORTFOLIO_REFRESH_BATCH_SIZE]
+        try:
+            number_refreshed += len(await refresh_portfolios(batch))
+        except Exception as error:
+            # ошибка одного пакета не останавливает обновление остальных
+            logger.warning(f"Failed to refresh portfolio snapshots of {len(batch)} wallets: {error!r}")
+    return number_refreshed
+
+
+async def _refresh_loop() -> None:
+    while True:
+        try:
+            started = asyncio.get_running_loop().time()
+            number_refreshed = await refresh_all_portfolios()
+            logger.debug(f"Portfolio snapshots of {number_refreshed} wallets refreshed "
+                         f"in {asyncio.get_running_loop().time() - started:.1f}s")
+        except Exception as error:
+            detailed_error_traceback = traceback.format_exc()
+            logger.error(f"Failed to refresh portfolio snapshots: {error}\n{detailed_error_traceback}")
+        await asyncio.sleep(PORTFOLIO_REFRESH_INTERVAL)
+
+
+async def start_portfolio_refresher() -> None:
+    """
+        Starts the background refresh of the snapshots. Registered as Dispatcher startup handler.
+
+        Returns:
+            None
+    """
+    global _refresh_task
+    if PORTFOLIO_REFRESH_INTERVAL > 0 and _refresh_task is None:
+        _refresh_task = asyncio.create_task(_refresh_loop())
+
+
+async def close_portfolio_refresher() -> None:
+    """
+        Stops the background refresh of the snapshots. Registered as Dispatcher shutdown handler.
+
+        Returns:
+            None
+    """
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        await asyncio.gather(_refresh_task, return_exceptions=True)
+        _refresh_task = None
@@ -0,0 +1,214 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, Set, TypeVar
+
+import httpx
+from solana.exceptions import SolanaRpcException
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.core import RPCException
+
+from bot.config import (RPC_CALL_DEADLINE, RPC_RETRY_ATTEMPTS,
+                        RPC_RETRY_BASE_DELAY, RPC_RETRY_MAX_DELAY)
+from bot.rpc_client import get_rpc_client
+from bot.rpc_router import CircuitOpenError, get_circuit_breaker, rpc_router
+from logger_config import logger
+
+T = TypeVar("T")
+
+# Коды ответа, при которых запрос можно повторить
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Ошибки, при которых запрос гарантированно не дошел до узла
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+        Retry settings of an RPC call.
+
+        Attributes:
+            attempts (int): Maximum number of attempts.
+            base_delay (float): Delay before the second attempt in seconds, doubled for every next attempt.
+            max_delay (float): Maximum delay between attempts in seconds.
+            deadline (float): Time in seconds for the whole call including all attempts.
+            idempotent (bool): Whether the call may be repeated after an ambiguous failure (read timeout, 5xx).
+                Non-idempotent calls (send_transaction) are repeated only if the request surely did not reach the node.
+    """
+    attempts: int = RPC_RETRY_ATTEMPTS
+    base_delay: float = RPC_RETRY_BASE_DELAY
+    max_delay: float = RPC_RETRY_MAX_DELAY
+    deadline: float = RPC_CALL_DEADLINE
+    idempotent: bool = True
+
+    def backoff(self, attempt: int) -> float:
+        # экспоненциальная задержка с "full jitter"
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+SEND_TRANSACTION_RETRY_POLICY = RetryPolicy(attempts=3, idempotent=False)
+
+
+def _http_error(error: Exception) -> Optional[httpx.HTTPError]:
+    # solana-py оборачивает ошибки httpx в SolanaRpcException
+    if isinstance(error, SolanaRpcException) and isinstance(error.__cause__, httpx.HTTPError):
+        return error.__cause__
+    if isinstance(error, httpx.HTTPError):
+        return error
+    return None
+
+
+def is_retryable_error(error: Exception, idempotent: bool = True) -> bool:
+    """
+        Checks whether the failed RPC call may succeed if it is repeated.
+
+        Args:
+            error (Exception): The raised exception.
+            idempotent (bool): Whether the call may be repeated after an ambiguous failure.
+
+        Returns:
+            bool: True if the call may be repeated, False otherwise.
+    """
+    http_error = _http_error(error)
+    if http_error is None:
+        # ошибки RPC (RPCException), валидации и т.п. повторять бессмысленно
+        return False
+
+    if isinstance(http_error, httpx.HTTPStatusError):
+        status_code = http_error.response.status_code
+        if status_code == 429:
+            # узел отклонил запрос, не обработав его
+            return True
+        return idempotent and status_code in RETRYABLE_STATUS_CODES
+
+    if isinstance(http_error, NOT_SENT_ERRORS):
+        return True
+
+    return idempotent and isinstance(http_error, httpx.TransportError)
+
+
+def is_not_sent_error(error: Exception) -> bool:
+    """
+        Checks whether the failed send_transaction call surely did not broadcast the transaction.
+
+        Args:
+            error (Exception): The raised exception.
+
+        Returns:
+            bool: True if the transaction was not broadcast, False if it may have been.
+    """
+    # узел отклонил транзакцию при проверке (preflight) или запрос до узла не дошел
+    return isinstance(error, (RPCException, CircuitOpenError)) or is_retryable_error(error, idempotent=False)
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+        Returns the delay in seconds from the Retry-After header of the error response.
+
+        Args:
+            error (Exception): The raised exception.
+
+        Returns:
+            float | None: Delay in seconds or None if the header is absent.
+    """
+    http_error = _http_error(error)
+    if not isinstance(http_error, httpx.HTTPStatusError):
+        return None
+
+    retry_after = http_error.response.headers.get('Retry-After')
+    if not retry_after:
+        return None
+
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+async def call_rpc(
+        operation: Callable[[AsyncClient], Awaitable[T]],
+        description: str,
+        policy: RetryPolicy = DEFAULT_RETRY_POLICY,
+        write: bool = False,
+        endpoint: Optional[str] = None,
+    ) -> T:
+    """
+        Calls the RPC operation with the retry policy and the circuit breaker of the endpoint.
+
+        The endpoint is chosen by the RPC router for every attempt: reads go to the fastest healthy endpoint
+        and fail over to another endpoint after a retryable error, writes stay on the pinned endpoint.
+
+        Args:
+            operation (Callable[[AsyncClient], Awaitable[T]]): Coroutine function that makes the RPC request
+                with the given client. Ex.: lambda client: client.get_balance(pubkey)
+            description (str): Description of the call for the log.
+            policy (RetryPolicy): Retry policy.
+            write (bool): Whether the call sends or confirms a transaction and must use the pinned endpoint.
+            endpoint (str | None): RPC endpoint url, if the call must not be routed.
+
+        Returns:
+            T: The result of the operation.
+
+        Raises:
+            CircuitOpenError: If the circuits of all suitable endpoints are open.
+            TimeoutError: If the deadline of the policy is exceeded.
+            Exception: The last error of the operation if it is not retryable or the attempts are exhausted.
+    """
+    deadline = time.monotonic() + policy.deadline
+    # узлы, на которых вызов уже завершился ошибкой
+    failed_endpoints: Set[str] = set()
+
+    async with asyncio.timeout(policy.deadline):
+        for attempt in range(policy.attempts):
+            if endpoint:
+                attempt_endpoint = endpoint
+            elif write:
+                attempt_endpoint = rpc_router.get_write_endpoint(exclude=failed_endpoints)
+            else:
+                attempt_endpoint = rpc_router.select_read_endpoint(exclude=failed_endpoints)
+
+            circuit_breaker = get_circuit_breaker(attempt_endpoint)
+            circuit_breaker.before_call()
+            try:
+                result = await operation(get_rpc_client(attempt_endpoint))
+            except asyncio.CancelledError:
+                # вызов отменен (в том числе по deadline), состояние узла неизвестно
+                circuit_breaker.trial_in_progress = False
+                raise
+            except Exception as error:
+                if is_retryable_error(error):
+                    circuit_breaker.record_failure()
+                    failed_endpoints.add(attempt_endpoint)
+                else:
+                    # узел ответил, значит он доступен
+                    circuit_breaker.record_success()
+
+                if not is_retryable_error(error, policy.idempotent) or attempt + 1 >= policy.attempts:
+                    raise
+
+                delay = get_retry_after(error)
+                if delay is None:
+                    delay = policy.backoff(attempt)
+
+                # на другой, еще не опробованный узел переключаемся без задержки
+                if not endpoint and len(failed_endpoints) < len(rpc_router.endpoints):
+                    delay = 0
+
+                if time.monotonic() + delay >= deadline:
+                    raise
+
+                logger.warning(f"Error when {description} ({attempt_endpoint}): {error!r}. "
+                               f"Attempt {attempt + 1} out of {policy.attempts}, retry in {delay:.2f}s.")
+                await asyncio.sleep(delay)
+            else:
+                circuit_breaker.record_success()
+                return result
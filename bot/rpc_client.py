@@ -0,0 +1,278 @@
+import importlib.util
+import statistics
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Tuple
+
+import httpx
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.core import RPCException
+
+from bot.config import (RPC_HTTP2, RPC_KEEPALIVE_EXPIRY, RPC_MAX_CONNECTIONS,
+                        RPC_MAX_KEEPALIVE_CONNECTIONS, RPC_ROUTER_ERROR_WINDOW,
+                        RPC_ROUTER_WINDOW_SIZE, SOLANA_NODE_URL, SOLANA_NODE_URLS)
+from logger_config import logger
+
+# установить таймаут на чтение ответа 120 секунд, таймаут на соединение 20 секунд
+timeout_settings = httpx.Timeout(read=120.0, connect=20.0, write=None, pool=None)
+
+# Один AsyncClient на каждый RPC узел, общий для всего процесса.
+_clients: Dict[str, AsyncClient] = {}
+# HTTP сессия и адрес узла каждого клиента, для запросов, которых нет в AsyncClient (make_json_rpc_request)
+_sessions: Dict[AsyncClient, Tuple[str, httpx.AsyncClient]] = {}
+# Сессии, которые AsyncClient создал сам и которые заменены на сессии с пулом соединений
+_replaced_sessions: List[httpx.AsyncClient] = []
+
+
+@dataclass
+class EndpointMetrics:
+    """
+        Connection metrics for a single RPC endpoint.
+
+        Attributes:
+            requests (int): Number of HTTP requests sent to the endpoint.
+            errors (int): Number of requests that failed or returned an HTTP error status.
+            connections_opened (int): Number of new TCP connections opened to the endpoint.
+            total_latency (float): Sum of request latencies in seconds.
+            last_status_code (int | None): HTTP status code of the last response.
+            recent_latencies (Deque[float]): Latencies of the last RPC_ROUTER_WINDOW_SIZE requests.
+            recent_errors (Deque[Tuple[float, bool]]): time.monotonic() and outcome of the last
+                RPC_ROUTER_WINDOW_SIZE requests, True - failed.
+    """
+    requests: int = 0
+    errors: int = 0
+    connections_opened: int = 0
+    total_latency: float = 0.0
+    last_status_code: int | None = None
+    recent_latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=RPC_ROUTER_WINDOW_SIZE))
+    recent_errors: Deque[Tuple[float, bool]] = field(default_factory=lambda: deque(maxlen=RPC_ROUTER_WINDOW_SIZE))
+
+    def record(self, latency: float, failed: bool) -> None:
+        self.requests += 1
+        self.total_latency += latency
+        self.recent_latencies.append(latency)
+        self.recent_errors.append((time.monotonic(), failed))
+        if failed:
+            self.errors += 1
+
+    @property
+    def average_latency(self) -> float:
+        return self.total_latency / self.requests if self.requests else 0.0
+
+    def latency_percentile(self, percentile: int) -> float:
+        # Задержка по последним запросам, 0 если запросов еще не было.
+        if len(self.recent_latencies) < 2:
+            return self.recent_latencies[0] if self.recent_latencies else 0.0
+        return statistics.quantiles(self.recent_latencies, n=100, method='inclusive')[percentile - 1]
+
+    @property
+    def p50_latency(self) -> float:
+        return self.latency_percentile(50)
+
+    @property
+    def p99_latency(self) -> float:
+        return self.latency_percentile(99)
+
+    @property
+    def error_rate(self) -> float:
+        # Доля ошибок за последние RPC_ROUTER_ERROR_WINDOW секунд, более старые исходы забываются.
+        expired = time.monotonic() - RPC_ROUTER_ERROR_WINDOW
+        while self.recent_errors and self.recent_errors[0][0] < expired:
+            self.recent_errors.popleft()
+        if not self.recent_errors:
+            return 0.0
+        return sum(failed for _, failed in self.recent_errors) / len(self.recent_errors)
+
+    @property
+    def connection_reuse_ratio(self) -> float:
+        # Доля запросов, которые прошли через уже открытое соединение.
+        if not self.requests:
+            return 0.0
+        return max(self.requests - self.connections_opened, 0) / self.requests
+
+
+_metrics: Dict[str, EndpointMetrics] = {}
+
+
+class MeteredTransport(httpx.AsyncHTTPTransport):
+    """
+        HTTP transport that collects per-endpoint connection metrics.
+    """
+
+    def __init__(self, endpoint: str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.metrics = get_endpoint_metrics(endpoint)
+
+    async def _trace(self, event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self.metrics.connections_opened += 1
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions["trace"] = self._trace
+        started = time.monotonic()
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            self.metrics.record(time.monotonic() - started, failed=True)
+            raise
+
+        self.metrics.record(time.monotonic() - started, failed=response.status_code >= 400)
+        self.metrics.last_status_code = response.status_code
+        return response
+
+
+def _is_http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def _create_client(endpoint: str) -> AsyncClient:
+    """
+        Creates an AsyncClient whose HTTP session uses a kept-alive connection pool.
+
+        Args:
+            endpoint (str): RPC endpoint url.
+
+        Returns:
+            AsyncClient: Solana RPC client.
+    """
+    http2 = RPC_HTTP2 and _is_http2_available()
+    if RPC_HTTP2 and not http2:
+        logger.warning("HTTP/2 is enabled for the RPC client, but the h2 package is not installed. Using HTTP/1.1.")
+
+    limits = httpx.Limits(
+        max_connections=RPC_MAX_CONNECTIONS,
+        max_keepalive_connections=RPC_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=RPC_KEEPALIVE_EXPIRY,
+    )
+
+    client = AsyncClient(endpoint, timeout=timeout_settings)
+    # AsyncClient не принимает httpx сессию, а создает собственную без настроек пула, поэтому она заменяется.
+    # Зависит от solana-py 0.36 (requirements/base.txt): сессия хранится в AsyncHTTPProvider.session.
+    original_session = getattr(client._provider, 'session', None)
+    if not isinstance(original_session, httpx.AsyncClient):
+        raise RuntimeError("Unsupported solana-py version: AsyncClient._provider.session is not an httpx.AsyncClient")
+    session = httpx.AsyncClient(
+        timeout=timeout_settings,
+        transport=MeteredTransport(endpoint, http2=http2, limits=limits),
+    )
+    client._provider.session = session
+    # исходная сессия соединений не открывала, но ее транспорт закрывается вместе с клиентами
+    _replaced_sessions.append(original_session)
+    _sessions[client] = (endpoint, session)
+    return client
+
+
+def get_rpc_client(endpoint: str = SOLANA_NODE_URL) -> AsyncClient:
+    """
+        Returns the shared RPC client for the endpoint.
+
+        The client must not be closed by the caller, it is closed on bot shutdown.
+
+        Args:
+            endpoint (str): RPC endpoint url.
+
+        Returns:
+            AsyncClient: Solana RPC client.
+    """
+    client = _clients.get(endpoint)
+    if client is None:
+        client = _create_client(endpoint)
+        _clients[endpoint] = client
+    return client
+
+
+async def make_json_rpc_request(client: AsyncClient, method: str, params: list) -> Any:
+    """
+        Sends a JSON-RPC request that AsyncClient does not implement (solana-py 0.36),
+        over the connection pool of the shared client.
+
+        Args:
+            client (AsyncClient): Shared client returned by get_rpc_client.
+            method (str): RPC method. Ex.: getRecentPrioritizationFees
+            params (list): Method params.
+
+        Raises:
+            httpx.HTTPError: If the request failed or the endpoint returned an HTTP error.
+            RPCException: If the endpoint returned a JSON-RPC error.
+
+        Returns:
+            Any: The result of the method.
+    """
+    endpoint, session = _sessions[client]
+    response = await session.post(endpoint, json={"jsonrpc": "2.0", "id": 1, "method": method, "params": params})
+    response.raise_for_status()
+    body = response.json()
+    if "error" in body:
+        raise RPCException(body["error"])
+    return body["result"]
+
+
+def get_endpoint_metrics(endpoint: str) -> EndpointMetrics:
+    """
+        Returns the metrics object of the endpoint.
+
+        Args:
+            endpoint (str): RPC endpoint url.
+
+        Returns:
+            EndpointMetrics: Endpoint metrics.
+    """
+    return _metrics.setdefault(endpoint, EndpointMetrics())
+
+
+def get_rpc_metrics() -> Dict[str, dict]:
+    """
+        Returns connection metrics for every RPC endpoint used by the process.
+
+        Returns:
+            Dict[str, dict]: Metrics keyed by endpoint url.
+    """
+    return {
+        endpoint: {
+            'requests': metrics.requests,
+            'errors': metrics.errors,
+            'connections_opened': metrics.connections_opened,
+            'last_status_code': metrics.last_status_code,
+            'average_latency': metrics.average_latency,
+            'p50_latency': metrics.p50_latency,
+            'p99_latency': metrics.p99_latency,
+            'error_rate': metrics.error_rate,
+            'connection_reuse_ratio': metrics.connection_reuse_ratio,
+        }
+        for endpoint, metrics in _metrics.items()
+    }
+
+
+async def start_rpc_clients() -> None:
+    """
+        Creates the shared RPC clients of all configured endpoints. Registered as Dispatcher startup handler.
+
+        Returns:
+            None
+    """
+    for endpoint in SOLANA_NODE_URLS:
+        get_rpc_client(endpoint)
+    logger.info(f"Shared RPC clients started: {SOLANA_NODE_URLS}")
+
+
+async def close_rpc_clients() -> None:
+    """
+        Closes all shared RPC clients and their connection pools. Registered as Dispatcher shutdown handler.
+
+        Returns:
+            None
+    """
+    for endpoint, client in list(_clients.items()):
+        try:
+            await client.close()
+        except Exception as error:
+            logger.error(f"Failed to close RPC client {endpoint}: {error}")
+    _clients.clear()
+    _sessions.clear()
+    for session in _replaced_sessions:
+        await session.aclose()
+    _replaced_sessions.clear()
+
+    for endpoint, metrics in get_rpc_metrics().items():
+        logger.info(f"RPC metrics {endpoint}: {metrics}")
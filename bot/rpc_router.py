@@ -0,0 +1,147 @@
+import time
+from typing import Dict, Iterable, List, Optional
+
+from bot.config import (RPC_CIRCUIT_FAILURE_THRESHOLD,
+                        RPC_CIRCUIT_RESET_TIMEOUT, RPC_ROUTER_MAX_ERROR_RATE,
+                        SOLANA_NODE_URLS)
+from bot.rpc_client import get_endpoint_metrics
+from logger_config import logger
+
+
+class CircuitOpenError(Exception):
+    """
+        Raised when the circuit breaker of the endpoint is open and the call is not made.
+    """
+
+
+class CircuitBreaker:
+    """
+        Circuit breaker of one RPC endpoint.
+
+        After failure_threshold retryable failures in a row the circuit opens and calls fail immediately.
+        After reset_timeout one trial call is let through (half-open state), its success closes the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = RPC_CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = RPC_CIRCUIT_RESET_TIMEOUT) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_progress = False
+
+    @property
+    def is_open(self) -> bool:
+        if self.opened_at is None:
+            return False
+        return time.monotonic() - self.opened_at < self.reset_timeout or self.trial_in_progress
+
+    def before_call(self) -> None:
+        if self.opened_at is None:
+            return
+        if self.is_open:
+            raise CircuitOpenError("RPC endpoint circuit is open")
+        # half-open: пропускаем один пробный запрос
+        self.trial_in_progress = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.trial_in_progress = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(endpoint: str) -> CircuitBreaker:
+    circuit_breaker = _circuit_breakers.get(endpoint)
+    if circuit_breaker is None:
+        circuit_breaker = CircuitBreaker()
+        _circuit_breakers[endpoint] = circuit_breaker
+    return circuit_breaker
+
+
+class RpcRouter:
+    """
+        Chooses the RPC endpoint for a call.
+
+        Reads go to the healthy endpoint with the lowest rolling p50 latency. Writes (send_transaction,
+        confirm_transaction) are pinned to the first healthy endpoint in the order of SOLANA_NODE_URLS;
+        the pinned endpoint fails over when it becomes unhealthy and fails back when a preferred endpoint recovers.
+
+        An endpoint is healthy when its circuit is closed and its error rate over the last RPC_ROUTER_ERROR_WINDOW
+        seconds is below RPC_ROUTER_MAX_ERROR_RATE. Errors older than the window are forgotten, so an unhealthy
+        endpoint gets requests again and stays in use if it recovered.
+    """
+
+    def __init__(self, endpoints: List[str]) -> None:
+        self.endpoints = endpoints
+        self._write_endpoint: Optional[str] = None
+
+    def is_available(self, endpoint: str) -> bool:
+        return not get_circuit_breaker(endpoint).is_open
+
+    def is_healthy(self, endpoint: str) -> bool:
+        return self.is_available(endpoint) and get_endpoint_metrics(endpoint).error_rate < RPC_ROUTER_MAX_ERROR_RATE
+
+    def _candidates(self, exclude: Iterable[str]) -> List[str]:
+        exclude = set(exclude)
+        # сначала здоровые узлы, затем узлы с высокой долей ошибок, затем уже опробованные в этом вызове
+        for candidates in (
+            [e for e in self.endpoints if e not in exclude and self.is_healthy(e)],
+            [e for e in self.endpoints if e not in exclude and self.is_available(e)],
+            [e for e in self.endpoints if self.is_available(e)],
+        ):
+            if candidates:
+                return candidates
+        raise CircuitOpenError(f"All RPC endpoints are unavailable: {self.endpoints}")
+
+    def select_read_endpoint(self, exclude: Iterable[str] = ()) -> str:
+        """
+            Returns the fastest healthy endpoint.
+
+            Args:
+                exclude (Iterable[str]): Endpoints that already failed during the current call.
+
+            Returns:
+                str: RPC endpoint url.
+
+            Raises:
+                CircuitOpenError: If the circuits of all endpoints are open.
+        """
+        candidates = self._candidates(exclude)
+        # узлы без статистики имеют задержку 0 и поэтому получают первые запросы
+        return min(candidates, key=lambda e: get_endpoint_metrics(e).p50_latency)
+
+    def get_write_endpoint(self, exclude: Iterable[str] = ()) -> str:
+        """
+            Returns the endpoint that write calls are pinned to.
+
+            Args:
+                exclude (Iterable[str]): Endpoints that already failed during the current call.
+
+            Returns:
+                str: RPC endpoint url.
+
+            Raises:
+                CircuitOpenError: If the circuits of all endpoints are open.
+        """
+        # порядок узлов в настройках - порядок приоритета, восстановившийся узел с большим приоритетом
+        # снова становится узлом записи
+        endpoint = self._candidates(exclude)[0]
+        if self._write_endpoint and endpoint != self._write_endpoint:
+            if self.endpoints.index(endpoint) < self.endpoints.index(self._write_endpoint):
+                logger.info(f"RPC write endpoint failback: {self._write_endpoint} -> {endpoint}")
+            else:
+                logger.warning(f"RPC write endpoint failover: {self._write_endpoint} -> {endpoint}")
+        self._write_endpoint = endpoint
+        return endpoint
+
+
+rpc_router = RpcRouter(SOLANA_NODE_URLS)
@@ -3,19 +3,15 @@ import asyncio
 # import math
 # import time
 import traceback
-import pprint
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import base58
-import httpx
-import mnemonic
-import requests
 # from PIL import Image
 
-from solana.rpc import commitment as solana_commitment
 from solana.rpc.async_api import AsyncClient
-from solana.rpc.types import TokenAccountOpts, TxOpts
-from spl.token.constants import TOKEN_PROGRAM_ID # ASSOCIATED_TOKEN_PROGRAM_ID, TOKEN_2022_PROGRAM_ID
+from solana.rpc.core import RPCException
+from solana.rpc.types import DataSliceOpts, TokenAccountOpts, TxOpts
+from spl.token.constants import TOKEN_2022_PROGRAM_ID, TOKEN_PROGRAM_ID # ASSOCIATED_TOKEN_PROGRAM_ID
 import spl.token.instructions as spl_token_instructions
 from solders.transaction import Transaction
 # from solders.instruction import AccountMeta, Instruction
@@ -25,15 +21,28 @@ from solders.signature import Signature
 # from solders.system_program import ID as SYS_PROGRAM_ID
 from solders.system_program import TransferParams, transfer
 from solders.sysvar import RENT
-from solders.transaction_status import TransactionConfirmationStatus
 from solders.message import Message
 
-from bot.config import LAMPORT_TO_SOL_RATIO, SOLANA_NODE_URL
+from bot.blockhash_service import (get_recent_blockhash, invalidate_blockhash,
+                                   refresh_blockhash)
+from bot.confirmation import TransactionStatusUnknownError, wait_for_confirmation
+from bot.config import (LAMPORT_TO_SOL_RATIO, MAX_SUPPORTED_TRANSACTION_VERSION,
+                        PRIORITY_FEE_TIER, TRANSACTION_FETCH_CONCURRENCY)
+from bot.key_derivation import generate_wallet
+from bot.metadata_fetcher import fetch_metadata_json
+from bot.network_params import get_rent_exemption
+from bot.retry import SEND_TRANSACTION_RETRY_POLICY, call_rpc, is_not_sent_error
+from bot.token_account_cache import get_token_accounts_by_owner
+from bot.token_metadata_cache import get_cached_token_metadata
+from bot.transaction_builder import build_message
+from bot.utils import update_token_program
 from bot.validators import (is_valid_amount, is_valid_private_key, is_valid_wallet_address)
 from logger_config import logger
 
-# установить таймаут на чтение ответа 120 секунд, таймаут на соединение 20 секунд
-timeout_settings = httpx.Timeout(read=120.0, connect=20.0, write=None, pool=None)
+# Максимальное количество ключей в одном запросе getMultipleAccounts
+MULTIPLE_ACCOUNTS_LIMIT = 100
+# Программы токенов, для которых проверяются связанные аккаунты, если программа токена еще неизвестна
+TOKEN_PROGRAM_IDS = (TOKEN_PROGRAM_ID, TOKEN_2022_PROGRAM_ID)
 
 
 async def create_solana_wallet() -> Tuple[str, str, str]:
@@ -47,13 +56,8 @@ async def create_solana_wallet() -> Tuple[str, str, str]:
             Exception: If there's an error during the wallet creation process.
     """
     try:
-        solana_derivation_path = "m/44'/501'/0'/0'"
-        mnemo = mnemonic.Mnemonic("english")
-        words = mnemo.generate(strength=128) # strength=128 for 12 words, strength=256 for 24 words
-        seed = mnemo.to_seed(words, passphrase="")
-        keypair = Keypair.from_seed_and_derivation_path(seed, solana_derivation_path)
-        wallet_address = str(keypair.pubkey())
-        private_key = keypair.secret().hex()
+        # seed и ключ вычисляются в отдельном процессе, чтобы не блокировать event loop
+        wallet_address, private_key, words = await generate_wallet(strength=128) # strength=128 for 12 words, strength=256 for 24 words
         return wallet_address, private_key, words
 
     except Exception as e:
@@ -79,50 +83,34 @@ def get_wallet_address_from_private_key(private_key: str) -> str:
 
 
 async def get_spl_token_metadata_from_uri(uri):
-    metadata = {}
-    user_agent = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36"}
-    try:
-        for attempt in range(5):
-            try:
-                response = requests.get(uri, headers=user_agent)
-                break
-            except Exception as e:
-                print(f"Error get_spl_token_metadata_from_uri uri: {uri}. Error msg.: {e}. Attempt {attempt + 1} out of 5.")
-                await asyncio.sleep(10)
-        else:
-            raise Exception(f"Failed to get_spl_token_metadata_from_uri uri: {uri} after 5 attempts.")
-
-        if response.status_code == 200:
-            if hasattr(response, 'json') and response.json():
-                response_json = response.json()
-                if response_json:
-                    metadata['raw'] = response_json
-                    if 'description' in response_json:
-                        metadata['description'] = response_json['description']
-                    if 'image' in response_json:
-                        metadata['image'] = response_json['image']
-        return metadata
+    """
+        Fetches the off-chain token metadata from the uri.
 
-    except Exception as error:
-        detailed_error_traceback = traceback.format_exc()
-        logger.error(f"Failed to get_spl_token_metadata_from_uri: {error}\n{detailed_error_traceback}")
-        raise Exception(f"Failed to get_spl_token_metadata_from_uri: \n{error}")
+        Args:
+            uri (str): Metadata uri.
+
+        Returns:
+            dict: Metadata with 'raw', 'description' and 'image' keys, empty if it could not be fetched.
+    """
+    metadata = {}
+    response_json = await fetch_metadata_json(uri)
+    if response_json:
+        metadata['raw'] = response_json
+        if 'description' in response_json:
+            metadata['description'] = response_json['description']
+        if 'image' in response_json:
+            metadata['image'] = response_json['image']
+    return metadata
 
 
-async def get_spl_token_metadata(mint_address):
+async def fetch_spl_token_metadata(mint_address):
     try:
         metadata = {}
-        client = AsyncClient(SOLANA_NODE_URL, timeout=timeout_settings)
-
-        for attempt in range(5):
-            try:
-                res = await client.get_account_info_json_parsed(pubkey=Pubkey.from_string(mint_address))
-                break
-            except Exception as e:
-                print(f"Error when get_spl_token_metadata, mint_address: {mint_address}, error: {e}. Attempt {attempt + 1} out of 5.")
-                await asyncio.sleep(10)
-        else:
-            raise Exception("Failed to get_spl_token_metadata after 5 attempts.")
+
+        res = await call_rpc(
+            lambda client: client.get_account_info_json_parsed(pubkey=Pubkey.from_string(mint_address)),
+            f"get_spl_token_metadata, mint_address: {mint_address}",
+        )
 
         if res and hasattr(res, 'value'):
             info = res.value
@@ -164,50 +152,49 @@ async def get_spl_token_metadata(mint_address):
         detailed_error_traceback = traceback.format_exc()
         logger.error(f"Failed to get_spl_token_metadata: {error}\n{detailed_error_traceback}")
         raise Exception(f"Failed to get_spl_token_metadata: {error}\n{detailed_error_traceback}")
-    finally:
-        await client.close()
+
+
+async def get_spl_token_metadata(mint_address):
+    """
+        Returns the token metadata. Known mints are served from the cache and the Token table,
+        the blockchain and the metadata uri are queried only for new or stale mints.
+
+        Args:
+            mint_address (str): Token mint address.
+
+        Returns:
+            dict: Token metadata.
+    """
+    return await get_cached_token_metadata(mint_address, fetch_spl_token_metadata)
 
 
 async def get_spl_token_data(wallet_address, program_id=TOKEN_PROGRAM_ID):
     try:
         spl_tokens = []
-        opts = TokenAccountOpts(program_id=program_id)
-        pubkey = Pubkey.from_string(wallet_address)
-        client = AsyncClient(SOLANA_NODE_URL, timeout=timeout_settings)
-
-        for attempt in range(5):
-            try:
-                spl_token_accounts = await client.get_token_accounts_by_owner_json_parsed(owner=pubkey, opts=opts)
-                break
-            except Exception as e:
-                print(f"Error when get_spl_token_data, owner: {pubkey}, error {e}. Attempt {attempt + 1} out of 5.")
-                await asyncio.sleep(10)
-        else:
-            raise Exception("Failed to get_spl_token_data after 5 attempts.")
-
-        if spl_token_accounts and hasattr(spl_token_accounts, 'value'):
-            spl_token_accounts_list = spl_token_accounts.value
-            if spl_token_accounts_list:
-                for token in spl_token_accounts_list:
-                    spl_token_data = {}
-                    if token and hasattr(token, 'account'):
-                        if token.account and hasattr(token.account, 'data'):
-                            if token.account.data and hasattr(token.account.data, 'parsed'):
-                                if token.account.data.parsed and 'info' in token.account.data.parsed:
-                                    if token.account.data.parsed['info']:
-                                        if 'isNative' in token.account.data.parsed['info']:
-                                            spl_token_data['is_native'] = token.account.data.parsed['info']['isNative']
-                                        if 'state' in token.account.data.parsed['info']:
-                                            spl_token_data['state'] = token.account.data.parsed['info']['state']
-                                        if 'tokenAmount' in token.account.data.parsed['info']:
-                                            spl_token_data['amount'] = token.account.data.parsed['info']['tokenAmount']
-                                        if 'mint' in token.account.data.parsed['info']:
-                                            spl_token_data['mint'] = token.account.data.parsed['info']['mint']
-                                            if spl_token_data['mint']:
-                                                metadata = await get_spl_token_metadata(spl_token_data['mint'])
-                                                if metadata:
-                                                    spl_token_data['metadata'] = metadata
-                                        spl_tokens.append(spl_token_data)
+        # токен-аккаунты берутся из короткоживущего кэша, повторные обновления не запрашивают узел
+        spl_token_accounts_list = await get_token_accounts_by_owner(wallet_address, program_id)
+
+        if spl_token_accounts_list:
+            for token in spl_token_accounts_list:
+                spl_token_data = {}
+                if token and hasattr(token, 'account'):
+                    if token.account and hasattr(token.account, 'data'):
+                        if token.account.data and hasattr(token.account.data, 'parsed'):
+                            if token.account.data.parsed and 'info' in token.account.data.parsed:
+                                if token.account.data.parsed['info']:
+                                    if 'isNative' in token.account.data.parsed['info']:
+                                        spl_token_data['is_native'] = token.account.data.parsed['info']['isNative']
+                                    if 'state' in token.account.data.parsed['info']:
+                                        spl_token_data['state'] = token.account.data.parsed['info']['state']
+                                    if 'tokenAmount' in token.account.data.parsed['info']:
+                                        spl_token_data['amount'] = token.account.data.parsed['info']['tokenAmount']
+                                    if 'mint' in token.account.data.parsed['info']:
+                                        spl_token_data['mint'] = token.account.data.parsed['info']['mint']
+                                        if spl_token_data['mint']:
+                                            metadata = await get_spl_token_metadata(spl_token_data['mint'])
+                                            if metadata:
+                                                spl_token_data['metadata'] = metadata
+                                    spl_tokens.append(spl_token_data)
 
         for t in spl_tokens:
             print(f"***** List spl token data: {t}")
@@ -217,8 +204,70 @@ async def get_spl_token_data(wallet_address, program_id=TOKEN_PROGRAM_ID):
         detailed_error_traceback = traceback.format_exc()
         logger.error(f"Failed to get_spl_token_data: {error}\n{detailed_error_traceback}")
         raise Exception(f"Failed to get_spl_token_data: {error}\n{detailed_error_traceback}")
-    finally:
-        await client.close()
+
+
+async def get_sol_balances_with_slot(wallet_addresses: List[str]) -> Tuple[Dict[str, int], Optional[int]]:
+    """
+        Retrieves the lamport balances of many wallets in one round trip and the slot they were read at.
+
+        Addresses are packed into getMultipleAccounts requests of up to MULTIPLE_ACCOUNTS_LIMIT keys,
+        the chunks are sent concurrently over the shared connection pool.
+
+        Args:
+            wallet_addresses (List[str]): The list of wallet addresses.
+
+        Returns:
+            Tuple[Dict[str, int], int | None]: Balances in lamports keyed by wallet address (accounts that do not
+                exist have 0 lamports) and the lowest slot of the chunk responses, None if there are no addresses.
+    """
+    addresses = list(dict.fromkeys(wallet_addresses))
+    chunks = [
+        addresses[i:i + MULTIPLE_ACCOUNTS_LIMIT] for i in range(0, len(addresses), MULTIPLE_ACCOUNTS_LIMIT)
+    ]
+
+    async def get_chunk_balances(chunk: List[str]) -> Tuple[Dict[str, int], int]:
+        response = await call_rpc(
+            lambda client: client.get_multiple_accounts(
+                [Pubkey.from_string(address) for address in chunk],
+                # данные аккаунтов не нужны, только баланс
+                data_slice=DataSliceOpts(offset=0, length=0),
+            ),
+            f"get_sol_balances chunk of {len(chunk)} addresses",
+        )
+
+        return {
+            address: account.lamports if account else 0
+            for address, account in zip(chunk, response.value)
+        }, response.context.slot
+
+    try:
+        balances = {}
+        slots = []
+        for chunk_balances, slot in await asyncio.gather(*[get_chunk_balances(chunk) for chunk in chunks]):
+            balances.update(chunk_balances)
+            slots.append(slot)
+        logger.debug(f"Lamport balances for {len(balances)} wallets: {balances}")
+        # чанки могли прочитать разные узлы, балансы актуальны не раньше минимального слота
+        return balances, min(slots, default=None)
+
+    except Exception as error:
+        detailed_error_traceback = traceback.format_exc()
+        logger.error(f"Failed to get Solana balances: {error}\n{detailed_error_traceback}")
+        raise Exception(f"Failed to get Solana balances: {error}\n{detailed_error_traceback}")
+
+
+async def get_sol_balances(wallet_addresses: List[str]) -> Dict[str, int]:
+    """
+        Retrieves the lamport balances of many wallets in one round trip.
+
+        Args:
+            wallet_addresses (List[str]): The list of wallet addresses.
+
+        Returns:
+            Dict[str, int]: Balances in lamports keyed by wallet address. Accounts that do not exist have 0 lamports.
+    """
+    balances, _ = await get_sol_balances_with_slot(wallet_addresses)
+    return balances
 
 
 async def get_sol_balance(wallet_addresses):
@@ -230,41 +279,21 @@ async def get_sol_balance(wallet_addresses):
             Union[float, List[float]]: The SOL balance or a list of SOL balances corresponding to the wallet addresses.
     """
     try:
-        client = AsyncClient(SOLANA_NODE_URL, timeout=timeout_settings)
         # Если передан одиночный адрес кошелька
         if isinstance(wallet_addresses, str):
-            for attempt in range(5):
-                try:
-                    balance = (await client.get_balance(pubkey=Pubkey.from_string(wallet_addresses))).value
-                    break
-                except Exception as e:
-                    print(f"Error when get_sol_balance wallet_addresses: {wallet_addresses}, error {e}. Attempt {attempt + 1} out of 5.")
-                    await asyncio.sleep(10)
-            else:
-                raise Exception("Failed to get_sol_balance after 5 attempts.")
+            balance = (await call_rpc(
+                lambda client: client.get_balance(pubkey=Pubkey.from_string(wallet_addresses)),
+                f"get_sol_balance wallet_addresses: {wallet_addresses}",
+            )).value
 
             # Преобразование лампортов в SOL
             sol_balance = balance / LAMPORT_TO_SOL_RATIO
             logger.debug(f"wallet_address: {wallet_addresses}, balance: {balance}, sol_balance: {sol_balance}")
             return sol_balance
-        # Если передан список адресов кошельков
+        # Если передан список адресов кошельков - один пакетный запрос вместо запроса на каждый адрес
         elif isinstance(wallet_addresses, list):
-            sol_balances = []
-            for address in wallet_addresses:
-                for attempt in range(5):
-                    try:
-                        balance = (await client.get_balance(Pubkey.from_string(address))).value
-                        break
-                    except Exception as e:
-                        print(f"Error when get_sol_balance address: {address}, error {e}. Attempt {attempt + 1} out of 5.")
-                        await asyncio.sleep(10)
-                else:
-                    raise Exception("Failed to get_sol_balance after 5 attempts.")
-
-                sol_balance = balance / LAMPORT_TO_SOL_RATIO
-                sol_balances.append(sol_balance)
-
-            return sol_balances
+            balances = await get_sol_balances(wallet_addresses)
+            return [balances[address] / LAMPORT_TO_SOL_RATIO for address in wallet_addresses]
         else:
             raise ValueError("Invalid type for wallet_addresses. Expected str or list[str].")
 
@@ -272,30 +301,125 @@ async def get_sol_balance(wallet_addresses):
         detailed_error_traceback = traceback.format_exc()
         logger.error(f"Failed to get Solana balance: {error}\n{detailed_error_traceback}")
         raise Exception(f"Failed to get Solana balance: {error}\n{detailed_error_traceback}")
-    finally:
-        await client.close()
 
 
-async def transfer_sol_token(
+def is_blockhash_not_found_error(error: Exception) -> bool:
+    """
+        Checks whether the node rejected the transaction because it does not know its blockhash yet.
+
+        Args:
+            error (Exception): The raised exception.
+
+        Returns:
+            bool: True if the blockhash was not found, False otherwise.
+    """
+    return isinstance(error, RPCException) and ("BlockhashNotFound" in str(error) or "Blockhash not found" in str(error))
+
+
+async def send_transaction_with_recent_blockhash(
+        client: AsyncClient,
+        signers: List[Keypair],
+        message: Message,
+        opts: Optional[TxOpts] = None,
+        on_send: Optional[Callable[[Signature, int], None]] = None,
+    ) -> Tuple[Any, int]:
+    """
+        Signs the message with the prefetched recent blockhash and sends it in a single round trip.
+
+        If the node does not know the blockhash yet, the transaction is signed with a new blockhash
+        and sent once more. It is safe, the rejected transaction was not processed.
+
+        Args:
+            client (AsyncClient): RPC client.
+            signers (List[Keypair]): Transaction signers.
+            message (Message): Transaction message.
+            opts (TxOpts | None): Send options.
+            on_send (Callable[[Signature, int], None] | None): Called with the signature and the last valid
+                block height right before the transaction is sent.
+
+        Returns:
+            Tuple[Any, int]: The send_transaction response and the last valid block height of the blockhash.
+    """
+    async def send(recent_blockhash: Any) -> Any:
+        transaction = Transaction(signers, message, recent_blockhash.blockhash)
+        if on_send is not None:
+            on_send(transaction.signatures[0], recent_blockhash.last_valid_block_height)
+        return await client.send_transaction(transaction, opts=opts)
+
+    recent_blockhash = await get_recent_blockhash()
+    try:
+        response = await send(recent_blockhash)
+    except RPCException as error:
+        if not is_blockhash_not_found_error(error):
+            raise
+        logger.warning(f"Blockhash {recent_blockhash.blockhash} not found by the node, retry with a new blockhash.")
+        invalidate_blockhash()
+        recent_blockhash = await refresh_blockhash()
+        response = await send(recent_blockhash)
+    return response, recent_blockhash.last_valid_block_height
+
+
+async def broadcast_transaction(signers: List[Keypair], message: Message, description: str) -> Tuple[Any, int]:
+    """
+        Sends the transaction to the pinned write endpoint without waiting for its confirmation.
+
+        Args:
+            signers (List[Keypair]): Transaction signers.
+            message (Message): Transaction message.
+            description (str): Description of the call for the log.
+
+        Raises:
+            TransactionStatusUnknownError: If sending failed after the transaction may have been broadcast.
+            Exception: If the transaction was surely not broadcast.
+
+        Returns:
+            Tuple[Any, int]: The send_transaction response and the last valid block height of the blockhash.
+    """
+    # подпись и last_valid_block_height последней отправленной транзакции
+    sent: Dict[str, Any] = {}
+    try:
+        return await call_rpc(
+            lambda client: send_transaction_with_recent_blockhash(
+                client, signers, message,
+                on_send=lambda signature, last_valid_block_height: sent.update(
+                    signature=signature, last_valid_block_height=last_valid_block_height
+                ),
+            ),
+            description,
+            policy=SEND_TRANSACTION_RETRY_POLICY,
+            write=True,
+        )
+    except Exception as error:
+        if not sent or is_not_sent_error(error):
+            raise
+        # таймаут или обрыв соединения после отправки: транзакция могла попасть в сеть
+        logger.warning(f"Transaction {sent['signature']} may have been sent, {description} failed: {error!r}")
+        raise TransactionStatusUnknownError(sent['signature'], sent['last_valid_block_height']) from error
+
+
+async def send_sol_token(
     sender_address: str,
     sender_private_key: str,
     recipient_address: str,
-    amount: float
-) -> bool:
+    amount: float,
+    fee_tier: str = PRIORITY_FEE_TIER,
+) -> Tuple[Signature, int]:
     """
-        Asynchronous function to transfer tokens between wallets.
+        Sends a SOL transfer transaction without waiting for its confirmation.
 
         Args:
             sender_address (str): Sender's address.
             sender_private_key (str): Sender's private key.
             recipient_address (str): Recipient's address.
             amount (float): Amount of tokens to transfer.
+            fee_tier (str): Priority fee tier: economy, normal or fast.
 
         Raises:
             ValueError: If any of the provided addresses is invalid or the private key is invalid.
+            Exception: If the transaction was not sent.
 
         Returns:
-            bool: True if the transfer is successful, False otherwise.
+            Tuple[Signature, int]: Transaction signature and the last valid block height of its blockhash.
     """
     if not is_valid_wallet_address(sender_address):
         raise ValueError("Invalid sender address")
@@ -310,7 +434,6 @@ async def transfer_sol_token(
         raise ValueError("Invalid amount")
 
     try:
-        client = AsyncClient(SOLANA_NODE_URL, timeout=timeout_settings)
         sender_keypair = Keypair.from_seed(bytes.fromhex(sender_private_key))
 
         params = [
@@ -324,37 +447,57 @@ async def transfer_sol_token(
             )
         ]
 
-        msg = Message(params, sender_keypair.pubkey())
-
-        for attempt in range(5):
-            try:
-                latest_blockhash = (await client.get_latest_blockhash()).value.blockhash
-                send_transaction_response = await client.send_transaction(Transaction([sender_keypair], msg, latest_blockhash))
-                break
-            except Exception as e:
-                print(f"Error when transfer_sol_token.send_transaction error {e}. Attempt {attempt + 1} out of 5.")
-                print(f'Data, sender_keypair: {sender_keypair}, msg: {msg}, latest_blockhash: {latest_blockhash}')
-                await asyncio.sleep(10)
-        else:
-            raise Exception("Failed to get_sol_balance after 5 attempts.")
+        # Лимит вычислительных единиц по симуляции и комиссия за приоритет, чтобы транзакция попала в блок с первой попытки
+        msg = await build_message(params, [sender_keypair], tier=fee_tier)
 
-        confirm_transaction_response = await client.confirm_transaction(send_transaction_response.value)
+        send_transaction_response, last_valid_block_height = await broadcast_transaction(
+            [sender_keypair], msg, "transfer_sol_token.send_transaction"
+        )
 
-        if hasattr(confirm_transaction_response, 'value') and confirm_transaction_response.value[0]:
-            if hasattr(confirm_transaction_response.value[0], 'confirmation_status'):
-                confirmation_status = confirm_transaction_response.value[0].confirmation_status
-                if confirmation_status:
-                    logger.debug(f"Transaction confirmation_status: {confirmation_status}")
-                    if confirmation_status in [TransactionConfirmationStatus.Confirmed, TransactionConfirmationStatus.Finalized]:
-                        return True
-        return False
+        return send_transaction_response.value, last_valid_block_height
 
+    except Exception as error:
+        detailed_error_traceback = traceback.format_exc()
+        logger.error(f"Failed send sol token: {error}\n{detailed_error_traceback}")
+        raise
+
+
+async def transfer_sol_token(
+    sender_address: str,
+    sender_private_key: str,
+    recipient_address: str,
+    amount: float,
+    fee_tier: str = PRIORITY_FEE_TIER,
+) -> bool:
+    """
+        Asynchronous function to transfer tokens between wallets.
+
+        Args:
+            sender_address (str): Sender's address.
+            sender_private_key (str): Sender's private key.
+            recipient_address (str): Recipient's address.
+            amount (float): Amount of tokens to transfer.
+            fee_tier (str): Priority fee tier: economy, normal or fast.
+
+        Raises:
+            ValueError: If any of the provided addresses is invalid or the private key is invalid.
+
+        Returns:
+            bool: True if the transfer is successful, False otherwise.
+    """
+    try:
+        signature, last_valid_block_height = await send_sol_token(
+            sender_address, sender_private_key, recipient_address, amount, fee_tier
+        )
+        # после last_valid_block_height транзакция уже не может попасть в блок - ожидание прекращается
+        return await wait_for_confirmation(signature, last_valid_block_height=last_valid_block_height)
+
+    except ValueError:
+        raise
     except Exception as error:
         detailed_error_traceback = traceback.format_exc()
         logger.error(f"Failed transfer sol token: {error}\n{detailed_error_traceback}")
         return False
-    finally:
-        await client.close()
 
 
 # def get_associated_token_address(owner: Pubkey, mint: Pubkey, token_program: Pubkey) -> Pubkey:
@@ -399,17 +542,11 @@ async def get_token_account(owner: Pubkey, mint: Pubkey) -> Pubkey | None:
             The public key of associated token account.
     """
     try:
-        client = AsyncClient(SOLANA_NODE_URL, timeout=timeout_settings)
-
-        for attempt in range(5):
-            try:
-                response = await client.get_token_accounts_by_owner(owner=owner, opts=TokenAccountOpts(mint=mint))
-                break
-            except Exception as e:
-                print(f"Error get_token_account for the owner: {owner}. Error msg.: {e}. Attempt {attempt + 1} out of 5.")
-                await asyncio.sleep(10)
-        else:
-            raise Exception(f"Failed to get_token_account: {mint} from owner: {owner} after 5 attempts.")
+
+        response = await call_rpc(
+            lambda client: client.get_token_accounts_by_owner(owner=owner, opts=TokenAccountOpts(mint=mint)),
+            f"get_token_account for the owner: {owner}",
+        )
 
         if response and hasattr(response, 'value'):
             accounts = response.value
@@ -421,8 +558,6 @@ async def get_token_account(owner: Pubkey, mint: Pubkey) -> Pubkey | None:
         detailed_error_traceback = traceback.format_exc()
         logger.error(f"Failed to get_token_account: {error}\n{detailed_error_traceback}")
         return None
-    finally:
-        await client.close()
 
 
 async def get_token_program_id(mint: Pubkey) -> Pubkey | None:
@@ -433,17 +568,11 @@ async def get_token_program_id(mint: Pubkey) -> Pubkey | None:
             The public key of Token Program.
     """
     try:
-        client = AsyncClient(SOLANA_NODE_URL, timeout=timeout_settings)
-
-        for attempt in range(5):
-            try:
-                response = await client.get_account_info(pubkey=mint)
-                break
-            except Exception as e:
-                print(f"Error when get_token_program_id: {e}. Attempt {attempt + 1} out of 5.")
-                await asyncio.sleep(10)
-        else:
-            raise Exception("Failed to get_token_program_id after 5 attempts.")
+
+        response = await call_rpc(
+            lambda client: client.get_account_info(pubkey=mint),
+            "get_token_program_id",
+        )
 
         if response and hasattr(response, 'value'):
             if response.value and hasattr(response.value, 'owner'):
@@ -454,63 +583,128 @@ async def get_token_program_id(mint: Pubkey) -> Pubkey | None:
         detailed_error_traceback = traceback.format_exc()
         logger.error(f"Failed to get_token_program_id: {error}\n{detailed_error_traceback}")
         return None
-    finally:
-        await client.close()
 
 
-async def get_transaction_confirmation_status(response_value) -> bool:
-    try:
-        client = AsyncClient(SOLANA_NODE_URL, timeout=timeout_settings)
-
-        for attempt in range(5):
-            try:
-                confirm_transaction = await client.confirm_transaction(response_value)
-                break
-            except Exception as e:
-                print(f"Error to get_transaction_confirmation_status.confirm_transaction: {e}. Attempt {attempt + 1} out of 5.")
-                await asyncio.sleep(10)
-        else:
-            raise Exception("Failed to get_transaction_confirmation_status.confirm_transaction after 5 attempts.")
-
-        # start debug
-        sig = Signature.from_string(f'{response_value}')
-        if sig:
-            res = await client.get_transaction(sig)
-            print('******************** Transaction ***********************')
-            pprint.pp(res)
-        # end debug
-
-        if hasattr(confirm_transaction, 'value') and confirm_transaction.value[0]:
-            if hasattr(confirm_transaction.value[0], 'confirmation_status'):
-                confirmation_status = confirm_transaction.value[0].confirmation_status
-                if confirmation_status:
-                    logger.debug(f"Transaction confirmation_status: {confirmation_status}")
-                    print(f'****** confirmation_status: {confirmation_status}')
-                    logger.debug(f"Transaction confirmation_status: {confirmation_status}")
-                    if confirmation_status in [TransactionConfirmationStatus.Confirmed, TransactionConfirmationStatus.Finalized]:
-                        return True
+async def get_token_decimals(mint: str) -> int | None:
+    """
+        Retrieves the decimals of the token from its mint account.
 
-        return False
+        Args:
+            mint (str): Token mint address.
+
+        Returns:
+            int | None: Token decimals, None if they could not be retrieved.
+    """
+    try:
+        response = await call_rpc(
+            lambda client: client.get_token_supply(Pubkey.from_string(mint)),
+            "get_token_decimals",
+        )
+        return response.value.decimals
 
     except Exception as error:
         detailed_error_traceback = traceback.format_exc()
-        logger.error(f"Failed get_transaction_confirmation_status: {error}\n{detailed_error_traceback}")
-        return False
-    finally:
-        await client.close()
+        logger.error(f"Failed to get_token_decimals: {error}\n{detailed_error_traceback}")
+        return None
 
 
-async def transfer_spl_token(
+async def get_spl_transfer_accounts(
+        sender: Pubkey,
+        receiver: Pubkey,
+        mint: Pubkey,
+        token_program: Optional[Pubkey] = None,
+    ) -> Tuple[Pubkey, Pubkey, Pubkey, bool]:
+    """
+        Prepares the accounts of an SPL token transfer in one getMultipleAccounts request.
+
+        The associated token accounts are derived locally and checked together with the mint account.
+        If the token program is unknown, the accounts are derived for every program in TOKEN_PROGRAM_IDS
+        and the program is taken from the owner of the mint account.
+
+        Args:
+            sender (Pubkey): Sender's address.
+            receiver (Pubkey): Recipient's address.
+            mint (Pubkey): Token mint address.
+            token_program (Pubkey | None): Token program id, if known. Ex.: Token.program.
+
+        Raises:
+            Exception: If the mint or the sender's token account is not found.
+
+        Returns:
+            Tuple[Pubkey, Pubkey, Pubkey, bool]: Token program id, sender's token account,
+                recipient's associated token account and whether the recipient's account exists.
+    """
+    token_programs = (token_program,) if token_program else TOKEN_PROGRAM_IDS
+    associated_token_accounts = {
+        program: (
+            spl_token_instructions.get_associated_token_address(sender, mint, program),
+            spl_token_instructions.get_associated_token_address(receiver, mint, program),
+        )
+        for program in token_programs
+    }
+    pubkeys = [mint] + [pubkey for accounts in associated_token_accounts.values() for pubkey in accounts]
+
+    response = await call_rpc(
+        lambda client: client.get_multiple_accounts(pubkeys, data_slice=DataSliceOpts(offset=0, length=0)),
+        f"get_spl_transfer_accounts, mint: {mint}",
+    )
+    accounts = dict(zip(pubkeys, response.value))
+
+    mint_account = accounts[mint]
+    if not mint_account:
+        raise Exception("Token mint not found")
+
+    if mint_account.owner not in associated_token_accounts:
+        if token_program:
+            # сохраненная программа не совпадает с владельцем mint - определяем заново
+            logger.warning(f"Token program of the mint {mint} changed: {token_program} -> {mint_account.owner}")
+            return await get_spl_transfer_accounts(sender, receiver, mint)
+        raise Exception(f"Unsupported token program: {mint_account.owner}")
+
+    token_program = mint_account.owner
+    sender_token_account, receiver_token_account = associated_token_accounts[token_program]
+
+    if not accounts[sender_token_account]:
+        # токены могут храниться не в связанном аккаунте - ищем любой аккаунт отправителя
+        sender_token_account = await get_token_account(sender, mint)
+        if not sender_token_account:
+            raise Exception("Sender associated token account not found")
+
+    return token_program, sender_token_account, receiver_token_account, bool(accounts[receiver_token_account])
+
+
+async def send_spl_token(
         sender_address: str,
         sender_private_key: str,
         recipient_address: str,
         mint: str,
         amount: float,
         decimals: int,
-    ) -> bool:
+        token_program: Optional[str] = None,
+        fee_tier: str = PRIORITY_FEE_TIER,
+    ) -> Tuple[Signature, int]:
+    """
+        Sends an SPL token transfer transaction without waiting for its confirmation.
+        Creates the recipient's associated token account if it does not exist.
+
+        Args:
+            sender_address (str): Sender's address.
+            sender_private_key (str): Sender's private key.
+            recipient_address (str): Recipient's address.
+            mint (str): Token mint address.
+            amount (float): Amount of tokens to transfer.
+            decimals (int): Token decimals.
+            token_program (str | None): Cached token program id (Token.program). If not set,
+                the program is determined from the mint account and saved to the Token.
+            fee_tier (str): Priority fee tier: economy, normal or fast.
 
+        Raises:
+            Exception: If the transaction was not sent.
+
+        Returns:
+            Tuple[Signature, int]: Transaction signature and the last valid block height of its blockhash.
+    """
     try:
-        client = AsyncClient(SOLANA_NODE_URL, timeout=30)
 
         if not is_valid_wallet_address(sender_address):
             raise ValueError("Invalid sender address")
@@ -535,36 +729,25 @@ async def transfer_spl_token(
         receiver_public_key = Pubkey.from_string(recipient_address)
         token_mint_public_key = Pubkey.from_string(mint)
 
-        sender_associated_token_public_key = await get_token_account(sender_public_key, token_mint_public_key)
-
-        if not sender_associated_token_public_key:
-            raise Exception("Sender associated token account not found")
-
-        receiver_associated_token_public_key = await get_token_account(receiver_public_key, token_mint_public_key)
-
-        token_program_public_key = await get_token_program_id(token_mint_public_key)
-
-        if not token_program_public_key:
-            raise Exception("Token program not found")
-
-        params = []
-
-        opts = TxOpts(
-            skip_confirmation=False,
-            skip_preflight=False,
-            preflight_commitment=solana_commitment.Finalized,
+        # Связанные аккаунты отправителя и получателя и программа токена - одним запросом
+        (
+            token_program_public_key,
+            sender_associated_token_public_key,
+            receiver_associated_token_public_key,
+            is_receiver_token_account_exists,
+        ) = await get_spl_transfer_accounts(
+            sender_public_key,
+            receiver_public_key,
+            token_mint_public_key,
+            token_program=Pubkey.from_string(token_program) if token_program else None,
         )
 
-        if not receiver_associated_token_public_key:
-            receiver_associated_token_public_key = spl_token_instructions.get_associated_token_address(
-                owner=receiver_public_key,
-                mint=token_mint_public_key,
-                token_program_id=token_program_public_key,
-            )
+        if str(token_program_public_key) != token_program:
+            await update_token_program(mint, str(token_program_public_key))
 
-            if not receiver_associated_token_public_key:
-                raise Exception("It is not possible to get a Receiver Associated Token Account from this data.")
+        params = []
 
+        if not is_receiver_token_account_exists:
             params.append(
                 spl_token_instructions.create_associated_token_account(
                     payer=sender_public_key,
@@ -588,31 +771,44 @@ async def transfer_spl_token(
             )
         )
 
-        msg = Message(params, sender_keypair.pubkey())
+        # Лимит вычислительных единиц по симуляции и комиссия за приоритет, чтобы транзакция попала в блок с первой попытки
+        msg = await build_message(params, [sender_keypair], tier=fee_tier)
 
-        for attempt in range(5):
-            try:
-                latest_blockhash = (await client.get_latest_blockhash()).value.blockhash
-                response = await client.send_transaction(Transaction([sender_keypair], msg, latest_blockhash), opts=opts)
-                break
-            except Exception as e:
-                print(f"Error when transferring spl-token: {e}. Attempt {attempt + 1} out of 5.")
-                await asyncio.sleep(10)
-        else:
-            raise Exception("Failed to transfer spl-token after 5 attempts.")
+        response, last_valid_block_height = await broadcast_transaction(
+            [sender_keypair], msg, "transfer_spl_token.send_transaction"
+        )
 
-        if response and hasattr(response, 'value') and response.value:
-            is_transaction_confirmation = await get_transaction_confirmation_status(response.value)
-            if is_transaction_confirmation:
-                return True
-        return False
+        if not response or not hasattr(response, 'value') or not response.value:
+            raise Exception("Transaction was not sent")
+
+        return response.value, last_valid_block_height
 
     except Exception as error:
         detailed_error_traceback = traceback.format_exc()
-        logger.error(f"Failed transfer spl token: {error}\n{detailed_error_traceback}")
+        logger.error(f"Failed send spl token: {error}\n{detailed_error_traceback}")
+        raise
+
+
+async def transfer_spl_token(
+        sender_address: str,
+        sender_private_key: str,
+        recipient_address: str,
+        mint: str,
+        amount: float,
+        decimals: int,
+        token_program: Optional[str] = None,
+        fee_tier: str = PRIORITY_FEE_TIER,
+    ) -> bool:
+
+    try:
+        signature, last_valid_block_height = await send_spl_token(
+            sender_address, sender_private_key, recipient_address, mint, amount, decimals, token_program, fee_tier
+        )
+        # подтверждение приходит по общему websocket соединению, без опроса для каждой транзакции
+        return await wait_for_confirmation(signature, last_valid_block_height=last_valid_block_height)
+
+    except Exception as error:
         raise Exception(f"Failed transfer spl token: {error}")
-    finally:
-        await client.close()
 
 
 def decode_solana_address(encoded_address: str) -> Optional[Any]:
@@ -636,57 +832,35 @@ def decode_solana_address(encoded_address: str) -> Optional[Any]:
         return None
 
 
-async def get_solana_transaction_history(wallet_address: str, transaction_id_before: str | None, transaction_limit: int) -> list[dict]:
+async def get_transactions(signatures: List[Signature]) -> List[Any]:
     """
-        Retrieves transaction history for a given Solana wallet address.
+        Retrieves the transactions by their signatures.
 
-        Arguments:
-        wallet_address (str): The Solana wallet address.
+        Requests are sent concurrently, at most TRANSACTION_FETCH_CONCURRENCY at a time,
+        so a page of transactions takes a few round trips instead of one per transaction.
+
+        Args:
+            signatures (List[Signature]): Transaction signatures.
 
         Returns:
-        list[dict]: A list of dictionaries representing transactions in JSON format.
+            List[Any]: Transactions in the order of the signatures. Transactions the node does not know are skipped.
     """
-    try:
-        transaction_history = []
-        client = AsyncClient(SOLANA_NODE_URL, timeout=timeout_settings)
-
-        # # Декодируем строку Base58 в байтовый формат
-        # pubkey_bytes = base58.b58decode(wallet_address)
-        # # Создаем объект Pubkey из байтового представления
-        # pubkey = Pubkey(pubkey_bytes)
-        pubkey = Pubkey.from_string(wallet_address)
-
-        try:
-            signature_statuses = (
-                await client.get_signatures_for_address(pubkey, before=transaction_id_before, limit=transaction_limit)
-            ).value
-
-            if signature_statuses:
-                for signature_status in signature_statuses:
-                    # Получаем транзакцию по подписи
-                    transaction = (await client.get_transaction(signature_status.signature)).value
-                    # Добавляем полученную транзакцию в историю транзакций
-                    transaction_history.append(transaction)
-
-                # Возвращаем список истории транзакций
-                return transaction_history
-            return []
-
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 429:
-                # Если получена ошибка "429 Too Many Requests", вернем None
-                return []
-            else:
-                raise e
+    semaphore = asyncio.Semaphore(TRANSACTION_FETCH_CONCURRENCY)
 
-    except Exception as e:
-        detailed_error_traceback = traceback.format_exc()
-        logger.error(
-            f"Failed to get transaction history for Solana wallet {wallet_address}: {e}\n{detailed_error_traceback}"
-        )
-        return []
-    finally:
-        await client.close()
+    async def get_transaction(signature: Signature) -> Any:
+        async with semaphore:
+            return (await call_rpc(
+                lambda client: client.get_transaction(
+                    signature,
+                    # без этого параметра узел возвращает ошибку для v0 транзакций
+                    max_supported_transaction_version=MAX_SUPPORTED_TRANSACTION_VERSION,
+                ),
+                f"get_transaction {signature}",
+            )).value
+
+    # gather возвращает результаты в порядке подписей
+    transactions = await asyncio.gather(*[get_transaction(signature) for signature in signatures])
+    return [transaction for transaction in transactions if transaction is not None]
 
 
 async def get_min_sol_balance() -> int | None:
@@ -699,17 +873,8 @@ async def get_min_sol_balance() -> int | None:
         int|None: minimum sol.
     """
     try:
-        client = AsyncClient(SOLANA_NODE_URL, timeout=timeout_settings)
-
-        for attempt in range(5):
-            try:
-                min_sol_balance = (await client.get_minimum_balance_for_rent_exemption(1)).value
-                break
-            except Exception as e:
-                print(f"Error to get min_sol_balance: {e}. Attempt {attempt + 1} out of 5.")
-                await asyncio.sleep(10)
-        else:
-            raise Exception("Failed to get min_sol_balance after 5 attempts.")
+        # значение берется из кэша параметров сети и обновляется в фоне
+        min_sol_balance = await get_rent_exemption(1)
 
         if min_sol_balance:
             return min_sol_balance
@@ -719,5 +884,3 @@ async def get_min_sol_balance() -> int | None:
         detailed_error_traceback = traceback.format_exc()
         logger.error(f"Failed to get min_sol_balance: {e}\n{detailed_error_traceback}")
         return None
-    finally:
-        await client.close()
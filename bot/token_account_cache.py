@@ -0,0 +1,108 @@
+"""
+    Short-lived cache of the token accounts of the wallets (getTokenAccountsByOwner).
+
+    Responses are cached per (owner, token program) for TOKEN_ACCOUNTS_CACHE_TTL seconds, concurrent callers
+    for the same key share one request. After our own transfer the entries of the sender and the recipient
+    are invalidated with the slot of the transaction: older entries are dropped, and a response of a node
+    that has not reached the slot yet is requested again and is not cached.
+"""
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from solana.rpc.types import TokenAccountOpts
+from solders.pubkey import Pubkey
+from spl.token.constants import TOKEN_2022_PROGRAM_ID, TOKEN_PROGRAM_ID
+
+from bot.cache import TTLCache
+from bot.config import TOKEN_ACCOUNTS_CACHE_SIZE, TOKEN_ACCOUNTS_CACHE_TTL
+from bot.retry import call_rpc
+from logger_config import logger
+
+# Сколько секунд помнить слот нашего перевода, за это время все узлы его догоняют
+MIN_SLOT_TTL = 60
+
+# (владелец, программа токена) -> (слот ответа, токен-аккаунты)
+_token_accounts_cache = TTLCache(max_size=TOKEN_ACCOUNTS_CACHE_SIZE, ttl=TOKEN_ACCOUNTS_CACHE_TTL)
+# владелец -> слот, который должен видеть узел после нашего перевода
+_min_slots = TTLCache(max_size=TOKEN_ACCOUNTS_CACHE_SIZE, ttl=MIN_SLOT_TTL)
+# владелец -> номер инвалидации, ответ запроса, начатого до инвалидации, не кэшируется
+_generations: Dict[str, int] = {}
+_in_flight: Dict[Tuple[str, str], asyncio.Task] = {}
+
+
+async def _fetch_token_accounts(owner: str, program_id: str) -> Tuple[int, List]:
+    response = await call_rpc(
+        lambda client: client.get_token_accounts_by_owner_json_parsed(
+            owner=Pubkey.from_string(owner), opts=TokenAccountOpts(program_id=Pubkey.from_string(program_id))
+        ),
+        f"get_token_accounts_by_owner, owner: {owner}",
+    )
+    return response.context.slot, response.value
+
+
+async def _load_token_accounts(key: Tuple[str, str]) -> List:
+    owner = key[0]
+    generation = _generations.get(owner, 0)
+    min_slot = _min_slots.get(owner, 0)
+
+    slot, token_accounts = await _fetch_token_accounts(*key)
+    if slot < min_slot:
+        # узел еще не видит наш перевод, повторный запрос может попасть на другой узел
+        logger.debug(f"Token accounts of {owner} at slot {slot} are older than {min_slot}, request again")
+        slot, token_accounts = await _fetch_token_accounts(*key)
+
+    if slot >= min_slot and _generations.get(owner, 0) == generation:
+        _token_accounts_cache.set(key, (slot, token_accounts))
+    return token_accounts
+
+
+async def get_token_accounts_by_owner(owner: str, program_id: Pubkey = TOKEN_PROGRAM_ID) -> List:
+    """
+        Returns the parsed token accounts of the owner, from the cache if it is fresh.
+        Concurrent calls for the same owner and program share one request.
+
+        Args:
+            owner (str): Wallet address.
+            program_id (Pubkey): Token program.
+
+        Returns:
+            List: Token accounts (RpcKeyedAccountJsonParsed).
+    """
+    key = (owner, str(program_id))
+    cached = _token_accounts_cache.get(key)
+    if cached is not None:
+        return cached[1]
+
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.create_task(_load_token_accounts(key))
+        _in_flight[key] = task
+        task.add_done_callback(lambda done: _in_flight.pop(key) if _in_flight.get(key) is done else None)
+    # shield: отмена одного ожидающего не отменяет общий запрос
+    return await asyncio.shield(task)
+
+
+def invalidate_token_accounts(owner: str, slot: Optional[int] = None) -> None:
+    """
+        Drops the cached token accounts of the owner.
+
+        Args:
+            owner (str): Wallet address.
+            slot (int | None): Slot of the change. Entries read at this slot or later are kept and responses
+                of nodes behind it are not cached. None - drop all entries of the owner.
+
+        Returns:
+            None
+    """
+    for program_id in (TOKEN_PROGRAM_ID, TOKEN_2022_PROGRAM_ID):
+        key = (owner, str(program_id))
+        cached = _token_accounts_cache.get(key)
+        if cached is not None and (slot is None or cached[0] < slot):
+            _token_accounts_cache.pop(key)
+
+    if slot is not None:
+        _min_slots.set(owner, max(slot, _min_slots.get(owner, 0)))
+    _generations[owner] = _generations.get(owner, 0) + 1
+    # следующий запрос не присоединяется к начатому до инвалидации
+    for program_id in (TOKEN_PROGRAM_ID, TOKEN_2022_PROGRAM_ID):
+        _in_flight.pop((owner, str(program_id)), None)
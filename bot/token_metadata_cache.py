@@ -0,0 +1,183 @@
+"""
+    Read-through cache of SPL token metadata.
+
+    Lookups go through two tiers:
+        1. in-process LRU cache (TOKEN_METADATA_CACHE_TTL), so repeated renders do not touch the database;
+        2. the Token table, so known mints are never fetched from the blockchain or the metadata uri again.
+
+    Staleness rules for the Token table:
+        - metadata_updated is empty - the metadata was never fetched (the row was created by another code path);
+        - the token has no metadata (no name, symbol and uri) or the metadata uri could not be fetched
+          (uri without raw metadata) - retried after TOKEN_METADATA_EMPTY_MAX_AGE;
+        - otherwise the metadata is stale after TOKEN_METADATA_MAX_AGE, 0 means it never gets stale.
+    A failed fetch of the metadata uri keeps the stored raw metadata and its metadata_updated.
+"""
+import traceback
+from datetime import timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from django.utils import timezone
+
+from bot.cache import TTLCache
+from bot.config import (TOKEN_METADATA_CACHE_SIZE, TOKEN_METADATA_CACHE_TTL,
+                        TOKEN_METADATA_EMPTY_MAX_AGE, TOKEN_METADATA_MAX_AGE)
+from bot.utils import get_token, update_or_create_token
+from logger_config import logger
+from web.applications.wallet.models import Token
+
+MetadataLoader = Callable[[str], Awaitable[Dict]]
+
+_metadata_cache = TTLCache(max_size=TOKEN_METADATA_CACHE_SIZE, ttl=TOKEN_METADATA_CACHE_TTL)
+
+
+def token_to_metadata(token: Token) -> Dict:
+    """
+        Builds the metadata dict (same format as get_spl_token_metadata returns) from a Token row.
+
+        Args:
+            token (Token): Token object.
+
+        Returns:
+            Dict: Token metadata.
+    """
+    metadata = {}
+    raw_metadata = token.raw_metadata or {}
+
+    if token.name:
+        metadata['name'] = token.name
+    if token.symbol:
+        metadata['symbol'] = token.symbol
+    if token.metadata_uri:
+        metadata['uri'] = token.metadata_uri
+    if raw_metadata:
+        metadata['raw'] = raw_metadata
+        if 'description' in raw_metadata:
+            metadata['description'] = raw_metadata['description']
+        if 'image' in raw_metadata:
+            metadata['image'] = raw_metadata['image']
+    if 'image' not in metadata and token.logo_url:
+        metadata['image'] = token.logo_url
+
+    return metadata
+
+
+def is_token_metadata_stale(token: Token) -> bool:
+    """
+        Checks whether the metadata stored in the Token table must be fetched again.
+
+        Args:
+            token (Token): Token object.
+
+        Returns:
+            bool: True if the metadata is stale, False otherwise.
+    """
+    if not token.metadata_updated:
+        return True
+
+    age = timezone.now() - token.metadata_updated
+
+    is_empty = not (token.name or token.symbol or token.metadata_uri)
+    is_incomplete = token.metadata_uri and not token.raw_metadata
+    if is_empty or is_incomplete:
+        return age > timedelta(seconds=TOKEN_METADATA_EMPTY_MAX_AGE)
+
+    if TOKEN_METADATA_MAX_AGE:
+        return age > timedelta(seconds=TOKEN_METADATA_MAX_AGE)
+
+    return False
+
+
+async def save_token_metadata(mint_address: str, metadata: Dict) -> Optional[Token]:
+    """
+        Stores fetched metadata in the Token table.
+
+        If the metadata uri could not be fetched, the stored raw metadata is kept and metadata_updated
+        is not changed, so the uri is fetched again on the next lookup.
+
+        Args:
+            mint_address (str): Token mint address.
+            metadata (Dict): Token metadata.
+
+        Returns:
+            Token | None: Saved token, None if it could not be saved.
+    """
+    # значения обрезаются до размера полей модели в update_or_create_token
+    defaults = {
+        'name': metadata.get('name', ''),
+        'symbol': metadata.get('symbol', ''),
+        'metadata_uri': metadata.get('uri', ''),
+    }
+    try:
+        is_uri_failed = metadata.get('uri') and 'raw' not in metadata
+        token = await get_token(mint_account=mint_address) if is_uri_failed else None
+        if not (token and token.raw_metadata):
+            defaults['raw_metadata'] = metadata.get('raw', {})
+            defaults['metadata_updated'] = timezone.now()
+        token, _ = await update_or_create_token(mint_account=mint_address, defaults=defaults)
+        return token
+    except Exception as error:
+        detailed_error_traceback = traceback.format_exc()
+        logger.error(f"Failed to save token metadata, mint: {mint_address}: {error}\n{detailed_error_traceback}")
+        return None
+
+
+async def refresh_token_metadata(mint_address: str, loader: MetadataLoader) -> Dict:
+    """
+        Fetches the metadata from the blockchain and updates both cache tiers.
+
+        Args:
+            mint_address (str): Token mint address.
+            loader (MetadataLoader): Coroutine function that fetches the metadata from the blockchain.
+
+        Returns:
+            Dict: Token metadata.
+    """
+    metadata = await loader(mint_address)
+    token = await save_token_metadata(mint_address, metadata)
+    if token and token.raw_metadata and 'raw' not in metadata:
+        # uri не загрузился, описание и изображение берутся из сохраненных метаданных
+        metadata = token_to_metadata(token)
+    _metadata_cache.set(mint_address, metadata)
+    return metadata
+
+
+async def get_cached_token_metadata(mint_address: str, loader: MetadataLoader) -> Dict:
+    """
+        Returns the token metadata, fetching it from the blockchain only if it is not known yet or stale.
+
+        Args:
+            mint_address (str): Token mint address.
+            loader (MetadataLoader): Coroutine function that fetches the metadata from the blockchain.
+
+        Returns:
+            Dict: Token metadata.
+    """
+    metadata = _metadata_cache.get(mint_address)
+    if metadata is not None:
+        return metadata
+
+    token = await get_token(mint_account=mint_address)
+    if token and not is_token_metadata_stale(token):
+        metadata = token_to_metadata(token)
+        _metadata_cache.set(mint_address, metadata)
+        return metadata
+
+    logger.debug(f"Token metadata cache miss, mint: {mint_address}")
+    return await refresh_token_metadata(mint_address, loader)
+
+
+def invalidate_token_metadata(mint_address: Optional[str] = None) -> None:
+    """
+        Drops the in-process cache entry of the mint, or the whole cache if no mint is given.
+        The next lookup re-reads the Token table.
+
+        Args:
+            mint_address (str | None): Token mint address.
+
+        Returns:
+            None
+    """
+    if mint_address is None:
+        _metadata_cache.clear()
+    else:
+        _metadata_cache.pop(mint_address)
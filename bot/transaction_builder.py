@@ -0,0 +1,194 @@
+"""
+    Compute budget and priority fee for outgoing transactions.
+
+    Under congestion validators schedule transactions by priority fee (compute unit price), a transaction
+    without it waits in the queue until its blockhash expires. The builder simulates the transaction
+    to get the consumed compute units, sets the compute unit limit with a margin and the compute unit price
+    from the recent prioritization fees paid for the writable accounts of the transaction (local fee market).
+    The fees are cached per account set for PRIORITY_FEE_CACHE_TTL seconds, the price is the fee percentile
+    of the tier: economy, normal or fast.
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.core import RPCException
+from solders.compute_budget import set_compute_unit_limit, set_compute_unit_price
+from solders.instruction import Instruction
+from solders.keypair import Keypair
+from solders.message import Message
+from solders.pubkey import Pubkey
+from solders.transaction import Transaction
+
+from bot.blockhash_service import get_recent_blockhash
+from bot.config import (COMPUTE_UNIT_LIMIT_MARGIN, PRIORITY_FEE_CACHE_TTL, PRIORITY_FEE_MAX,
+                        PRIORITY_FEE_MIN, PRIORITY_FEE_TIER, PRIORITY_FEE_TIERS)
+from bot.retry import call_rpc
+from bot.rpc_client import make_json_rpc_request
+from logger_config import logger
+
+# Максимальный лимит вычислительных единиц транзакции, с ним транзакция симулируется
+MAX_COMPUTE_UNIT_LIMIT = 1_400_000
+# Оценка вычислительных единиц перевода с инструкциями лимита и цены, для резерва комиссии до симуляции
+SOL_TRANSFER_COMPUTE_UNITS = 1_000
+# с созданием связанного токен-аккаунта получателя
+SPL_TRANSFER_COMPUTE_UNITS = 50_000
+# Максимальное число адресов в запросе getRecentPrioritizationFees
+MAX_FEE_ACCOUNTS = 128
+
+# Комиссии за приоритет (микролампорты за вычислительную единицу) последних ~150 слотов
+# и время их получения, по изменяемым аккаунтам транзакции
+_recent_fees: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+_fetch_tasks: Dict[Tuple[str, ...], asyncio.Task] = {}
+
+
+async def _fetch_recent_fees(accounts: Tuple[str, ...]) -> List[int]:
+    try:
+        result = await call_rpc(
+            lambda client: make_json_rpc_request(client, "getRecentPrioritizationFees", [list(accounts)]),
+            "get_recent_prioritization_fees",
+        )
+    finally:
+        _fetch_tasks.pop(accounts, None)
+    fees = [fee["prioritizationFee"] for fee in result]
+    now = time.monotonic()
+    # устаревшие комиссии других аккаунтов больше не нужны
+    for stale_accounts in [key for key, (_, updated) in _recent_fees.items() if now - updated >= PRIORITY_FEE_CACHE_TTL]:
+        del _recent_fees[stale_accounts]
+    _recent_fees[accounts] = (fees, now)
+    return fees
+
+
+async def get_recent_fees(accounts: Sequence[Pubkey] = ()) -> List[int]:
+    """
+        Returns the prioritization fees of the recent slots that were paid by transactions locking the accounts,
+        from the cache if it is fresh. Concurrent calls for the same accounts share one request.
+
+        Args:
+            accounts (Sequence[Pubkey]): Writable accounts of the transaction, empty - fees of all transactions.
+
+        Returns:
+            List[int]: Fees in micro-lamports per compute unit.
+    """
+    key = tuple(sorted({str(account) for account in accounts}))[:MAX_FEE_ACCOUNTS]
+    cached = _recent_fees.get(key)
+    if cached and time.monotonic() - cached[1] < PRIORITY_FEE_CACHE_TTL:
+        return cached[0]
+    fetch_task = _fetch_tasks.get(key)
+    if fetch_task is None or fetch_task.done():
+        fetch_task = asyncio.create_task(_fetch_recent_fees(key))
+        _fetch_tasks[key] = fetch_task
+    # shield: отмена одного ожидающего не отменяет общий запрос
+    return await asyncio.shield(fetch_task)
+
+
+async def get_priority_fee(tier: str = PRIORITY_FEE_TIER, accounts: Sequence[Pubkey] = ()) -> int:
+    """
+        Returns the compute unit price for the tier.
+
+        Args:
+            tier (str): Fee tier: economy, normal or fast.
+            accounts (Sequence[Pubkey]): Writable accounts of the transaction, the price follows their local fee market.
+
+        Returns:
+            int: Price in micro-lamports per compute unit, between PRIORITY_FEE_MIN and PRIORITY_FEE_MAX.
+    """
+    try:
+        fees = sorted(await get_recent_fees(accounts))
+    except Exception as error:
+        # без оценки транзакция отправляется с минимальной ценой
+        logger.warning(f"Failed to get recent prioritization fees: {error!r}")
+        fees = []
+
+    fee = fees[(len(fees) - 1) * PRIORITY_FEE_TIERS[tier] // 100] if fees else 0
+    return min(max(fee, PRIORITY_FEE_MIN), PRIORITY_FEE_MAX)
+
+
+async def estimate_priority_fee(
+        compute_unit_limit: int,
+        tier: str = PRIORITY_FEE_TIER,
+        accounts: Sequence[Pubkey] = (),
+    ) -> int:
+    """
+        Estimates the priority fee of a transaction before it is built.
+
+        Args:
+            compute_unit_limit (int): Expected compute unit limit of the transaction.
+            tier (str): Fee tier: economy, normal or fast.
+            accounts (Sequence[Pubkey]): Writable accounts of the transaction.
+
+        Returns:
+            int: Priority fee in lamports.
+    """
+    priority_fee = await get_priority_fee(tier, accounts)
+    # цена задается в микролампортах за вычислительную единицу
+    return -(-priority_fee * compute_unit_limit // 1_000_000)
+
+
+async def simulate_compute_units(instructions: List[Instruction], signers: List[Keypair]) -> Optional[int]:
+    """
+        Simulates the transaction and returns the consumed compute units.
+
+        Args:
+            instructions (List[Instruction]): Transaction instructions without compute budget instructions.
+            signers (List[Keypair]): Transaction signers, the first one pays the fee.
+
+        Raises:
+            RPCException: If the transaction fails in the simulation.
+
+        Returns:
+            int | None: Consumed compute units, None if the node did not return them.
+    """
+    # инструкции лимита и цены тоже потребляют вычислительные единицы, поэтому симулируются вместе с транзакцией
+    message = Message(
+        [set_compute_unit_limit(MAX_COMPUTE_UNIT_LIMIT), set_compute_unit_price(0)] + instructions,
+        signers[0].pubkey(),
+    )
+    transaction = Transaction(signers, message, (await get_recent_blockhash()).blockhash)
+    result = (await call_rpc(
+        lambda client: client.simulate_transaction(transaction),
+        "simulate_transaction",
+    )).value
+    if result.err is not None:
+        # транзакция все равно не пройдет, ошибка как при отправке (preflight)
+        raise RPCException(f"Transaction simulation failed: {result.err}, logs: {result.logs}")
+    return result.units_consumed
+
+
+async def build_message(
+        instructions: List[Instruction],
+        signers: List[Keypair],
+        tier: str = PRIORITY_FEE_TIER,
+    ) -> Message:
+    """
+        Builds the transaction message with the compute unit limit and price.
+
+        Args:
+            instructions (List[Instruction]): Transaction instructions.
+            signers (List[Keypair]): Transaction signers, the first one pays the fee.
+            tier (str): Priority fee tier: economy, normal or fast.
+
+        Raises:
+            RPCException: If the transaction fails in the simulation.
+
+        Returns:
+            Message: Message with the compute budget instructions before the transaction instructions.
+    """
+    # комиссия за приоритет зависит от конкуренции за блокировку изменяемых аккаунтов транзакции
+    writable_accounts = [signers[0].pubkey()] + [
+        account.pubkey for instruction in instructions for account in instruction.accounts if account.is_writable
+    ]
+    units_consumed, priority_fee = await asyncio.gather(
+        simulate_compute_units(instructions, signers),
+        get_priority_fee(tier, writable_accounts),
+    )
+
+    compute_budget_instructions = [set_compute_unit_price(priority_fee)]
+    if units_consumed:
+        compute_unit_limit = min(int(units_consumed * COMPUTE_UNIT_LIMIT_MARGIN), MAX_COMPUTE_UNIT_LIMIT)
+        compute_budget_instructions.insert(0, set_compute_unit_limit(compute_unit_limit))
+    logger.debug(f"Compute budget: units consumed {units_consumed}, price {priority_fee} ({tier})")
+
+    return Message(compute_budget_instructions + instructions, signers[0].pubkey())
+
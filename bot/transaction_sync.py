@@ -0,0 +1,195 @@
+"""
+    Incremental sync of the wallet transaction history into the Transaction table.
+
+    Every wallet stores two cursors:
+        - last_transaction_id - the newest synced transaction (high-water mark). Sync requests signatures
+          with until=last_transaction_id, so only the transactions made after the previous sync are fetched;
+        - backfill_transaction_id - the oldest synced transaction. Backfill requests signatures
+          with before=backfill_transaction_id and moves the cursor into the past until the start of the history
+          (is_history_backfilled).
+
+    If more than TRANSACTION_SYNC_MAX_NEW transactions were made since the previous sync, only the newest ones
+    are synced and the rest becomes a gap: gap_transaction_id (the oldest transaction synced after the gap)
+    and gap_until_transaction_id (the newest one synced before it). Backfill fills the gap first and then
+    continues the history, the backfill cursor is not moved by the gap.
+
+    The cursors are moved only after the transactions are saved, so an interrupted sync is repeated, not lost.
+"""
+import asyncio
+from typing import Dict, List, Optional
+
+from solders.pubkey import Pubkey
+from solders.signature import Signature
+
+from bot.config import TRANSACTION_SYNC_MAX_NEW
+from bot.retry import call_rpc
+from bot.services import get_transactions
+from bot.utils import get_wallet, save_transactions
+from logger_config import logger
+from web.applications.wallet.models import Wallet
+
+# Максимальное количество подписей в одном ответе getSignaturesForAddress
+SIGNATURES_FOR_ADDRESS_LIMIT = 1000
+
+_wallet_locks: Dict[str, asyncio.Lock] = {}
+
+
+def _get_wallet_lock(wallet_address: str) -> asyncio.Lock:
+    lock = _wallet_locks.get(wallet_address)
+    if lock is None:
+        lock = asyncio.Lock()
+        _wallet_locks[wallet_address] = lock
+    return lock
+
+
+async def get_signatures(
+        wallet_address: str,
+        before: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: int = SIGNATURES_FOR_ADDRESS_LIMIT,
+    ) -> List:
+    """
+        Retrieves the signatures of the wallet transactions between two signatures, newest first.
+
+        Args:
+            wallet_address (str): The Solana wallet address.
+            before (str | None): Start searching backwards from this transaction signature.
+            until (str | None): Search until this transaction signature (exclusive).
+            limit (int): Maximum number of signatures.
+
+        Returns:
+            List: Signature statuses (RpcConfirmedTransactionStatusWithSignature), newest first.
+    """
+    pubkey = Pubkey.from_string(wallet_address)
+    signature_statuses = []
+
+    while len(signature_statuses) < limit:
+        page_limit = min(limit - len(signature_statuses), SIGNATURES_FOR_ADDRESS_LIMIT)
+        page = (await call_rpc(
+            lambda client: client.get_signatures_for_address(
+                pubkey,
+                before=Signature.from_string(before) if before else None,
+                until=Signature.from_string(until) if until else None,
+                limit=page_limit,
+            ),
+            f"get_signatures_for_address {wallet_address}",
+        )).value
+
+        signature_statuses += page
+        if len(page) < page_limit:
+            break
+        before = str(page[-1].signature)
+
+    return signature_statuses
+
+
+async def _fetch_and_save_transactions(wallet_address: str, signature_statuses: List) -> None:
+    transactions = await get_transactions([signature_status.signature for signature_status in signature_statuses])
+    await save_transactions(transactions, wallet_address=wallet_address)
+
+
+async def sync_wallet_transactions(wallet_address: str) -> int:
+    """
+        Fetches the transactions made after the previous sync and stores them in the database.
+
+        On the first sync only the newest TRANSACTION_SYNC_MAX_NEW transactions are fetched,
+        the older history is loaded by backfill_wallet_transactions.
+        If more than TRANSACTION_SYNC_MAX_NEW transactions were made since the previous sync,
+        the newest ones are stored and the gap is filled by backfill.
+
+        Args:
+            wallet_address (str): The Solana wallet address.
+
+        Returns:
+            int: Number of the new transactions.
+    """
+    async with _get_wallet_lock(wallet_address):
+        wallet = await get_wallet(wallet_address)
+        if not wallet:
+            return 0
+
+        # лишняя подпись не сохраняется, она только показывает, что новых транзакций больше лимита
+        signature_statuses = await get_signatures(
+            wallet_address, until=wallet.last_transaction_id or None, limit=TRANSACTION_SYNC_MAX_NEW + 1
+        )
+        if not signature_statuses:
+            return 0
+        has_more = len(signature_statuses) > TRANSACTION_SYNC_MAX_NEW
+        signature_statuses = signature_statuses[:TRANSACTION_SYNC_MAX_NEW]
+
+        await _fetch_and_save_transactions(wallet_address, signature_statuses)
+
+        fields = {
+            'last_transaction_id': str(signature_statuses[0].signature),
+            'last_transaction_slot': signature_statuses[0].slot,
+        }
+        if not wallet.last_transaction_id:
+            # первая синхронизация: более старые транзакции догружаются через backfill
+            fields['backfill_transaction_id'] = str(signature_statuses[-1].signature)
+            fields['is_history_backfilled'] = not has_more
+        elif has_more:
+            # разрыв между новыми и сохраненными транзакциями догружается отдельно от истории,
+            # незаполненный предыдущий разрыв объединяется с новым
+            fields['gap_transaction_id'] = str(signature_statuses[-1].signature)
+            fields['gap_until_transaction_id'] = wallet.gap_until_transaction_id or wallet.last_transaction_id
+
+        await Wallet.objects.filter(pk=wallet.pk).aupdate(**fields)
+        logger.debug(f"Synced {len(signature_statuses)} new transactions of wallet {wallet_address}")
+        return len(signature_statuses)
+
+
+async def backfill_wallet_transactions(wallet_address: str, limit: int) -> int:
+    """
+        Fetches the transactions of the sync gap, then the transactions older than the oldest synced one,
+        and stores them in the database.
+
+        Args:
+            wallet_address (str): The Solana wallet address.
+            limit (int): Maximum number of transactions to fetch.
+
+        Returns:
+            int: Number of the fetched transactions.
+    """
+    async with _get_wallet_lock(wallet_address):
+        wallet = await get_wallet(wallet_address)
+        if not wallet:
+            return 0
+
+        number_fetched = 0
+        if wallet.gap_transaction_id:
+            signature_statuses = await get_signatures(
+                wallet_address,
+                before=wallet.gap_transaction_id,
+                until=wallet.gap_until_transaction_id or None,
+                limit=limit,
+            )
+            if signature_statuses:
+                await _fetch_and_save_transactions(wallet_address, signature_statuses)
+
+            if len(signature_statuses) < limit:
+                # разрыв заполнен
+                fields = {'gap_transaction_id': '', 'gap_until_transaction_id': ''}
+            else:
+                fields = {'gap_transaction_id': str(signature_statuses[-1].signature)}
+            await Wallet.objects.filter(pk=wallet.pk).aupdate(**fields)
+            logger.debug(f"Filled {len(signature_statuses)} transactions of the sync gap of wallet {wallet_address}")
+            number_fetched += len(signature_statuses)
+            limit -= len(signature_statuses)
+
+        if limit <= 0 or wallet.is_history_backfilled or not wallet.backfill_transaction_id:
+            # история уже загружена полностью или кошелек еще не синхронизирован
+            return number_fetched
+
+        signature_statuses = await get_signatures(
+            wallet_address, before=wallet.backfill_transaction_id, limit=limit
+        )
+        if signature_statuses:
+            await _fetch_and_save_transactions(wallet_address, signature_statuses)
+
+        fields = {'is_history_backfilled': len(signature_statuses) < limit}
+        if signature_statuses:
+            fields['backfill_transaction_id'] = str(signature_statuses[-1].signature)
+
+        await Wallet.objects.filter(pk=wallet.pk).aupdate(**fields)
+        logger.debug(f"Backfilled {len(signature_statuses)} transactions of wallet {wallet_address}")
+        return number_fetched + len(signature_statuses)
@@ -0,0 +1,227 @@
+"""
+    Background sending and tracking of transfers.
+
+    The transfer handler answers with a "submitted" message and hands the transfer over to the tracker,
+    so the user does not wait for the send retries and the confirmation. The tracker sends the transaction,
+    waits for it with the shared confirmation manager and edits the message when the transfer is confirmed,
+    finalized, failed or expired. A tracked transfer costs one task waiting for a future,
+    so one bot process can track hundreds of transfers. When the tracking ends the balance snapshots
+    of the sender and recipient wallets are refreshed.
+"""
+import asyncio
+import traceback
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.types import Message
+from solana.rpc.core import RPCException
+from solders.signature import Signature
+
+from bot.config import (CONFIRMATION_COMMITMENT, TRANSFER_TRACKER_MAX_SENDING,
+                        TRANSFER_TRACKER_SHUTDOWN_TIMEOUT)
+from bot.confirmation import (TransactionExpiredError, TransactionStatusUnknownError,
+                              get_confirmation_slot, wait_for_confirmation)
+from bot.portfolio import refresh_portfolios
+from bot.token_account_cache import invalidate_token_accounts
+from bot.utils import get_translation
+from logger_config import logger
+
+
+@dataclass
+class TrackedTransfer:
+    """
+        Transfer whose status is shown in a bot message.
+
+        Attributes:
+            bot (Bot): Bot that sent the status message.
+            chat_id (int): Chat of the status message.
+            message_id (int): Status message id.
+            lang (str): User language code.
+            amount (str): Formatted transfer amount.
+            token (str): Token name shown to the user.
+            recipient (str): Recipient's address.
+            sender (str | None): Sender's address.
+            signature (Signature | None): Transaction signature, known after sending.
+            is_sending (bool): Whether sending of the transaction started, after it the transaction
+                may be in the network even without a signature.
+    """
+    bot: Bot
+    chat_id: int
+    message_id: int
+    lang: str
+    amount: str
+    token: str
+    recipient: str
+    sender: Optional[str] = None
+    signature: Optional[Signature] = None
+    is_sending: bool = False
+
+
+# Задачи отслеживаемых переводов, ссылки хранятся, чтобы задачи не удалил сборщик мусора
+_tasks: Set[asyncio.Task] = set()
+_send_semaphore: Optional[asyncio.Semaphore] = None
+# Отправки транзакций, которые выполняются сейчас, при остановке бота они завершаются, а не отменяются
+_send_tasks: Set[asyncio.Task] = set()
+# Бот останавливается, новые отправки не начинаются
+_closing = False
+
+
+async def _update_message(transfer: TrackedTransfer, translation_key: str) -> None:
+    TRANSLATION = await get_translation(lang=transfer.lang)
+    text = TRANSLATION[translation_key].format(
+        amount=transfer.amount,
+        token=transfer.token,
+        recipient=transfer.recipient,
+        signature=transfer.signature or '-',
+    )
+    try:
+        await transfer.bot.edit_message_text(text=text, chat_id=transfer.chat_id, message_id=transfer.message_id)
+    except Exception as error:
+        # сообщение могли удалить, статус перевода при этом не меняется
+        logger.warning(f"Failed to update transfer message {transfer.message_id}: {error!r}")
+
+
+async def _refresh_portfolios(transfer: TrackedTransfer) -> None:
+    addresses = [address for address in (transfer.sender, transfer.recipient) if address]
+    # кэшированные токен-аккаунты старше слота перевода не используются
+    slot = get_confirmation_slot(transfer.signature) if transfer.signature else None
+    for address in addresses:
+        invalidate_token_accounts(address, slot)
+    try:
+        # снимки обновляются только для кошельков из бд
+        await refresh_portfolios(addresses)
+    except Exception as error:
+        logger.warning(f"Failed to refresh balances after transfer {transfer.signature}: {error!r}")
+
+
+async def _send_and_track(transfer: TrackedTransfer, send: Callable[[], Awaitable[Tuple[Signature, int]]]) -> None:
+    global _send_semaphore
+    if _send_semaphore is None:
+        _send_semaphore = asyncio.Semaphore(TRANSFER_TRACKER_MAX_SENDING)
+
+    try:
+        async with _send_semaphore:
+            if _closing:
+                await _update_message(transfer, "transfer_not_sent")
+                return
+            transfer.is_sending = True
+            send_task = asyncio.create_task(send())
+            _send_tasks.add(send_task)
+            send_task.add_done_callback(_send_tasks.discard)
+            # shield: отмена отслеживания не прерывает отправку на середине
+            transfer.signature, last_valid_block_height = await asyncio.shield(send_task)
+    except TransactionStatusUnknownError as error:
+        # транзакция могла попасть в сеть, ее статус проверяется по подписи
+        transfer.signature, last_valid_block_height = error.signature, error.last_valid_block_height
+    except RPCException as error:
+        # перевод отклонен при проверке (preflight), транзакция не отправлена
+        if "InsufficientFundsForRent" in str(error):
+            await _update_message(transfer, "insufficient_balance_recipient")
+        else:
+            await _update_message(transfer, "transfer_failed")
+        return
+    except Exception:
+        # ошибка до отправки (проверка, сборка транзакции) или узел транзакцию не получил
+        await _update_message(transfer, "transfer_failed")
+        return
+
+    logger.info(f"Transfer {transfer.signature} submitted, tracked transfers: {len(_tasks)}")
+    try:
+        if not await wait_for_confirmation(transfer.signature, CONFIRMATION_COMMITMENT, last_valid_block_height):
+            await _update_message(transfer, "transfer_failed")
+            return
+
+        if CONFIRMATION_COMMITMENT != 'finalized':
+            await _update_message(transfer, "transfer_confirmed")
+            # подтвержденная транзакция уже не может истечь, last_valid_block_height не передается
+            if not await wait_for_confirmation(transfer.signature, 'finalized'):
+                await _update_message(transfer, "transfer_failed")
+                return
+
+        await _update_message(transfer, "transfer_finalized")
+
+    except TransactionExpiredError:
+        await _update_message(transfer, "transfer_expired")
+    except TimeoutError:
+        await _update_message(transfer, "transfer_status_unknown")
+    except Exception as error:
+        detailed_error_traceback = traceback.format_exc()
+        logger.error(f"Failed to track transfer {transfer.signature}: {error}\n{detailed_error_traceback}")
+        await _update_message(transfer, "transfer_status_unknown")
+
+    # комиссия списывается и с неуспешной транзакции
+    await _refresh_portfolios(transfer)
+
+
+async def _track_transfer(transfer: TrackedTransfer, send: Callable[[], Awaitable[Tuple[Signature, int]]]) -> None:
+    try:
+        await _send_and_track(transfer, send)
+    except asyncio.CancelledError:
+        # бот остановлен: сообщение "отправлен" больше не обновится, поэтому показываем последний известный статус
+        await _update_message(transfer, "transfer_status_unknown" if transfer.is_sending else "transfer_not_sent")
+        raise
+
+
+async def submit_transfer(
+        message: Message,
+        amount: str,
+        token: str,
+        recipient: str,
+        send: Callable[[], Awaitable[Tuple[Signature, int]]],
+        sender: Optional[str] = None,
+    ) -> None:
+    """
+        Answers the user with a "submitted" message and sends and tracks the transfer in the background.
+
+        Args:
+            message (Message): The user's message to answer.
+            amount (str): Formatted transfer amount.
+            token (str): Token name shown to the user.
+            recipient (str): Recipient's address.
+            send (Callable[[], Awaitable[Tuple[Signature, int]]]): Sends the transaction and returns its signature
+                and the last valid block height of its blockhash. Ex.: send_sol_token.
+            sender (str | None): Sender's address, its balance snapshot is refreshed after the transfer.
+
+        Returns:
+            None
+    """
+    TRANSLATION = await get_translation(lang=message.from_user.language_code)
+    sent_message = await message.answer(
+        TRANSLATION["transfer_submitted"].format(amount=amount, token=token, recipient=recipient)
+    )
+    transfer = TrackedTransfer(
+        bot=message.bot,
+        chat_id=sent_message.chat.id,
+        message_id=sent_message.message_id,
+        lang=message.from_user.language_code,
+        amount=amount,
+        token=token,
+        recipient=recipient,
+        sender=sender,
+    )
+    task = asyncio.create_task(_track_transfer(transfer, send))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def close_transfer_tracker() -> None:
+    """
+        Stops tracking of the transfers. Registered as Dispatcher shutdown handler.
+
+        Transfers that are being sent are given TRANSFER_TRACKER_SHUTDOWN_TIMEOUT seconds to finish sending,
+        queued transfers are not sent. The messages of all stopped transfers are updated with their last status.
+
+        Returns:
+            None
+    """
+    global _closing
+    _closing = True
+    if _send_tasks:
+        logger.info(f"Waiting for {len(_send_tasks)} transfers being sent")
+        await asyncio.wait(list(_send_tasks), timeout=TRANSFER_TRACKER_SHUTDOWN_TIMEOUT)
+    if _tasks:
+        logger.warning(f"Stop tracking {len(_tasks)} transfers")
+    for task in list(_tasks):
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
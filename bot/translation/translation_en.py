@@ -45,6 +45,7 @@ MAIN_MENU_BUTTONS: dict[str, str] = {
 # Дополнительные кнопки
 OTHER_BUTTONS: dict[str, str] = {
     "button_back": "⬅️ back",
+    "button_refresh": "🔄 refresh",
     "back_to_main_menu": "<b>🏠 Main menu</b>\n\n"
                          "<i>To view the list of available commands, type /help 😊</i>",
     "save_wallet": "<i>Yes</i>",
@@ -88,7 +89,10 @@ CONNECT_WALLET_MESSAGE = {
 # Сообщения для обработки команды balance
 BALANCE_MESSAGE = {
     "no_registered_wallet": "<b>🛑 You don't have a registered wallet.</b>",
-    "balance_success": "<b>💰 Your wallet balance:</b> {balance} SOL"
+    "balance_success": "<b>💰 Your wallet balance:</b> {balance} SOL",
+    "wallet_info_tokens_unavailable": "   <i>⚠️ Token balances are temporarily unavailable.</i>\n",
+    "wallet_info_updated": "   <i>🕒 Updated: {updated} UTC, slot {slot}</i>\n",
+    "incoming_transfer": "<b>💰 Incoming transfer:</b> +{amount} {token}\n\n💼 {name} 📍 <code>{address}</code>",
 }
 
 # Сообщения для переноса
@@ -104,6 +108,21 @@ TOKEN_TRANSFER_TRANSACTION_MESSAGE = {
     "transfer_successful_bsc": "<b>✅ Transfer of {amount} BNB to\n\n<i>{recipient}</i>\n\nsuccessful.</b>",
     "transfer_not_successful": "<b>❌ Failed to transfer {amount} SOL to\n\n<i>{recipient}.</i></b>",
     "transfer_not_successful_bsc": "<b>❌ Failed to transfer {amount} BNB to\n\n<i>{recipient}.</i></b>",
+    "transfer_submitted": "<b>⏳ Transfer of {amount} {token} to\n\n<i>{recipient}</i>\n\nsubmitted.</b>\n\n"
+                          "<i>This message will be updated when the transfer is confirmed.</i>",
+    "transfer_confirmed": "<b>✅ Transfer of {amount} {token} to\n\n<i>{recipient}</i>\n\nconfirmed.</b>\n\n"
+                          "<b>💼 Transaction:</b> <code>{signature}</code>\n\n<i>Waiting for finalization...</i>",
+    "transfer_finalized": "<b>✅ Transfer of {amount} {token} to\n\n<i>{recipient}</i>\n\nfinalized.</b>\n\n"
+                          "<b>💼 Transaction:</b> <code>{signature}</code>",
+    "transfer_failed": "<b>❌ Failed to transfer {amount} {token} to\n\n<i>{recipient}.</i></b>",
+    "transfer_expired": "<b>⌛ Transfer of {amount} {token} to\n\n<i>{recipient}</i>\n\nexpired.</b>\n\n"
+                        "<i>The transaction was not processed, no funds were debited. Please try again.</i>",
+    "transfer_status_unknown": "<b>❓ Transfer of {amount} {token} to\n\n<i>{recipient}</i>\n\nis not confirmed yet.</b>\n\n"
+                               "<b>💼 Transaction:</b> <code>{signature}</code>\n\n"
+                               "<i>Check the transaction history later.</i>",
+    "transfer_not_sent": "<b>❌ Transfer of {amount} {token} to\n\n<i>{recipient}</i>\n\nwas not sent.</b>\n\n"
+                         "<i>The bot was restarted, no funds were debited. Please try again.</i>",
+    "spl_token_name": "tokens",
     "insufficient_balance": "<b>❌ Insufficient funds in your wallet for this transfer.</b>",
     "insufficient_balance_recipient": "<b>❌ The recipient's balance\nshould be at least 0.00089784 Sol.</b>",
     "insufficient_balance_recipient_bsc": "<b>❌ The recipient's balance</b>",
@@ -120,9 +139,11 @@ TOKEN_TRANSFER_TRANSACTION_MESSAGE = {
     "token_info_template": "{name} 💼 {symbol} 💰 {amount}",
     "invalid_amount": "<b>❌ Invalid amount.</b>",
     "transfer_sender_private_key_prompt": "<b>Enter private key or seed phrase for this wallet:</b>",
+    "transfer_sender_private_key_expired": "<b>⌛ The private key is no longer stored for security reasons.</b>",
     "invalid_private_key": "<b>❌ Invalid private key.</b>",
     "invalid_seed_phrase": "<b>❌ Invalid seed phrase.</b>",
     "empty_history": "😔 Transaction history is empty.",
+    "update_busy": "⏳ Still processing your previous actions, please wait.",
     "server_unavailable": "The server is currently unavailable. Please try again later.",
     "transaction_info": "<b>💼 Transaction:</b> {transaction_id}:\n"
                         "<b>📲 Sender:</b> {sender}\n"
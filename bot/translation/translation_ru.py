@@ -45,6 +45,7 @@ MAIN_MENU_BUTTONS: dict[str, str] = {
 # Дополнительные кнопки
 OTHER_BUTTONS: dict[str, str] = {
     "button_back": "⬅️ назад",
+    "button_refresh": "🔄 обновить",
     "back_to_main_menu": "<b>🏠 Главное меню</b>\n\n"
                          "<i>Чтобы просмотреть список доступных команд, введите /help 😊</i>",
     "save_wallet": "<i>Да</i>",
@@ -88,7 +89,10 @@ CONNECT_WALLET_MESSAGE = {
 # Сообщения для обработки команды balance
 BALANCE_MESSAGE = {
     "no_registered_wallet": "<b>🛑 У вас нет зарегистрированного кошелька.</b>",
-    "balance_success": "<b>💰 Баланс вашего кошелька:</b> {balance} SOL"
+    "balance_success": "<b>💰 Баланс вашего кошелька:</b> {balance} SOL",
+    "wallet_info_tokens_unavailable": "   <i>⚠️ Балансы токенов временно недоступны.</i>\n",
+    "wallet_info_updated": "   <i>🕒 Обновлено: {updated} UTC, слот {slot}</i>\n",
+    "incoming_transfer": "<b>💰 Входящий перевод:</b> +{amount} {token}\n\n💼 {name} 📍 <code>{address}</code>",
 }
 
 # Сообщения для переноса
@@ -101,6 +105,21 @@ TOKEN_TRANSFER_TRANSACTION_MESSAGE = {
     "invalid_wallet_address": "<b>❌ Не корректный адрес кошелька.</b>",
     "transfer_successful": "<b>✅ Перевод {amount} SOL\n\n<i>{recipient}</i>\n\n прошёл успешно.</b>",
     "transfer_not_successful": "<b>❌ Не удалось перевести {amount} SOL на\n\n<i>{recipient}.</i></b>",
+    "transfer_submitted": "<b>⏳ Перевод {amount} {token} на\n\n<i>{recipient}</i>\n\nотправлен.</b>\n\n"
+                          "<i>Сообщение обновится, когда перевод будет подтвержден.</i>",
+    "transfer_confirmed": "<b>✅ Перевод {amount} {token} на\n\n<i>{recipient}</i>\n\nподтвержден.</b>\n\n"
+                          "<b>💼 Транзакция:</b> <code>{signature}</code>\n\n<i>Ожидание финализации...</i>",
+    "transfer_finalized": "<b>✅ Перевод {amount} {token} на\n\n<i>{recipient}</i>\n\nфинализирован.</b>\n\n"
+                          "<b>💼 Транзакция:</b> <code>{signature}</code>",
+    "transfer_failed": "<b>❌ Не удалось перевести {amount} {token} на\n\n<i>{recipient}.</i></b>",
+    "transfer_expired": "<b>⌛ Срок действия перевода {amount} {token} на\n\n<i>{recipient}</i>\n\nистек.</b>\n\n"
+                        "<i>Транзакция не выполнена, средства не списаны. Попробуйте еще раз.</i>",
+    "transfer_status_unknown": "<b>❓ Перевод {amount} {token} на\n\n<i>{recipient}</i>\n\nеще не подтвержден.</b>\n\n"
+                               "<b>💼 Транзакция:</b> <code>{signature}</code>\n\n"
+                               "<i>Проверьте историю транзакций позже.</i>",
+    "transfer_not_sent": "<b>❌ Перевод {amount} {token} на\n\n<i>{recipient}</i>\n\nне отправлен.</b>\n\n"
+                         "<i>Бот был перезапущен, средства не списаны. Попробуйте еще раз.</i>",
+    "spl_token_name": "токенов",
     "insufficient_balance": "<b>❌ В вашем кошельке недостаточно средств для этого перевода.</b>",
     "insufficient_balance_recipient": "<b>❌ Баланс получателя\nдолжен составлять не менее 0,00089784 SOL.</b>",
     "no_wallet_connected": "<b>🔗 Пожалуйста, подключите свой кошелек перед передачей токенов.</b>",
@@ -116,9 +135,11 @@ TOKEN_TRANSFER_TRANSACTION_MESSAGE = {
     "token_info_template": "{name} 💼 {symbol} 💰 {amount}",
     "invalid_amount": "<b>❌ Не корректное количество.</b>",
     "transfer_sender_private_key_prompt": "<b>Введите приватный ключ или начальную фразу для этого кошелька:</b>",
+    "transfer_sender_private_key_expired": "<b>⌛ В целях безопасности приватный ключ больше не хранится.</b>",
     "invalid_private_key": "<b>❌ Не корректный приватный ключ.</b>",
     "invalid_seed_phrase": "<b>❌ Не корректная seed фраза.</b>",
     "empty_history": "😔 История транзакций пустая.",
+    "update_busy": "⏳ Предыдущие действия еще обрабатываются, подождите.",
     "server_unavailable": "Сервер в настоящее время недоступен. Пожалуйста, повторите попытку позже.",
     "transaction_info": "<b>💼 Транзакция:</b> {transaction_id}:\n"
                         "<b>📲 Отправитель:</b> {sender}\n"
@@ -1,12 +1,17 @@
 import json
 from typing import Any, Dict, List, Optional, Tuple
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser
+from django.db import transaction as db_transaction
+from django.db.models import Case, Q, Value, When
+from django.utils import timezone
 
 from bot.translation.translation_en import TRANSLATION_EN
 from bot.translation.translation_ru import TRANSLATION_RU
-from web.applications.wallet.models import HDWallet, Token, Transaction, Wallet
+from web.applications.wallet.models import (HDWallet, Token, Transaction, Wallet,
+                                            WalletBalance)
 
 
 async def get_translation(lang: str) -> dict:
@@ -33,10 +38,20 @@ async def get_user(telegram_id: int) -> AbstractUser | None:
 
 
 async def update_or_create_token(mint_account: str, defaults: dict) -> Tuple[Token, bool]:
+    # имя, символ и uri из метаданных токена могут быть длиннее полей модели, обрезаем их
+    defaults = {
+        field_name: value[:Token._meta.get_field(field_name).max_length]
+        if isinstance(value, str) and getattr(Token._meta.get_field(field_name), 'max_length', None) else value
+        for field_name, value in defaults.items()
+    }
     token, created = await Token.objects.aupdate_or_create(mint_account=mint_account, defaults=defaults)
     return token, created
 
 
+async def update_token_program(mint_account: str, program: str) -> int:
+    return await Token.objects.filter(mint_account=mint_account).aupdate(program=program)
+
+
 async def get_wallet(wallet_address: str) -> Wallet | None:
     wallet = await Wallet.objects.filter(wallet_address=wallet_address).afirst()
     return wallet
@@ -45,11 +60,23 @@ async def get_wallet(wallet_address: str) -> Wallet | None:
 async def update_wallet(wallet_address: str, solana_derivation_path: str) -> Wallet | None:
     wallet = await Wallet.objects.filter(wallet_address=wallet_address).afirst()
     if wallet:
-        wallet.solana_derivation_path = solana_derivation_path
-        await wallet.asave()
+        wallet.derivation_path = solana_derivation_path
+        await wallet.asave(update_fields=['derivation_path', 'modified'])
     return wallet
 
 
+async def update_wallets_derivation_paths(derivation_paths: Dict[str, str]) -> int:
+    if not derivation_paths:
+        return 0
+    # один запрос для всех кошельков
+    return await Wallet.objects.filter(wallet_address__in=derivation_paths).aupdate(
+        derivation_path=Case(*[
+            When(wallet_address=wallet_address, then=Value(derivation_path))
+            for wallet_address, derivation_path in derivation_paths.items()
+        ])
+    )
+
+
 async def get_token(mint_account: str) -> Token | None:
     token = await Token.objects.filter(mint_account=mint_account).afirst()
     return token
@@ -63,56 +90,204 @@ async def get_transaction_history_from_db(wallet_address: str) -> list[Transacti
     return transaction_history_from_db
 
 
-async def save_transaction(tr: Any) -> None:
-    address_list = []
-    wallets = None
-    tr_dict = json.loads(tr.to_json())
-
-    transaction_id = tr_dict['transaction']['signatures'][0] or ''
-    sender = tr_dict['transaction']['message']['accountKeys'][0] or ''
-    recipient = tr_dict['transaction']['message']['accountKeys'][1] or ''
-    slot = tr_dict['slot'] or None
-    transaction_time = tr_dict['blockTime'] or None
-    transaction_status = f"{tr_dict['meta']['status'] or ''}"
-    transaction_err = f"{tr_dict['meta']['err']  or ''}"
-    pre_balances = tr_dict['meta']['preBalances'][0] or None
-    post_balances = tr_dict['meta']['postBalances'][0] or None
-
-    if sender:
-        address_list.append(sender)
-
-    if recipient:
-        address_list.append(recipient)
-
-    if address_list:
-        wallets = await Wallet.objects.filter(wallet_address__in=address_list)
-
-    if wallets and transaction_id:
-        transaction_obj = await Transaction.objects.filter(transaction_id=transaction_id).afirst()
-
-        if transaction_obj:
-            # if the transaction exists - update the wallets
-            await transaction_obj.wallet.aset(wallets)
-
-        else:
-            try:
-                create_transaction_obj = await Transaction.objects.acreate(
-                    transaction_id =transaction_id,
-                    slot=slot,
-                    transaction_time=transaction_time,
-                    sender=sender,
-                    recipient=recipient,
-                    pre_balances=pre_balances,
-                    post_balances=post_balances,
-                    transaction_status=transaction_status,
-                    transaction_err=transaction_err,
-                )
-
-                await create_transaction_obj.wallet.aset(wallets)
-            except Exception as er:
-                print(f'Error create transaction: {er}')
+def transaction_to_fields(tr: Any) -> Dict:
+    """
+        Extracts the Transaction model fields from a fetched transaction.
 
-    return None
+        Args:
+            tr (Any): Transaction (EncodedConfirmedTransactionWithStatusMeta) returned by get_transaction.
+
+        Returns:
+            Dict: Transaction model fields.
+    """
+    transaction = tr.transaction.transaction
+    meta = tr.transaction.meta
+    account_keys = transaction.message.account_keys
+    status_max_length = Transaction._meta.get_field('transaction_status').max_length
+    err_max_length = Transaction._meta.get_field('transaction_err').max_length
+
+    if meta.err is None:
+        status, err = {'Ok': None}, None
+    else:
+        # ошибка сохраняется в JSON форме ответа RPC, как и раньше; транзакций с ошибкой мало, полная сериализация дешева
+        meta_json = json.loads(tr.to_json())['meta']
+        status, err = meta_json['status'], meta_json['err']
+
+    return {
+        'transaction_id': str(transaction.signatures[0]),
+        'sender': str(account_keys[0]) if account_keys else '',
+        'recipient': str(account_keys[1]) if len(account_keys) > 1 else '',
+        'slot': tr.slot or None,
+        'transaction_time': tr.block_time or None,
+        # формат как в ответе RPC: {'Ok': None} или {'Err': {'InstructionError': [0, {'Custom': 1}]}}
+        'transaction_status': f"{status or ''}"[:status_max_length],
+        'transaction_err': f"{err or ''}"[:err_max_length],
+        'pre_balances': (meta.pre_balances[0] or None) if meta.pre_balances else None,
+        'post_balances': (meta.post_balances[0] or None) if meta.post_balances else None,
+    }
+
+
+def _save_transactions(transactions_fields: List[Dict], wallet_address: Optional[str]) -> int:
+    addresses = {fields['sender'] for fields in transactions_fields} | {fields['recipient'] for fields in transactions_fields}
+    if wallet_address:
+        # кошелек, историю которого синхронизируем, может быть не первым и не вторым аккаунтом транзакции
+        addresses.add(wallet_address)
+    wallet_ids = dict(Wallet.objects.filter(wallet_address__in=addresses).values_list('wallet_address', 'id'))
+    if not wallet_ids:
+        return 0
+
+    # сохраняем только транзакции, которые относятся к кошелькам из бд
+    transactions_fields = [
+        fields for fields in transactions_fields
+        if wallet_address in wallet_ids or fields['sender'] in wallet_ids or fields['recipient'] in wallet_ids
+    ]
+    transaction_ids = [fields['transaction_id'] for fields in transactions_fields]
+    WalletTransaction = Transaction.wallet.through
+
+    with db_transaction.atomic():
+        # уже сохраненные транзакции пропускаются
+        Transaction.objects.bulk_create(
+            [Transaction(**fields) for fields in transactions_fields], ignore_conflicts=True
+        )
+        # при ignore_conflicts bulk_create не возвращает id, поэтому получаем их одним запросом
+        transaction_pks = dict(
+            Transaction.objects.filter(transaction_id__in=transaction_ids).values_list('transaction_id', 'id')
+        )
+
+        links = []
+        for fields in transactions_fields:
+            transaction_wallets = {fields['sender'], fields['recipient']}
+            if wallet_address:
+                transaction_wallets.add(wallet_address)
+            links += [
+                WalletTransaction(transaction_id=transaction_pks[fields['transaction_id']], wallet_id=wallet_ids[address])
+                for address in transaction_wallets if address in wallet_ids
+            ]
+        WalletTransaction.objects.bulk_create(links, ignore_conflicts=True)
+
+    return len(transactions_fields)
+
+
+async def save_transactions(transactions: List[Any], wallet_address: Optional[str] = None) -> int:
+    """
+        Stores the fetched transactions and links them to the wallets from the database in a few queries.
+
+        Args:
+            transactions (List[Any]): Transactions returned by get_transaction.
+            wallet_address (str | None): Wallet the transactions were fetched for, it is linked to every transaction.
+
+        Returns:
+            int: Number of the transactions related to the wallets from the database.
+    """
+    if not transactions:
+        return 0
+    transactions_fields = [transaction_to_fields(tr) for tr in transactions]
+    return await sync_to_async(_save_transactions)(transactions_fields, wallet_address)
+
+
+async def save_transaction(tr: Any, wallet_address: Optional[str] = None) -> None:
+    await save_transactions([tr], wallet_address=wallet_address)
+
+
+async def get_owned_wallet_addresses(wallet_addresses: Optional[List[str]] = None) -> List[str]:
+    """
+        Returns the addresses of the wallets that have at least one owner.
+
+        Args:
+            wallet_addresses (List[str] | None): Only these addresses are checked, None - all wallets.
+
+        Returns:
+            List[str]: Wallet addresses.
+    """
+    wallets = Wallet.objects.filter(user__isnull=False)
+    if wallet_addresses is not None:
+        wallets = wallets.filter(wallet_address__in=wallet_addresses)
+    return [address async for address in wallets.order_by('id').values_list('wallet_address', flat=True).distinct()]
+
+
+async def get_wallet_balances(wallet_addresses: List[str]) -> Dict[str, WalletBalance]:
+    return {
+        snapshot.wallet.wallet_address: snapshot
+        async for snapshot in WalletBalance.objects.filter(
+            wallet__wallet_address__in=wallet_addresses).select_related('wallet')
+    }
+
+
+async def update_wallet_lamports(wallet_balance: WalletBalance, lamports: int, slot: int) -> bool:
+    """
+        Updates the SOL balance of the snapshot unless the snapshot was read at a later slot.
+
+        Args:
+            wallet_balance (WalletBalance): Snapshot.
+            lamports (int): SOL balance in lamports.
+            slot (int): Slot at which the balance was read.
+
+        Returns:
+            bool: True if the snapshot was updated.
+    """
+    number_updated = await WalletBalance.objects.filter(
+        Q(slot__isnull=True) | Q(slot__lt=slot), pk=wallet_balance.pk
+    ).aupdate(lamports=lamports, slot=slot, updated=timezone.now())
+    return bool(number_updated)
+
+
+async def get_wallet_owners(wallet_address: str) -> List[AbstractUser]:
+    return [user async for user in User.objects.filter(wallets__wallet_address=wallet_address, telegram_id__isnull=False)]
+
+
+def _save_wallet_balances(balances: Dict[str, Dict]) -> Dict[str, WalletBalance]:
+    wallet_ids = dict(Wallet.objects.filter(wallet_address__in=balances).values_list('wallet_address', 'id'))
+    snapshots = [
+        WalletBalance(wallet_id=wallet_ids[address], **fields)
+        for address, fields in balances.items() if address in wallet_ids
+    ]
+    with db_transaction.atomic():
+        snapshot_ids = dict(
+            WalletBalance.objects.filter(wallet_id__in=wallet_ids.values()).values_list('wallet_id', 'id'))
+        WalletBalance.objects.bulk_create(
+            [snapshot for snapshot in snapshots if snapshot.wallet_id not in snapshot_ids], ignore_conflicts=True
+        )
+        existing = [snapshot for snapshot in snapshots if snapshot.wallet_id in snapshot_ids]
+        for snapshot in existing:
+            snapshot.pk = snapshot_ids[snapshot.wallet_id]
+
+        # баланс SOL не заменяется балансом, прочитанным в более раннем слоте (ex. обновлен по websocket)
+        by_slot: Dict[int, List[WalletBalance]] = {}
+        for snapshot in existing:
+            by_slot.setdefault(snapshot.slot, []).append(snapshot)
+        for slot, group in by_slot.items():
+            WalletBalance.objects.filter(
+                Q(slot__isnull=True) | Q(slot__lte=slot), pk__in=[snapshot.pk for snapshot in group]
+            ).update(
+                lamports=Case(*[When(pk=snapshot.pk, then=Value(snapshot.lamports)) for snapshot in group]),
+                updated=Case(*[When(pk=snapshot.pk, then=Value(snapshot.updated)) for snapshot in group]),
+                slot=slot,
+            )
+
+        # при неудачном запросе токенов сохраняется только баланс SOL, прежние балансы токенов остаются
+        with_tokens = [snapshot for snapshot in existing if snapshot.tokens_updated is not None]
+        if with_tokens:
+            WalletBalance.objects.bulk_update(with_tokens, ['tokens', 'tokens_updated'])
+    return {
+        snapshot.wallet.wallet_address: snapshot
+        for snapshot in WalletBalance.objects.filter(wallet_id__in=wallet_ids.values()).select_related('wallet')
+    }
+
+
+async def save_wallet_balances(balances: Dict[str, Dict]) -> Dict[str, WalletBalance]:
+    """
+        Creates or updates the balance snapshots of the wallets from the database in a few queries.
+
+        Args:
+            balances (Dict[str, Dict]): WalletBalance fields keyed by wallet address. Snapshots with
+                tokens_updated=None keep the stored token balances.
+
+        Returns:
+            Dict[str, WalletBalance]: Saved snapshots keyed by wallet address.
+    """
+    if not balances:
+        return {}
+    return await sync_to_async(_save_wallet_balances)(balances)
 
 
 async def delete_wallet(user: AbstractUser, wallet_address: str) -> int | None:
@@ -8,15 +8,15 @@ from aiogram.types import (BufferedInputFile, CallbackQuery, FSInputFile,
                            URLInputFile)
 from django.contrib.auth.models import AbstractUser
 from PIL import Image
-from spl.token.constants import TOKEN_2022_PROGRAM_ID
 
 from bot.config import LAMPORT_TO_SOL_RATIO
-from bot.keyboards import get_main_keyboard, get_wallet_keyboard
-from bot.services import get_sol_balance, get_spl_token_data
+from bot.keyboards import (get_balance_keyboard, get_main_keyboard,
+                           get_wallet_keyboard)
+from bot.portfolio import get_portfolios
 from bot.states import FSMWallet
 from bot.utils import get_translation, get_user
 from logger_config import logger
-from web.applications.wallet.models import Wallet
+from web.applications.wallet.models import Wallet, WalletBalance
 
 
 async def retrieve_user_wallets(callback: CallbackQuery) -> Tuple[Optional[AbstractUser], List[Wallet]]:
@@ -61,6 +61,72 @@ async def handle_no_user_or_wallets(callback: CallbackQuery) -> None:
     await callback.answer()
 
 
+async def format_wallet_balance_message(
+        number: int,
+        wallet: Wallet,
+        portfolio: WalletBalance,
+        TRANSLATION: dict,
+    ) -> str:
+    """
+        Formats the balance message of one wallet.
+
+        Args:
+            number (int): Wallet number in the list.
+            wallet (Wallet): Wallet object.
+            portfolio (WalletBalance): Balance snapshot of the wallet.
+            TRANSLATION (dict): Translation of the user language.
+
+        Returns:
+            str: Formatted wallet balance message.
+    """
+    message_text = TRANSLATION['wallet_info_template'].format(
+        number=number,
+        name=wallet.name,
+        address=wallet.wallet_address,
+        balance=portfolio.lamports / LAMPORT_TO_SOL_RATIO
+    )
+
+    if portfolio.tokens_updated is None:
+        message_text += TRANSLATION["wallet_info_tokens_unavailable"]
+    else:
+        for token in portfolio.tokens:
+            message_text += TRANSLATION["wallet_info_spl_token_template"].format(
+                name=token['name'],
+                symbol=token['symbol'],
+                amount=token['amount']
+            )
+
+    message_text += TRANSLATION["wallet_info_updated"].format(
+        updated=portfolio.updated.strftime('%Y-%m-%d %H:%M:%S'),
+        slot=portfolio.slot,
+    )
+
+    return message_text
+
+
+async def send_wallets_balance(callback: CallbackQuery, user_wallets: List[Wallet], TRANSLATION: dict) -> None:
+    """
+        Sends a balance message for every user wallet.
+
+        Balances are taken from the portfolio snapshots refreshed in the background (bot/portfolio.py),
+        only wallets without a snapshot are requested from the blockchain.
+
+        Args:
+            callback (CallbackQuery): CallbackQuery object containing information about the call.
+            user_wallets (List[Wallet]): The list of user wallets.
+            TRANSLATION (dict): Translation of the user language.
+
+        Returns:
+            None
+    """
+    portfolios = await get_portfolios([wallet.wallet_address for wallet in user_wallets])
+
+    for number, wallet in enumerate(user_wallets, start=1):
+        await callback.message.answer(
+            await format_wallet_balance_message(number, wallet, portfolios[wallet.wallet_address], TRANSLATION)
+        )
+
+
 async def process_wallets_command(callback: CallbackQuery, state: FSMContext, action: str) -> None:
     """
         Handles the command related to wallets.
@@ -82,58 +148,11 @@ async def process_wallets_command(callback: CallbackQuery, state: FSMContext, ac
 
         if user and user_wallets:
             if action == "balance":
-
-                for i, wallet in enumerate(user_wallets, start=1):
-                    balance = await get_sol_balance(wallet.wallet_address)
-
-                    message_text = TRANSLATION['wallet_info_template'].format(
-                        number=i,
-                        name=wallet.name,
-                        address=wallet.wallet_address,
-                        balance=balance
-                    )
-
-                    spl_tokens_data = await get_spl_token_data(wallet.wallet_address, program_id=TOKEN_2022_PROGRAM_ID)
-
-                    if spl_tokens_data:
-                        for token in spl_tokens_data:
-                            """ Example data:
-                            {'is_native': False, 'state': 'initialized', 'amount': {'amount': '26000000000', 'decimals': 9, 'uiAmount': 26.0, 'uiAmountString': '26'}, 'mint': 'EXw3CfR3am8VqUncm4jyEAMr3EkLSRypDytQUj6wdn5H', 'metadata': {'name': 'MyTestToken1', 'symbol': 'MTT1', 'uri': 'https://raw.githubusercontent.com/o5b/telegram-crypto-wallet-presentation/master/docs/my_test_token_1.json', 'raw': {'name': 'MyTestToken1', 'symbol': 'MTT1', 'description': 'My Test Token 1', 'image': 'https://raw.githubusercontent.com/o5b/telegram-crypto-wallet-presentation/master/docs/imeges/MyTestToken1.png', 'attributes': [{'trait_type': 'Item', 'value': 'Developer Portal'}]}, 'description': 'My Test Token 1', 'image': 'https://raw.githubusercontent.com/o5b/telegram-crypto-wallet-presentation/master/docs/imeges/MyTestToken1.png'}}
-                            """
-                            name, symbol, amount = '', '', ''
-                            if token:
-                                if 'metadata' in token:
-                                    if 'name' in token['metadata']:
-                                        name = token['metadata']['name']
-                                    if 'symbol' in token['metadata']:
-                                        symbol = token['metadata']['symbol']
-                                    # if 'logo' in token['metadata'] and token['metadata']['logo']:
-                                    #     logo = token['metadata']['logo']
-                                        # with Image.open(token['metadata']['logo']) as img:
-                                        #     logo = img.load()
-                                         # Отправка файла из файловой системы
-                                        # image_from_pc = FSInputFile("image_from_pc.jpg")
-                                        # result = await message.answer_photo(
-                                        #     image_from_pc,
-                                        #     caption="Изображение из файла на компьютере"
-                                        # )
-                                        # file_ids.append(result.photo[-1].file_id)
-
-                                if 'amount' in token:
-                                    if 'uiAmount' in token['amount']:
-                                        amount = token['amount']['uiAmount']
-
-                                message_text += TRANSLATION["wallet_info_spl_token_template"].format(
-                                    name=name,
-                                    # logo=logo,
-                                    symbol=symbol,
-                                    amount=amount
-                                )
-
-                    # await callback.message.answer(message_text, parse_mode=ParseMode.HTML)
-                    await callback.message.answer(message_text)
-
-                await callback.message.answer(text=TRANSLATION["back_to_main_menu"], reply_markup=callback.message.reply_markup)
+                await send_wallets_balance(callback, user_wallets, TRANSLATION)
+                await callback.message.answer(
+                    text=TRANSLATION["back_to_main_menu"],
+                    reply_markup=await get_balance_keyboard(lang=callback.from_user.language_code)
+                )
             else:
                 # отображаем клавиатуру с выбором кошелька
                 wallet_keyboard = await get_wallet_keyboard(user_wallets, lang=user.telegram_language)
@@ -155,46 +174,6 @@ async def process_wallets_command(callback: CallbackQuery, state: FSMContext, ac
         logger.error(f"Error in process_{action}_command: {error}\n{detailed_error_traceback}")
 
 
-async def format_transaction_message(transaction: Dict) -> str:
-    """
-       Formats the transaction message.
-
-       Args:
-           transaction (dict): Transaction data.
-
-       Returns:
-           str: Formatted transaction message.
-    """
-    amount_in_sol = (transaction.transaction.meta.pre_balances[0] -
-                     transaction.transaction.meta.post_balances[0]) / LAMPORT_TO_SOL_RATIO
-
-    # Форматирование суммы в SOL с десятичными знаками
-    formatted_amount = '{:.6f}'.format(Decimal(str(amount_in_sol)))
-
-    TRANSLATION = await get_translation(lang='en')
-
-    transaction_message = TRANSLATION["transaction_info"].format(
-        transaction_id='{}...{}'.format(
-            str(transaction.transaction.transaction.signatures[0])[:4],
-            str(transaction.transaction.transaction.signatures[0])[-4:]
-        ),
-
-        sender='{}...{}'.format(
-            str(transaction.transaction.transaction.message.account_keys[0])[:4],
-            str(transaction.transaction.transaction.message.account_keys[0])[-4:]
-        ),
-
-        recipient='{}...{}'.format(
-            str(transaction.transaction.transaction.message.account_keys[1])[:4],
-            str(transaction.transaction.transaction.message.account_keys[1])[-4:]
-        ),
-
-        amount_in_sol=formatted_amount
-    )
-
-    return transaction_message
-
-
 async def format_transaction_from_db_message(transaction: Dict) -> str:
     """
        Formats the transaction message.
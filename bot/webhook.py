@@ -0,0 +1,185 @@
+"""
+    Webhook mode of the bot (BOT_MODE=webhook).
+
+    Telegram sends updates to an aiohttp server, the request is acknowledged as soon as the update is queued.
+    WEBHOOK_WORKERS workers process the queued updates concurrently. When the queue is full the server
+    answers 503 and Telegram redelivers the update later. On shutdown the server stops accepting updates
+    and waits up to WEBHOOK_DRAIN_TIMEOUT seconds for the queued updates before stopping the services.
+    Several bot replicas can serve the same webhook behind a load balancer
+    (with FSM_STORAGE=redis or django so that they share the FSM state).
+"""
+import asyncio
+import hmac
+import signal
+import traceback
+from typing import List
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiogram.webhook.aiohttp_server import setup_application
+from aiohttp import web
+
+from bot.config import (WEBHOOK_BASE_URL, WEBHOOK_DRAIN_TIMEOUT, WEBHOOK_HOST,
+                        WEBHOOK_MAX_CONNECTIONS, WEBHOOK_PATH, WEBHOOK_PORT,
+                        WEBHOOK_QUEUE_SIZE, WEBHOOK_SECRET, WEBHOOK_WORKERS)
+from logger_config import logger
+
+# Заголовок с секретным токеном, который Telegram передает в каждом запросе
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookHandler:
+    """
+        Receives updates from Telegram and processes them with a bounded pool of workers.
+
+        Attributes:
+            dispatcher (Dispatcher): The dispatcher that processes the updates.
+            bot (Bot): The bot the updates are addressed to.
+            secret_token (str): Expected value of the secret token header.
+            workers (int): Number of updates processed concurrently.
+    """
+
+    def __init__(
+            self,
+            dispatcher: Dispatcher,
+            bot: Bot,
+            secret_token: str = WEBHOOK_SECRET,
+            workers: int = WEBHOOK_WORKERS,
+            queue_size: int = WEBHOOK_QUEUE_SIZE,
+        ) -> None:
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.secret_token = secret_token
+        self.workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks: List[asyncio.Task] = []
+        self._accepting = False
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        # compare_digest: время сравнения не зависит от совпадающей части токена
+        secret_token = request.headers.get(SECRET_TOKEN_HEADER, '')
+        if not self.secret_token or not hmac.compare_digest(secret_token, self.secret_token):
+            return web.Response(status=401)
+        if not self._accepting:
+            return web.Response(status=503)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as error:
+            logger.warning(f"Invalid webhook update: {error!r}")
+            return web.Response(status=400)
+
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram повторит доставку позже
+            logger.warning(f"Webhook queue is full ({self._queue.maxsize}), update {update.update_id} rejected")
+            return web.Response(status=503)
+        return web.Response()
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.dispatcher.feed_update(self.bot, update)
+            except Exception as error:
+                detailed_error_traceback = traceback.format_exc()
+                logger.error(f"Failed to process update {update.update_id}: {error}\n{detailed_error_traceback}")
+            finally:
+                self._queue.task_done()
+
+    async def start(self, *args) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._accepting = True
+
+    async def drain(self, *args) -> None:
+        """
+            Stops accepting updates and waits until the queued updates are processed.
+
+            Returns:
+                None
+        """
+        self._accepting = False
+        logger.info(f"Webhook drain: {self._queue.qsize()} queued updates")
+        try:
+            await asyncio.wait_for(self._queue.join(), WEBHOOK_DRAIN_TIMEOUT)
+        except TimeoutError:
+            logger.warning(f"Webhook drain timeout, {self._queue.qsize()} updates were not processed")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    return web.Response(text='ok')
+
+
+def create_webhook_app(dispatcher: Dispatcher, bot: Bot) -> web.Application:
+    """
+        Creates the aiohttp application with the webhook and health check endpoints.
+
+        Args:
+            dispatcher (Dispatcher): The dispatcher.
+            bot (Bot): The bot.
+
+        Returns:
+            web.Application: The application.
+    """
+    handler = WebhookHandler(dispatcher, bot)
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handler.handle)
+    app.router.add_get('/healthz', handle_health)
+    # Порядок важен: при остановке сначала обрабатываются принятые обновления, потом останавливаются сервисы
+    app.on_startup.append(handler.start)
+    app.on_shutdown.append(handler.drain)
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot) -> None:
+    """
+        Registers the webhook in Telegram and serves it until SIGINT or SIGTERM.
+
+        Args:
+            dispatcher (Dispatcher): The dispatcher.
+            bot (Bot): The bot.
+
+        Raises:
+            ValueError: If WEBHOOK_BASE_URL or WEBHOOK_SECRET is not set.
+
+        Returns:
+            None
+    """
+    if not WEBHOOK_BASE_URL or not WEBHOOK_SECRET:
+        raise ValueError("BOT_MODE=webhook requires WEBHOOK_BASE_URL and WEBHOOK_SECRET")
+
+    runner = web.AppRunner(create_webhook_app(dispatcher, bot))
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+
+    # Все реплики регистрируют один и тот же адрес, повторная регистрация ничего не меняет
+    await bot.set_webhook(
+        url=f"{WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+    )
+    logger.info(f"Webhook server started on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop_event.set)
+    try:
+        await stop_event.wait()
+    finally:
+        logger.info("Webhook server is stopping...")
+        # вебхук не удаляется: другие реплики продолжают принимать обновления
+        await runner.cleanup()
+        await bot.session.close()
@@ -14,11 +14,25 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'web.settings.settings')
 django.setup()
 ####################
 
+from bot.account_subscriptions import close_account_subscriptions, start_account_subscriptions
+from bot.blockhash_service import close_blockhash_service, start_blockhash_service
+from bot.config import BOT_MODE
+from bot.confirmation import close_confirmation_manager, start_confirmation_manager
+from bot.fsm_storage import (close_fsm_storage, create_fsm_events_isolation,
+                             create_fsm_storage, start_fsm_storage)
 from bot.handlers import (back_button_handler, connect_wallet_handlers,
                           create_wallet_from_seed_handlers,
                           create_wallet_handlers, delete_wallet_handlers,
                           other_handlers, transaction_handlers,
                           transfer_handlers, user_handlers)
+from bot.key_derivation import close_key_derivation, start_key_derivation
+from bot.metadata_fetcher import close_metadata_fetcher, start_metadata_fetcher
+from bot.middlewares import close_update_scheduler, start_update_scheduler, update_scheduler
+from bot.network_params import close_network_params, start_network_params
+from bot.portfolio import close_portfolio_refresher, start_portfolio_refresher
+from bot.rpc_client import close_rpc_clients, start_rpc_clients
+from bot.transfer_tracker import close_transfer_tracker
+from bot.webhook import run_webhook
 from logger_config import logger
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -30,7 +44,7 @@ async def main() -> None:
         Function to configure and run the bot.
 
         Initializes the bot and dispatcher, registers routers, skips accumulated updates,
-        and starts polling.
+        and starts polling or the webhook server depending on BOT_MODE.
 
         Returns:
             None
@@ -38,9 +52,14 @@ async def main() -> None:
     logger.info("Initializing bot...")
     # Инициализируем бот и диспетчер
     bot: Bot = Bot(token=os.getenv('BOT_TOKEN', ''), default=DefaultBotProperties(parse_mode='HTML'))
-    dp: Dispatcher = Dispatcher()
+    # Хранилище состояний FSM выбирается в FSM_STORAGE, redis и django позволяют запускать несколько процессов бота
+    storage = create_fsm_storage()
+    dp: Dispatcher = Dispatcher(storage=storage, events_isolation=create_fsm_events_isolation(storage))
     logger.info("Bot initialized successfully.")
 
+    # после UserContextMiddleware диспетчера: нужны event_chat и event_from_user
+    dp.update.outer_middleware(update_scheduler)
+
     dp.include_router(user_handlers.user_router)
     dp.include_router(create_wallet_handlers.create_wallet_router)
     dp.include_router(create_wallet_from_seed_handlers.create_wallet_from_seed_router)
@@ -51,9 +70,42 @@ async def main() -> None:
     dp.include_router(back_button_handler.back_button_router)
     dp.include_router(delete_wallet_handlers.delete_wallet_router)
 
-    # Пропускаем накопившиеся апдейты и запускаем polling
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    dp.startup.register(start_update_scheduler)
+    dp.startup.register(start_fsm_storage)
+    # Общий RPC клиент с пулом соединений живет столько же, сколько диспетчер
+    dp.startup.register(start_rpc_clients)
+    dp.startup.register(start_metadata_fetcher)
+    dp.startup.register(start_key_derivation)
+    dp.startup.register(start_network_params)
+    dp.startup.register(start_blockhash_service)
+    dp.startup.register(start_confirmation_manager)
+    # Балансы кошельков обновляются в фоне, меню строятся из снимков
+    dp.startup.register(start_portfolio_refresher)
+    # Изменения балансов кошельков приходят по websocket подпискам
+    dp.startup.register(start_account_subscriptions)
+
+    # Обработчики остановки выполняются в порядке регистрации: сначала останавливаются те, кто делает
+    # RPC запросы, RPC клиенты закрываются последними, иначе get_rpc_client создаст новые незакрытые клиенты
+    dp.shutdown.register(close_update_scheduler)
+    # Переводы отправляются и отслеживаются в фоне, при остановке отслеживание прерывается
+    dp.shutdown.register(close_transfer_tracker)
+    dp.shutdown.register(close_account_subscriptions)
+    dp.shutdown.register(close_portfolio_refresher)
+    dp.shutdown.register(close_confirmation_manager)
+    dp.shutdown.register(close_blockhash_service)
+    dp.shutdown.register(close_network_params)
+    dp.shutdown.register(close_key_derivation)
+    dp.shutdown.register(close_metadata_fetcher)
+    dp.shutdown.register(close_fsm_storage)
+    dp.shutdown.register(close_rpc_clients)
+
+    if BOT_MODE == 'webhook':
+        # Обновления приходят от Telegram на сервер вебхука
+        await run_webhook(dp, bot)
+    else:
+        # Пропускаем накопившиеся апдейты и запускаем polling
+        await bot.delete_webhook(drop_pending_updates=True)
+        await dp.start_polling(bot)
 
 
 if __name__ == '__main__':
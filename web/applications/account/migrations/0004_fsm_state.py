@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-17 15:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0003_remove_user_last_bsc_derivation_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FSMState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='Storage key')),
+                ('state', models.CharField(blank=True, max_length=255, null=True, verbose_name='State')),
+                ('data', models.JSONField(blank=True, default=dict, verbose_name='Data')),
+                ('expires', models.DateTimeField(db_index=True, verbose_name='Expires')),
+            ],
+            options={
+                'verbose_name': 'FSM state',
+                'verbose_name_plural': 'FSM states',
+            },
+        ),
+    ]
@@ -58,3 +58,39 @@ class User(AbstractUser):
 
     def __str__(self):
         return f"{self.username}"
+
+
+class FSMState(models.Model):
+    '''
+    Telegram bot FSM state and data, shared by all bot processes (bot/fsm_storage.py)
+    '''
+    key = models.CharField(
+        verbose_name='Storage key',
+        max_length=255,
+        unique=True,
+    )
+
+    state = models.CharField(
+        verbose_name='State',
+        max_length=255,
+        null=True,
+        blank=True,
+    )
+
+    data = models.JSONField(
+        verbose_name='Data',
+        default=dict,
+        blank=True,
+    )
+
+    expires = models.DateTimeField(
+        verbose_name='Expires',
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'FSM state'
+        verbose_name_plural = 'FSM states'
+
+    def __str__(self):
+        return f"{self.key}: {self.state}"
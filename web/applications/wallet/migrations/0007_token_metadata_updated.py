@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-17 15:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0006_remove_hdwallet_blockchain_remove_wallet_blockchain'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='token',
+            name='metadata_updated',
+            field=models.DateTimeField(blank=True, help_text='When the metadata was last fetched from the blockchain. Empty - metadata was never fetched', null=True, verbose_name='Metadata updated'),
+        ),
+    ]
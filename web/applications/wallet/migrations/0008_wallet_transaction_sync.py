@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-17 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0007_token_metadata_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='backfill_transaction_id',
+            field=models.CharField(blank=True, help_text='Oldest synced transaction. History backfill fetches transactions older than it', max_length=200, verbose_name='Backfill transaction id'),
+        ),
+        migrations.AddField(
+            model_name='wallet',
+            name='is_history_backfilled',
+            field=models.BooleanField(default=False, help_text='The whole transaction history of the wallet is stored in the database', verbose_name='History backfilled'),
+        ),
+        migrations.AddField(
+            model_name='wallet',
+            name='last_transaction_id',
+            field=models.CharField(blank=True, help_text='Newest transaction stored in the database. Transaction sync fetches only newer transactions', max_length=200, verbose_name='Last synced transaction id'),
+        ),
+        migrations.AddField(
+            model_name='wallet',
+            name='last_transaction_slot',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Last synced transaction slot'),
+        ),
+    ]
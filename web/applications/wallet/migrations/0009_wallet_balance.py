@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-17 16:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0008_wallet_transaction_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lamports', models.PositiveBigIntegerField(default=0, verbose_name='SOL balance in lamports')),
+                ('tokens', models.JSONField(blank=True, default=list, help_text='Ex.: [{"mint": "...", "name": "MyTestToken1", "symbol": "MTT1", "amount": 26.0, "decimals": 9}]', verbose_name='Token balances')),
+                ('tokens_updated', models.DateTimeField(blank=True, help_text='Empty - token balances were never fetched', null=True, verbose_name='Token balances updated')),
+                ('slot', models.PositiveBigIntegerField(blank=True, help_text='Slot at which the SOL balance was read', null=True, verbose_name='Slot')),
+                ('updated', models.DateTimeField(db_index=True, verbose_name='Updated')),
+                ('wallet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='balance', to='wallet.wallet', verbose_name='Wallet')),
+            ],
+            options={
+                'verbose_name': 'wallet balance',
+                'verbose_name_plural': 'wallet balances',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-17 16:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0009_wallet_balance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wallet',
+            name='gap_transaction_id',
+            field=models.CharField(blank=True, help_text='Oldest transaction synced after a gap. Gap fill fetches transactions older than it', max_length=200, verbose_name='Gap transaction id'),
+        ),
+        migrations.AddField(
+            model_name='wallet',
+            name='gap_until_transaction_id',
+            field=models.CharField(blank=True, help_text='Newest transaction synced before the gap. Gap fill stops at it', max_length=200, verbose_name='Gap until transaction id'),
+        ),
+    ]
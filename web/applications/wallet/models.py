@@ -86,6 +86,46 @@ class Wallet(Common):
         blank=True,
     )
 
+    last_transaction_id = models.CharField(
+        verbose_name='Last synced transaction id',
+        help_text='Newest transaction stored in the database. Transaction sync fetches only newer transactions',
+        max_length=200,
+        blank=True,
+    )
+
+    last_transaction_slot = models.PositiveBigIntegerField(
+        verbose_name='Last synced transaction slot',
+        blank=True,
+        null=True,
+    )
+
+    backfill_transaction_id = models.CharField(
+        verbose_name='Backfill transaction id',
+        help_text='Oldest synced transaction. History backfill fetches transactions older than it',
+        max_length=200,
+        blank=True,
+    )
+
+    gap_transaction_id = models.CharField(
+        verbose_name='Gap transaction id',
+        help_text='Oldest transaction synced after a gap. Gap fill fetches transactions older than it',
+        max_length=200,
+        blank=True,
+    )
+
+    gap_until_transaction_id = models.CharField(
+        verbose_name='Gap until transaction id',
+        help_text='Newest transaction synced before the gap. Gap fill stops at it',
+        max_length=200,
+        blank=True,
+    )
+
+    is_history_backfilled = models.BooleanField(
+        verbose_name='History backfilled',
+        help_text='The whole transaction history of the wallet is stored in the database',
+        default=False,
+    )
+
     class Meta:
         ordering = ['created']
         verbose_name = 'wallet'
@@ -246,6 +286,13 @@ class Token(Common):
         blank=True,
     )
 
+    metadata_updated = models.DateTimeField(
+        verbose_name='Metadata updated',
+        help_text='When the metadata was last fetched from the blockchain. Empty - metadata was never fetched',
+        blank=True,
+        null=True,
+    )
+
     mint_authority = models.CharField(
         verbose_name='Mint authority',
         max_length=100,
@@ -264,3 +311,53 @@ class Token(Common):
 
     def __str__(self):
         return f'token: {self.mint_account}, symbol: {self.symbol}'
+
+
+class WalletBalance(models.Model):
+    """
+    Portfolio snapshot: SOL and token balances of the wallet, refreshed by the bot in the background (bot/portfolio.py)
+    """
+    wallet = models.OneToOneField(
+        verbose_name='Wallet',
+        to=Wallet,
+        on_delete=models.CASCADE,
+        related_name='balance',
+    )
+
+    lamports = models.PositiveBigIntegerField(
+        verbose_name='SOL balance in lamports',
+        default=0,
+    )
+
+    tokens = models.JSONField(
+        verbose_name='Token balances',
+        help_text='Ex.: [{"mint": "...", "name": "MyTestToken1", "symbol": "MTT1", "amount": 26.0, "decimals": 9}]',
+        default=list,
+        blank=True,
+    )
+
+    tokens_updated = models.DateTimeField(
+        verbose_name='Token balances updated',
+        help_text='Empty - token balances were never fetched',
+        blank=True,
+        null=True,
+    )
+
+    slot = models.PositiveBigIntegerField(
+        verbose_name='Slot',
+        help_text='Slot at which the SOL balance was read',
+        blank=True,
+        null=True,
+    )
+
+    updated = models.DateTimeField(
+        verbose_name='Updated',
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'wallet balance'
+        verbose_name_plural = 'wallet balances'
+
+    def __str__(self):
+        return f'{self.wallet}: {self.lamports} lamports, slot: {self.slot}'